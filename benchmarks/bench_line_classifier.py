@@ -0,0 +1,173 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+# A micro-benchmark of filtering and parsing the lines of a source file passed with --source,
+# comparing the precompiled LineClassifier with the line-by-line approach it replaced (a Python
+# loop over the configured prefixes, then splitting on single spaces and filtering out empty
+# strings). The manifest is an aggregate of 'pip list --outdated' output from many environments,
+# so it mixes both supported formats with header and warning lines.
+#
+# Run from the repository root:
+#     python benchmarks/bench_line_classifier.py [--lines N] [--output FILE]
+
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+from argparse import Namespace
+from typing import Any, Optional
+
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pipupdater.models import LineClassifier  # noqa: E402
+
+
+# the prefixes in the default config file
+PREFIXES: list[str] = ["DEPRECATION: ", "ERROR: ", "WARNING: ", "Package ", "-------"]
+
+
+def make_manifest(count: int, seed: int = 0) -> list[str]:
+    """
+    Generates an aggregated manifest of outdated packages.
+
+    :param count: the number of lines to generate
+    :param seed: optional, default 0; the seed for the random choice of lines
+    :returns: the lines
+    """
+    rng: random.Random = random.Random(seed)
+    lines: list[str] = []
+    for i in range(count):
+        kind: float = rng.random()
+        if kind < 0.05:
+            lines.append("Package            Version Latest Type")
+        elif kind < 0.10:
+            lines.append("------------------ ------- ------ -----")
+        elif kind < 0.15:
+            lines.append("WARNING: There was an error checking the latest version of pip.")
+        elif kind < 0.17:
+            lines.append("")
+        elif kind < 0.60:
+            lines.append(f"package-{i:06d}       1.{i % 10}.0   2.0.{i % 7} wheel")
+        else:
+            lines.append(f"package-{i:06d} (Current: 1.{i % 10}.0 Latest: 2.0.{i % 7} [wheel])")
+    return lines
+
+
+def parse_before(lines: list[str]) -> list[tuple[str, str, str]]:
+    """
+    Filters and parses lines the way pipupdater did before the LineClassifier.
+
+    :param lines: the lines
+    :returns: the name, current version and latest version from each parsed line
+    """
+    parsed: list[tuple[str, str, str]] = []
+    for line in lines:
+        skipped: bool = False
+        for prefix in PREFIXES:
+            if line.startswith(prefix):
+                skipped = True
+                break
+        if skipped or len(line) == 0:
+            continue
+
+        line_parts: list[str] = list(filter(lambda x: x != '', line.split(" ")))
+        try:
+            if line_parts[1] == "(Current:":
+                parsed.append((line_parts[0], line_parts[2], line_parts[4].removesuffix(")")))
+            else:
+                parsed.append((line_parts[0], line_parts[1], line_parts[2]))
+        except IndexError:
+            continue
+    return parsed
+
+
+def parse_after(lines: list[str], classifier: LineClassifier) -> list[tuple[str, str, str]]:
+    """
+    Filters and parses lines with a LineClassifier.
+
+    :param lines: the lines
+    :param classifier: the classifier, built from the configured prefixes
+    :returns: the name, current version and latest version from each parsed line
+    """
+    parsed: list[tuple[str, str, str]] = []
+    for line in lines:
+        if classifier.is_skipped(line):
+            continue
+        details: Optional[tuple[str, str, str]] = classifier.parse(line)
+        if details is not None:
+            parsed.append(details)
+    return parsed
+
+
+def bench_line_classifier(count: int = 100_000, repeat: int = 5) -> dict[str, Any]:
+    """
+    Times filtering and parsing an aggregated manifest before and after the LineClassifier.
+
+    :param count: optional, default 100,000; the number of lines in the manifest
+    :param repeat: optional, default 5; the number of times to time each approach
+    :returns: the best time of each approach, and the speedup
+    """
+    lines: list[str] = make_manifest(count)
+    classifier: LineClassifier = LineClassifier(PREFIXES)
+
+    if parse_before(lines) != parse_after(lines, classifier):
+        raise AssertionError("the classifier parsed the manifest differently")
+
+    before: float = min(timeit.repeat(lambda: parse_before(lines), number=1, repeat=repeat))
+    after: float = min(timeit.repeat(
+        lambda: parse_after(lines, classifier), number=1, repeat=repeat
+    ))
+    return {
+        "lines": count,
+        "before_seconds": before,
+        "after_seconds": after,
+        "before_lines_per_second": count / before,
+        "after_lines_per_second": count / after,
+        "speedup": before / after,
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark, then prints and optionally saves the results.
+    """
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="Benchmarks filtering and parsing source file lines."
+    )
+    parser.add_argument("--lines", action="store", type=int, default=100_000,
+                        help="the number of lines in the manifest")
+    parser.add_argument("--output", action="store", default=None,
+                        help="where to save the results as JSON")
+    args: Namespace = parser.parse_args()
+
+    results: dict[str, Any] = bench_line_classifier(args.lines)
+    print(f"{results['lines']} lines: {results['before_seconds'] * 1000:.1f} ms before,"
+          + f" {results['after_seconds'] * 1000:.1f} ms after ({results['speedup']:.2f}x)")
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+# A stand-in for pip that emits canned output, used by the benchmarks so that pipupdater's own
+# overhead can be measured without touching the network or the environment. It is installed into
+# a temporary folder on PATH under the name "pip" by run_benchmarks.py.
+#
+# Behaviour is controlled with environment variables:
+# - FAKE_PIP_PACKAGES: the number of outdated packages reported (default 50)
+# - FAKE_PIP_LATENCY: the number of seconds each install or wheel command takes (default 0.05)
+
+
+import json
+import os
+import sys
+import time
+
+
+def get_packages() -> list[tuple[str, str, str]]:
+    """
+    Generates the canned list of outdated packages.
+
+    :returns: the name, current version and latest version of each package
+    """
+    count: int = int(os.environ.get("FAKE_PIP_PACKAGES", "50"))
+    return [(f"package-{i:04d}", "1.0.0", "1.1.0") for i in range(count)]
+
+
+def get_requested(args: list[str]) -> list[str]:
+    """
+    Gets the names of the packages requested in a pip command, dropping any version specifiers.
+
+    :param args: the arguments of the pip command
+    :returns: the package names
+    """
+    names: list[str] = []
+    skip_next: bool = False
+    for arg in args[1:]:
+        if skip_next:
+            skip_next = False
+        elif arg in ("--find-links", "--wheel-dir", "--report"):
+            skip_next = True
+        elif not arg.startswith("-"):
+            names.append(arg.split("==")[0])
+    return names
+
+
+def main(args: list[str]) -> int:
+    """
+    Responds to a pip command with canned output.
+
+    :param args: the arguments of the pip command
+    :returns: the exit code
+    """
+    if args[:2] == ["-m", "pip"]:
+        args = args[2:]
+    latency: float = float(os.environ.get("FAKE_PIP_LATENCY", "0.05"))
+
+    if args[:2] == ["list", "--outdated"]:
+        packages: list[tuple[str, str, str]] = get_packages()
+        if "json" in args:
+            print(json.dumps([
+                {"name": name, "version": current, "latest_version": latest,
+                 "latest_filetype": "wheel"}
+                for name, current, latest in packages
+            ]))
+        else:
+            print("Package Version Latest Type\n------- ------- ------ -----")
+            for name, current, latest in packages:
+                print(f"{name} {current} {latest} wheel")
+        return 0
+
+    if args[:1] == ["install"] and "--dry-run" in args:
+        print(json.dumps({"install": [
+            {"metadata": {"name": name, "version": "1.1.0"}} for name in get_requested(args)
+        ]}))
+        return 0
+
+    if args[:1] in (["install"], ["wheel"]):
+        time.sleep(latency)
+        names: list[str] = get_requested(args)
+        for name in names:
+            print(f"Collecting {name}\n  Using cached {name}-1.1.0-py3-none-any.whl")
+        if args[0] == "install":
+            for name in names:
+                print(f"Found existing installation: {name} 1.0.0")
+            print("Successfully installed " + " ".join(f"{name}-1.1.0" for name in names))
+        return 0
+
+    print(f"ERROR: unknown command: {' '.join(args)}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,394 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+# Benchmarks for pipupdater's startup cost and update throughput. Every measurement runs in a fresh
+# interpreter with its config folder in a temporary directory, so the user's own config and
+# environment are never touched. The results are printed and saved as JSON; pass --compare with
+# the results of an earlier run (e.g. the previous release) to see what changed.
+#
+# Run from the repository root:
+#     python benchmarks/run_benchmarks.py [--output FILE] [--compare FILE]
+
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import Namespace
+from subprocess import CompletedProcess
+from typing import Any, Optional
+
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs pipupdater's entry point with the arguments given on the command line
+RUN_ENTRY_POINT: str = (
+    "import sys; sys.argv = ['pipupdater'] + sys.argv[1:];"
+    + " from pipupdater.cmd import entry_point; entry_point()"
+)
+
+# loads the config and prints how long importing and loading took, in seconds
+LOAD_CONFIG: str = """
+import json, sys, time
+start = time.perf_counter()
+from pipupdater.cfg import get_config
+from pipupdater.models import Logger
+imported = time.perf_counter()
+logger = Logger("pipupdater")
+logger_created = time.perf_counter()
+get_config(logger)
+loaded = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "logger": logger_created - imported,
+    "config": loaded - logger_created,
+    "tomlkit_imported": "tomlkit" in sys.modules,
+}))
+"""
+
+
+def get_args() -> Namespace:
+    """
+    Parses the benchmark options from the command line.
+
+    :returns: the Namespace produced by parsing arguments
+    """
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="Benchmarks pipupdater's startup time and update throughput."
+    )
+    parser.add_argument("--compare", action="store", default=None,
+                        help="the results file of an earlier run to compare against")
+    parser.add_argument("--latency", action="store", type=float, default=0.05,
+                        help="how long each fake pip install takes, in seconds")
+    parser.add_argument("--output", action="store", default=None,
+                        help="where to save the results; defaults to"
+                        + " benchmarks/results/<version>-<time>.json")
+    parser.add_argument("--packages", action="store", type=int, default=50,
+                        help="the number of outdated packages the fake pip reports")
+    parser.add_argument("--repeat", action="store", type=int, default=10,
+                        help="the number of times to repeat each startup measurement")
+    return parser.parse_args()
+
+
+def make_env(home: str, bin_folder: Optional[str] = None, **extra: str) -> dict[str, str]:
+    """
+    Builds the environment variables for a benchmark subprocess, pointing its config folder (and
+    home folder) at a temporary directory.
+
+    :param home: the temporary directory
+    :param bin_folder: optional; a folder to put at the front of PATH
+    :param extra: any other environment variables to set
+    :returns: the environment variables
+    """
+    env: dict[str, str] = {
+        **os.environ,
+        "HOME": home,
+        "XDG_CONFIG_HOME": f"{home}/.config",
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+        **extra,
+    }
+    if bin_folder is not None:
+        env["PATH"] = f"{bin_folder}{os.pathsep}{env.get('PATH', '')}"
+    return env
+
+
+def run(args: list[str], env: dict[str, str]) -> tuple[float, CompletedProcess]:
+    """
+    Runs a command and times it.
+
+    :param args: the command
+    :param env: the environment variables to run it with
+    :returns: the wall-clock time taken, in seconds, and the completed process
+    """
+    start: float = time.perf_counter()
+    process: CompletedProcess = subprocess.run(
+        args, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=ROOT
+    )
+    elapsed: float = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"benchmark command failed: {args}\n{process.stderr}")
+    return elapsed, process
+
+
+def summarise(samples: list[float]) -> dict[str, float]:
+    """
+    Summarises a list of timing samples.
+
+    :param samples: the samples, in seconds
+    :returns: the minimum, median, mean and standard deviation of the samples
+    """
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+def bench_cold_start(home: str, repeat: int) -> dict[str, Any]:
+    """
+    Measures the time taken to start a fresh interpreter, and to start it and run
+    'pipupdater --version' (which imports everything the entry point needs, then exits).
+
+    :param home: the temporary directory to use as the home folder
+    :param repeat: the number of samples to take
+    :returns: the summarised timings
+    """
+    env: dict[str, str] = make_env(home)
+    interpreter: list[float] = []
+    version: list[float] = []
+    for _ in range(repeat):
+        interpreter.append(run([sys.executable, "-c", "pass"], env)[0])
+        version.append(run([sys.executable, "-c", RUN_ENTRY_POINT, "--version"], env)[0])
+    return {
+        "interpreter": summarise(interpreter),
+        "version": summarise(version),
+        "overhead_median": statistics.median(version) - statistics.median(interpreter),
+    }
+
+
+def bench_config_load(home: str, repeat: int) -> dict[str, Any]:
+    """
+    Measures the time taken to load the config, in three situations:
+    - "first_run": there is no config folder yet, so it is created from the default config;
+    - "unchanged": nothing has changed since the last run;
+    - "changed": the user's config file has been edited since the last run.
+
+    :param home: the temporary directory to use as the home folder
+    :param repeat: the number of samples to take
+    :returns: the summarised timings of each stage of loading, for each situation
+    """
+    samples: dict[str, dict[str, list[float]]] = {}
+    tomlkit_imported: dict[str, bool] = {}
+
+    for i in range(repeat):
+        sample_home: str = f"{home}/config-{i}"
+        env: dict[str, str] = make_env(sample_home)
+        config_path: str = f"{sample_home}/.config/pipupdater/config.toml"
+
+        for situation in ("first_run", "unchanged", "changed"):
+            if situation == "changed":
+                with open(config_path, "a") as config_file:
+                    config_file.write("\n# edited\n")
+            result: dict[str, Any] = json.loads(
+                run([sys.executable, "-c", LOAD_CONFIG], env)[1].stdout.splitlines()[-1]
+            )
+            tomlkit_imported[situation] = result.pop("tomlkit_imported")
+            for stage, elapsed in result.items():
+                samples.setdefault(situation, {}).setdefault(stage, []).append(elapsed)
+
+    return {
+        situation: {
+            **{stage: summarise(values) for stage, values in stages.items()},
+            "tomlkit_imported": tomlkit_imported[situation],
+        }
+        for situation, stages in samples.items()
+    }
+
+
+def bench_import_time(home: str) -> dict[str, Any]:
+    """
+    Breaks down the time taken to import pipupdater's entry point using '-X importtime'.
+
+    :param home: the temporary directory to use as the home folder
+    :returns: the total import time, and the modules that took longest to import themselves
+    """
+    process: CompletedProcess = run(
+        [sys.executable, "-X", "importtime", "-c", "import pipupdater.cmd"], make_env(home)
+    )[1]
+
+    modules: list[dict[str, Any]] = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+
+    top_level: dict[str, Any] = next(
+        (module for module in modules if module["module"] == "pipupdater"), {}
+    )
+    return {
+        "total_us": top_level.get("cumulative_us"),
+        "module_count": len(modules),
+        "slowest": sorted(modules, key=lambda module: module["self_us"], reverse=True)[:20],
+        "pipupdater": [
+            module for module in modules if module["module"].startswith("pipupdater")
+        ],
+    }
+
+
+def bench_update_throughput(home: str, packages: int, latency: float) -> dict[str, Any]:
+    """
+    Measures end-to-end update throughput, running the full entry point against a fake pip that
+    reports a given number of outdated packages and takes a given time per install.
+
+    :param home: the temporary directory to use as the home folder
+    :param packages: the number of outdated packages
+    :param latency: the time each fake install takes, in seconds
+    :returns: the wall-clock time and packages per second of each scenario
+    """
+    bin_folder: str = f"{home}/bin"
+    os.makedirs(bin_folder, exist_ok=True)
+    with open(f"{ROOT}/benchmarks/fake_pip.py", "r") as source:
+        with open(f"{bin_folder}/pip", "w") as fake_pip:
+            fake_pip.write(f"#!{sys.executable}\n" + source.read())
+    os.chmod(f"{bin_folder}/pip", 0o755)
+
+    scenarios: dict[str, list[str]] = {
+        "sequential": [],
+        "jobs_4": ["--jobs", "4"],
+        "jobs_16": ["--jobs", "16"],
+        "batch": ["--batch"],
+        "batch_10": ["--batch", "--batch-size", "10"],
+        "ordered_jobs_4": ["--ordered", "--jobs", "4"],
+        "wheelhouse": ["--wheelhouse"],
+        "wheelhouse_jobs_4": ["--wheelhouse", "--jobs", "4"],
+    }
+    results: dict[str, Any] = {}
+    for name, options in scenarios.items():
+        env: dict[str, str] = make_env(
+            f"{home}/update-{name}",
+            bin_folder,
+            FAKE_PIP_PACKAGES=str(packages),
+            FAKE_PIP_LATENCY=str(latency),
+        )
+        elapsed: float = run([sys.executable, "-c", RUN_ENTRY_POINT, *options], env)[0]
+        results[name] = {
+            "seconds": elapsed,
+            "packages_per_second": packages / elapsed,
+        }
+    return results
+
+
+def flatten(results: dict[str, Any], prefix: str = "") -> dict[str, float]:
+    """
+    Flattens nested benchmark results into a mapping of dotted names to numbers, for comparison.
+
+    :param results: the results
+    :param prefix: the dotted name of the results being flattened
+    :returns: the flattened results
+    """
+    flat: dict[str, float] = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """
+    Prints how each timing changed relative to an earlier run's results.
+
+    :param results: the results of this run
+    :param baseline: the results of the earlier run
+    """
+    current: dict[str, float] = flatten(results["benchmarks"])
+    previous: dict[str, float] = flatten(baseline["benchmarks"])
+
+    print(f"\nCompared with {baseline['meta']['version']} ({baseline['meta']['date']}):")
+    for name in sorted(current.keys() & previous.keys()):
+        if not (name.endswith(("median", "seconds", "_us", "per_second"))):
+            continue
+        if previous[name] == 0:
+            continue
+        change: float = (current[name] - previous[name]) / previous[name] * 100
+        print(f"   {name}: {previous[name]:.6g} -> {current[name]:.6g} ({change:+.1f}%)")
+
+
+def main() -> None:
+    """
+    Runs every benchmark, then prints and saves the results.
+    """
+    args: Namespace = get_args()
+    if os.name != "posix":
+        print("The benchmarks need a POSIX system to install the fake pip.", file=sys.stderr)
+        sys.exit(1)
+
+    sys.path.insert(0, ROOT)
+    from bench_line_classifier import bench_line_classifier
+    from pipupdater.cfg import __version__
+
+    results: dict[str, Any] = {
+        "meta": {
+            "version": __version__,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "packages": args.packages,
+            "latency": args.latency,
+            "repeat": args.repeat,
+        },
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="pipupdater-bench-") as home:
+        print("Measuring cold start...")
+        results["benchmarks"]["cold_start"] = bench_cold_start(home, args.repeat)
+        print("Measuring config load...")
+        results["benchmarks"]["config_load"] = bench_config_load(home, args.repeat)
+        print("Measuring import time...")
+        results["benchmarks"]["import_time"] = bench_import_time(home)
+        print("Measuring update throughput...")
+        results["benchmarks"]["update_throughput"] = bench_update_throughput(
+            home, args.packages, args.latency
+        )
+    print("Measuring line classification...")
+    results["benchmarks"]["line_classifier"] = bench_line_classifier()
+
+    output: str = args.output or (
+        f"{ROOT}/benchmarks/results/{__version__}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=4)
+
+    benchmarks: dict[str, Any] = results["benchmarks"]
+    print("\nCold start ('pipupdater --version'): "
+          + f"{benchmarks['cold_start']['version']['median'] * 1000:.1f} ms median, of which"
+          + f" {benchmarks['cold_start']['overhead_median'] * 1000:.1f} ms is pipupdater")
+    for situation, stages in benchmarks["config_load"].items():
+        print(f"Config load ({situation}): {stages['config']['median'] * 1000:.2f} ms median"
+              + f" (tomlkit imported: {stages['tomlkit_imported']})")
+    print(f"Import time: {benchmarks['import_time']['total_us'] / 1000:.1f} ms for"
+          + f" {benchmarks['import_time']['module_count']} modules")
+    for name, scenario in benchmarks["update_throughput"].items():
+        print(f"Update throughput ({name}): {scenario['packages_per_second']:.1f} packages/s"
+              + f" ({scenario['seconds']:.2f} s)")
+    print(f"Line classification: {benchmarks['line_classifier']['speedup']:.2f}x faster than"
+          + f" before ({benchmarks['line_classifier']['after_seconds'] * 1000:.1f} ms for"
+          + f" {benchmarks['line_classifier']['lines']} lines)")
+    print(f"\nResults saved to {output}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
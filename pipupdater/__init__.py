@@ -23,7 +23,32 @@ from .cfg import get_config
 from .cfg import modify_args
 from .cfg import __version__
 
+from .helpers import find_interpreter
+from .helpers import get_config_folder
+from .helpers import normalise_name
 from .helpers import str_starts_with
 
+from .models import Failure
+from .models import Fleet
+from .models import IndexCache
+from .models import Journal
+from .models import LineClassifier
 from .models import Logger
+from .models import PackageUpdate
+from .models import PipLog
+from .models import PipRunner
+from .models import Progress
+from .models import RunResult
+from .models import Policy
+from .models import Preflight
+from .models import Profiler
+from .models import Report
+from .models import ResultStore
+from .models import Retrier
+from .models import Scheduler
+from .models import Snapshots
+from .models import Span
+from .models import Status
 from .models import Updater
+from .models import Watcher
+from .models import Wheelhouse
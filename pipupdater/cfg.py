@@ -17,20 +17,24 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
 import argparse
-import copy
-import difflib
-import tomlkit
+import hashlib
+import json
+import os
 import sys
 
+from .helpers import get_config_folder
 from .models import Logger
 
 from argparse import Namespace
 from importlib.resources import files
 from os import makedirs
 from os.path import exists
-from platformdirs import user_config_dir
-from tomlkit import TOMLDocument
-from typing import Any, List, Mapping
+from typing import TYPE_CHECKING, Any, Mapping, Optional
+
+if TYPE_CHECKING:
+    import tomlkit
+
+    from tomlkit import TOMLDocument
 
 
 __version__ = "1.2.0-alpha"
@@ -47,12 +51,71 @@ def get_args() -> Namespace:
         description='A small command-line tool for automatically updating outdated pip packages.'
     )
 
+    parser.add_argument("-b", "--batch", action="store_true",
+                        help="update packages in batches using one pip command per batch")
+    parser.add_argument("-B", "--batch-size", action="store", type=int, default=None,
+                        help="the number of packages to update per batch; 0 updates every package"
+                        + " in a single batch")
     parser.add_argument("-d", "--debug", action="store_true", help="enable debug logging")
+    parser.add_argument("-D", "--discovery", action="store", choices=["pip", "metadata"],
+                        default=None,
+                        help="how to find outdated packages: by querying pip, or by comparing"
+                        + " installed package metadata with a cache of the package index")
+    parser.add_argument("-e", "--env", action="append", default=None,
+                        help="update the environment with the given Python interpreter or virtual"
+                        + " environment folder; can be passed more than once")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="skip packages whose latest version hasn't changed since the last"
+                        + " completed run")
+    parser.add_argument("-j", "--jobs", action="store", type=int, default=None,
+                        help="the number of package updates to run at once; installs run one at a"
+                        + " time, so this only speeds up downloads and builds with --wheelhouse;"
+                        + " defaults to the value in the config file")
+    parser.add_argument("-J", "--junit", action="store_true",
+                        help="write a structured run report, and a JUnit XML report alongside it")
+    parser.add_argument("-k", "--snapshot", action="store_true",
+                        help="snapshot the environment before updating it, so the run can be"
+                        + " rolled back with --rollback")
+    parser.add_argument("-l", "--pip-log", action="store", default=None, metavar="PACKAGE",
+                        help="print the pip output saved for the given package with --save-pip,"
+                        + " then exit")
+    parser.add_argument("-L", "--lockfile", action="store", default=None,
+                        help="update only the packages that differ from a requirements.txt or"
+                        + " pylock.toml lockfile, to their locked versions, in a single batch")
+    parser.add_argument("-o", "--ordered", action="store_true",
+                        help="update packages in dependency order, in waves of independent"
+                        + " packages")
+    parser.add_argument("-O", "--report", action="store_true",
+                        help="write a structured run report in JSON lines, updated as each package"
+                        + " finishes")
+    parser.add_argument("-p", "--preflight", action="store_true",
+                        help="check the updates for dependency conflicts before installing any,"
+                        + " dropping or pinning packages that would conflict")
+    parser.add_argument("-P", "--profile", action="store_true",
+                        help="time each phase of the run and each package, and save a timing"
+                        + " report to the config folder")
+    parser.add_argument("-r", "--resume", action="store_true",
+                        help="skip packages that an earlier, interrupted run already updated")
+    parser.add_argument("-R", "--retries", action="store", type=int, default=None,
+                        help="the most times to retry an update that fails with a network error")
     parser.add_argument("-s", "--source", action="store", default=None,
                         help="provide a source file containing a list of outdated packages; if"
                         + " left blank, pipupdater will query pip for this list")
     parser.add_argument("-S", "--save-pip", action="store_true",
                         help="save pip output without printing it to console")
+    parser.add_argument("-t", "--trace", action="store_true",
+                        help="with --profile, also save a Chrome trace-event file that can be"
+                        + " opened in a trace viewer")
+    parser.add_argument("-u", "--rollback", action="store", nargs="?", const="latest",
+                        default=None, metavar="RUN_ID",
+                        help="restore the versions installed before the given run (or the most"
+                        + " recent run) from its snapshot, then exit")
+    parser.add_argument("-w", "--wheelhouse", action="store_true",
+                        help="build wheels into a local wheelhouse shared between runs, then"
+                        + " install from it")
+    parser.add_argument("-W", "--watch", action="store_true",
+                        help="keep running, updating packages on a schedule and whenever the"
+                        + " environment changes, with a status and trigger socket")
     parser.add_argument("-v", "--version", action="version", version=f"%(prog)s {__version__}")
 
     return parser.parse_args()
@@ -64,24 +127,56 @@ def get_config(logger: Logger) -> dict[str, Any]:
     the default config options. If not possible, use default config options for this run and warn
     the user that no config file exists.
 
+    Parsing and merging the config files with tomlkit is slow, so the resulting options are cached
+    as a plain JSON snapshot alongside a fingerprint of both files. As long as neither file has
+    changed since the snapshot was taken, the snapshot is used and tomlkit is never imported.
+
     :param logger: the logger
     :returns: as a dict, the config options
     """
     try:
-        config_folder: str = f"{user_config_dir()}/pipupdater"
+        config_folder: str = get_config_folder()
 
         if not exists(config_folder):
             makedirs(config_folder)
 
+        snapshot: Optional[dict[str, Any]] = load_config_snapshot(config_folder)
+        cached: dict[str, list] = snapshot["fingerprints"] if snapshot is not None else {}
+        fingerprints: dict[str, Optional[list]] = {
+            "config": get_fingerprint(f"{config_folder}/config.toml", cached.get("config")),
+            "default": get_fingerprint(
+                str(files('pipupdater.data').joinpath('default_config.toml')),
+                cached.get("default")
+            ),
+        }
+        if snapshot is not None and is_unchanged(fingerprints, cached):
+            if fingerprints != cached:
+                # a file was touched without being changed; store its new stats so it isn't hashed
+                # again next time
+                save_config_snapshot(config_folder, fingerprints, snapshot["config"], logger)
+            return snapshot["config"]
+
+        import tomlkit
+
+        config: dict[str, Any]
         if exists(f"{config_folder}/config.toml"):
             with open(f"{config_folder}/config.toml", "r") as config_file:
-                return import_new_config(tomlkit.load(config_file), config_folder, logger)
+                config = import_new_config(
+                    tomlkit.load(config_file), config_folder, logger
+                ).unwrap()
         else:
             with open(f"{config_folder}/config.toml", "w+") as config_file:
                 default: str = files('pipupdater.data').joinpath('default_config.toml').read_text()
                 config_file.write(default)
-                return tomlkit.loads(default).unwrap()
+                config = tomlkit.loads(default).unwrap()
+
+        # importing new options may have rewritten the config file
+        fingerprints["config"] = get_fingerprint(f"{config_folder}/config.toml")
+        save_config_snapshot(config_folder, fingerprints, config, logger)
+        return config
     except Exception as e:
+        import tomlkit
+
         logger.new(
             "Could not find existing config file or make a new one. Using default settings.",
             "WARNING"
@@ -91,6 +186,85 @@ def get_config(logger: Logger) -> dict[str, Any]:
         ).unwrap()
 
 
+def get_fingerprint(path: str, cached: Optional[list] = None) -> Optional[list]:
+    """
+    Fingerprints a file by its modification time, size and SHA-256 hash. If the file's modification
+    time and size match a given cached fingerprint, the file is assumed unchanged and its cached
+    hash is reused rather than reading the file again.
+
+    :param path: the path to the file
+    :param cached: optional; the file's previous fingerprint
+    :returns: the fingerprint, as [mtime_ns, size, hash], or None if the file can't be read
+    """
+    try:
+        stat: os.stat_result = os.stat(path)
+        if cached is not None and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return cached
+        with open(path, "rb") as file:
+            return [stat.st_mtime_ns, stat.st_size, hashlib.sha256(file.read()).hexdigest()]
+    except OSError:
+        return None
+
+
+def is_unchanged(fingerprints: dict[str, Optional[list]], cached: dict[str, list]) -> bool:
+    """
+    Compares the current fingerprints of the config files with those stored in the config snapshot.
+    Only the hashes are compared, so a file that was touched without being changed still matches.
+
+    :param fingerprints: the current fingerprints, keyed by file
+    :param cached: the fingerprints stored in the snapshot, keyed by file
+    :returns: whether every file is unchanged since the snapshot was taken
+    """
+    return all(
+        fingerprint is not None
+        and cached.get(name) is not None
+        and fingerprint[2] == cached[name][2]
+        for name, fingerprint in fingerprints.items()
+    )
+
+
+def load_config_snapshot(config_folder: str) -> Optional[dict[str, Any]]:
+    """
+    Loads the config snapshot written by the last run that parsed the config files.
+
+    :param config_folder: the path to pipupdater's config folder
+    :returns: the snapshot, or None if there isn't a valid one
+    """
+    try:
+        with open(f"{config_folder}/config_snapshot.json", "r") as snapshot_file:
+            snapshot: dict[str, Any] = json.load(snapshot_file)
+        if snapshot.get("version") != __version__ or "config" not in snapshot:
+            return None
+        return snapshot
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def save_config_snapshot(
+        config_folder: str,
+        fingerprints: dict[str, Optional[list]],
+        config: dict[str, Any],
+        logger: Logger) -> None:
+    """
+    Atomically writes the config snapshot, so later runs can skip parsing the config files.
+
+    :param config_folder: the path to pipupdater's config folder
+    :param fingerprints: the fingerprints of the config files the options were read from
+    :param config: the config options
+    :param logger: the logger
+    """
+    path: str = f"{config_folder}/config_snapshot.json"
+    try:
+        with open(f"{path}.tmp", "w") as snapshot_file:
+            json.dump(
+                {"version": __version__, "fingerprints": fingerprints, "config": config},
+                snapshot_file
+            )
+        os.replace(f"{path}.tmp", path)
+    except Exception as e:
+        logger.new(f"Could not save config snapshot. Error was: {e}", "DEBUG")
+
+
 def modify_args(args: Namespace, config: dict[str, Any]) -> Namespace:
     """
     Modifies the args Namespace with values imported from the config file. This method will always
@@ -98,19 +272,35 @@ def modify_args(args: Namespace, config: dict[str, Any]) -> Namespace:
     true in the config file, it will be set to True, but if --debug *is* passed and is false in the
     config file, it will not be set to False in runtime.
 
+    Valued options (such as --jobs and --batch-size) are only taken from the config file if they
+    were not passed on the command line.
+
     :param args: the command-line arguments
     :param config: the config file data
     :returns: the modified args Namespace
     """
     if config["logger"]["debug"]: args.debug = True
     if config["logger"]["pipoutput"]: args.save_pip = True
+    if config["updater"]["batch"]: args.batch = True
+    if config["updater"]["incremental"]: args.incremental = True
+    if config["updater"]["ordered"]: args.ordered = True
+    if config["updater"]["preflight"]: args.preflight = True
+    if config["report"]["enabled"]: args.report = True
+    if config["report"]["junit"]: args.junit = True
+    if config["snapshot"]["enabled"]: args.snapshot = True
+    if config["wheelhouse"]["enabled"]: args.wheelhouse = True
+    if args.batch_size is None: args.batch_size = config["updater"]["batch_size"]
+    if args.jobs is None: args.jobs = config["updater"]["jobs"]
+    if args.retries is None: args.retries = config["retry"]["attempts"]
+    if args.discovery is None: args.discovery = config["discovery"]["engine"]
+    if args.env is None: args.env = list(config["fleet"]["environments"])
     return args
 
 
 def import_new_config(
-        existing: TOMLDocument,
+        existing: "TOMLDocument",
         config_folder: str,
-        logger: Logger) -> dict[str, Any]:
+        logger: Logger) -> "TOMLDocument":
     """
     Compares the default_config.toml file with the user's existing configuration file (if one
     exists). Any keys missing from the user's file will be imported from the default and written
@@ -125,16 +315,17 @@ def import_new_config(
     :param logger: the logger
     :returns: the modified config options
     """
-    modified: bool = False
-    original: TOMLDocument = copy.deepcopy(existing)
+    import tomlkit
+
+    original: str = existing.as_string()
     default: TOMLDocument = tomlkit.loads(
         files('pipupdater.data').joinpath('default_config.toml').read_text()
     )
 
-    if (default.as_string() != existing.as_string()):
+    if (default.as_string() != original):
         existing = deep_update(default, existing)
 
-    if (original.as_string() != existing.as_string()):
+    if (original != existing.as_string()):
         logger.new(
             "New configuration options were detected in the default config file. Adding them to"
             + " existing config.",
@@ -142,7 +333,7 @@ def import_new_config(
         )
         with open(f"{config_folder}/config.toml", "w+") as config_file:
             tomlkit.dump(existing, config_file)
-    
+
     return existing
 
 
@@ -170,6 +361,8 @@ def deep_update(source: Any, target: Any) -> Any:
     :param target: the document being updated
     :returns: the updated document
     """
+    import tomlkit
+
     for key, value in source.items():
         if isinstance(value, Mapping) and value:
             if target.get(key) is not None:
@@ -188,8 +381,8 @@ def deep_update(source: Any, target: Any) -> Any:
 
 
 def deep_update_array(
-        source: tomlkit.items.Array,
-        target: tomlkit.items.Array) -> tomlkit.items.Array:
+        source: "tomlkit.items.Array",
+        target: "tomlkit.items.Array") -> "tomlkit.items.Array":
     """
     Performs a merge on two tomlkit Arrays. This method assumes the Array is multiline and adds
     each new item from the source array to the original as a new line appended with a comma.
@@ -17,16 +17,32 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
 import shutil
+import sys
+import threading
+import time
 
 from .cfg import get_args
 from .cfg import get_config
 from .cfg import modify_args
+from .helpers import find_interpreter
+from .helpers import get_config_folder
+from .models import Fleet
+from .models import IndexCache
+from .models import Journal
 from .models import Logger
+from .models import Policy
+from .models import Preflight
+from .models import Profiler
+from .models import Report
+from .models import Retrier
+from .models import Snapshots
 from .models import Updater
+from .models import Watcher
+from .models import Wheelhouse
 
 from argparse import Namespace
 from smooth_logger.enums import Categories
-from typing import Any
+from typing import Any, Optional
 
 
 def entry_point():
@@ -36,12 +52,412 @@ def entry_point():
     logger: Logger = Logger("pipupdater")
 
     args: Namespace = get_args()
-    config: dict[str, Any] = get_config(logger)
+    profiler: Profiler = Profiler(enabled=args.profile)
+    with profiler.span("load config", "config"):
+        config: dict[str, Any] = get_config(logger)
 
     args = modify_args(args, config)
 
     logger.edit_scope("DEBUG", Categories.MAXIMUM if args.debug else Categories.DISABLED)
     logger.add_scope("PIPOUTPUT", Categories.SAVE if args.save_pip else Categories.DISABLED)
+    logger.open_pip_log(
+        config["pip_log"]["max_size"] * 1024 * 1024,
+        config["pip_log"]["max_age"] * 24 * 60 * 60,
+        config["pip_log"]["compress"],
+        config["pip_log"]["keep"]
+    )
 
-    updater: Updater = Updater(args, logger, config["prefixes"])
-    updater.update_all()
+    if args.pip_log is not None:
+        show_pip_log(args.pip_log, logger)
+        return
+
+    snapshots: Snapshots = None
+    if args.snapshot or args.rollback is not None:
+        try:
+            snapshots = Snapshots(
+                f"{get_config_folder()}/snapshots",
+                config["snapshot"]["max_age"] * 24 * 60 * 60,
+                config["snapshot"]["max_size"] * 1024 * 1024,
+                logger
+            )
+        except Exception as e:
+            logger.new(
+                f"Could not create snapshot store; this run can't be rolled back. Error was: {e}",
+                "WARNING"
+            )
+
+    if args.rollback is not None:
+        if snapshots is not None:
+            rollback(args, config, logger, snapshots)
+        return
+
+    try:
+        policy: Policy = get_policy(config)
+    except ValueError as e:
+        logger.new(f"Invalid update policy in config file: {e}", "FATAL")
+        return
+
+    index_cache: IndexCache = None
+    # watch mode checks changed distributions with the metadata engine, whichever engine is set
+    if args.discovery == "metadata" or args.watch:
+        index_cache = IndexCache(
+            get_config_folder(),
+            config["discovery"]["index_url"],
+            config["discovery"]["cache_ttl"],
+            logger
+        )
+
+    wheelhouse: Wheelhouse = None
+    if args.wheelhouse:
+        try:
+            wheelhouse = Wheelhouse(
+                f"{get_config_folder()}/wheelhouse",
+                config["wheelhouse"]["max_size"] * 1024 * 1024,
+                logger
+            )
+        except Exception as e:
+            logger.new(
+                "Could not create wheelhouse; packages will be updated from the index. Error was:"
+                + f" {e}",
+                "WARNING"
+            )
+
+    preflight: Preflight = None
+    if args.preflight:
+        try:
+            preflight = Preflight(get_config_folder(), logger)
+        except Exception as e:
+            logger.new(
+                "Could not create resolver cache; updates will not be checked for conflicts."
+                + f" Error was: {e}",
+                "WARNING"
+            )
+
+    report: Optional[Report] = None if args.watch else get_report(args, config, logger)
+    # with a single environment, failing to find outdated packages fails the whole run
+    discovery_failed: bool = False
+
+    if args.watch:
+        watch(args, config, logger, index_cache, wheelhouse, preflight, snapshots)
+    elif args.env:
+        update_fleet(
+            args,
+            config,
+            logger,
+            index_cache,
+            wheelhouse,
+            preflight,
+            profiler,
+            policy,
+            snapshots,
+            report
+        )
+    else:
+        journal: Journal = Journal(get_config_folder(), logger)
+
+        updater: Updater = Updater(
+            args,
+            logger,
+            config["prefixes"],
+            index_cache,
+            journal,
+            wheelhouse=wheelhouse,
+            preflight=preflight,
+            profiler=profiler,
+            retrier=get_retrier(args, config),
+            policy=policy,
+            snapshots=snapshots,
+            report=report
+        )
+        updater.update_all()
+        discovery_failed = updater.discovery_failed
+
+    if report is not None:
+        save_report(report, logger)
+    if args.profile:
+        save_profile(profiler, logger, args.trace)
+    if discovery_failed:
+        sys.exit(1)
+
+
+def get_policy(config: dict[str, Any]) -> Policy:
+    """
+    Creates the update policy from the config file.
+
+    :param config: the config options
+    :returns: the policy
+    :raises ValueError: if the policy is invalid
+    """
+    return Policy(
+        config["policy"]["include"],
+        config["policy"]["exclude"],
+        config["policy"]["max_bump"],
+        config["policy"]["pins"]
+    )
+
+
+def get_report(args: Namespace, config: dict[str, Any], logger: Logger) -> Optional[Report]:
+    """
+    Creates a structured report for the run, if one was asked for with --report or --junit (or in
+    the config file).
+
+    :param args: the command-line arguments
+    :param config: the config options
+    :param logger: the logger
+    :returns: the report, or None if one wasn't asked for or couldn't be created
+    """
+    if not (args.report or args.junit):
+        return None
+    try:
+        return Report(config["report"]["folder"] or f"{get_config_folder()}/reports", args.junit)
+    except Exception as e:
+        logger.new(f"Could not create run report. Error was: {e}", "WARNING")
+        return None
+
+
+def get_retrier(args: Namespace, config: dict[str, Any]) -> Retrier:
+    """
+    Creates a retrier with the retry settings from the config file and command line.
+
+    :param args: the command-line arguments
+    :param config: the config options
+    :returns: the retrier
+    """
+    return Retrier(
+        args.retries,
+        config["retry"]["budget"],
+        config["retry"]["backoff"],
+        config["retry"]["max_backoff"],
+        config["retry"]["jitter"]
+    )
+
+
+def rollback(
+        args: Namespace,
+        config: dict[str, Any],
+        logger: Logger,
+        snapshots: Snapshots) -> None:
+    """
+    Rolls back a run in the environment found on PATH, or in each environment passed with --env
+    (or listed in the config file), one at a time.
+
+    :param args: the command-line arguments
+    :param config: the config options
+    :param logger: the logger
+    :param snapshots: the snapshot store
+    """
+    run_id: Optional[str] = None if args.rollback == "latest" else args.rollback
+    for environment in args.env or [None]:
+        python: Optional[str] = None
+        if environment is not None:
+            try:
+                python = find_interpreter(environment)
+            except FileNotFoundError as e:
+                logger.new(f"{e}; skipping environment.", "ERROR")
+                continue
+        Updater(
+            args, logger, config["prefixes"], python=python, snapshots=snapshots
+        ).rollback(run_id)
+
+
+def save_profile(profiler: Profiler, logger: Logger, trace: bool) -> None:
+    """
+    Outputs a summary of the run's timings and saves the full timing report to the profiles folder
+    in pipupdater's config folder.
+
+    :param profiler: the profiler the run was timed with
+    :param logger: the logger
+    :param trace: whether to also save a Chrome trace-event file
+    """
+    report: dict[str, Any] = profiler.report()
+    logger.new(f"Time spent in each phase of the run:\n{profiler.summarise(report)}", "INFO")
+    try:
+        report_path, trace_path = profiler.write(f"{get_config_folder()}/profiles", report, trace)
+        logger.new(f"Saved timing report to: {report_path}", "INFO")
+        if trace_path is not None:
+            logger.new(f"Saved trace to: {trace_path}", "INFO")
+    except Exception as e:
+        logger.new(f"Could not save timing report. Error was: {e}", "WARNING")
+
+
+def save_report(report: Report, logger: Logger) -> None:
+    """
+    Finishes a run's structured report, and logs where it was saved.
+
+    :param report: the report
+    :param logger: the logger
+    """
+    report.close()
+    logger.new(f"Saved run report to: {report.path}", "INFO")
+    if report.junit_path is not None:
+        logger.new(f"Saved JUnit report to: {report.junit_path}", "INFO")
+
+
+def show_pip_log(package: str, logger: Logger) -> None:
+    """
+    Prints the pip output saved for a given package, from the current and rotated pip logs.
+
+    :param package: the name of the package
+    :param logger: the logger
+    """
+    if logger.pip_log is None:
+        logger.new("The pip log folder could not be found.", "ERROR")
+        return
+
+    found: bool = False
+    for written, output in logger.pip_log.find(package):
+        found = True
+        print(f"--- {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(written))} ---")
+        print(output.rstrip("\n"))
+    if not found:
+        logger.new(f"No saved pip output for package: {package}", "INFO")
+
+
+def update_fleet(
+        args: Namespace,
+        config: dict[str, Any],
+        logger: Logger,
+        index_cache: IndexCache,
+        wheelhouse: Wheelhouse,
+        preflight: Preflight,
+        profiler: Profiler,
+        policy: Policy,
+        snapshots: Snapshots,
+        report: Optional[Report]) -> None:
+    """
+    Updates each of the environments passed with --env (or listed in the config file) at once,
+    using one Updater per environment. Environments without a Python interpreter are skipped.
+
+    :param args: the command-line arguments
+    :param config: the config options
+    :param logger: the logger
+    :param index_cache: the index cache, if using the metadata discovery engine
+    :param wheelhouse: the wheelhouse, if installing packages from one
+    :param preflight: the preflight checker, if checking updates for conflicts
+    :param profiler: the profiler to time the run with
+    :param policy: the policy that decides which packages may be updated
+    :param snapshots: the snapshot store, if snapshotting environments before updating them
+    :param report: the structured report, if writing one
+    """
+    limiter: threading.Semaphore = threading.BoundedSemaphore(config["fleet"]["max_workers"])
+    updaters: list[Updater] = []
+
+    for environment in args.env:
+        try:
+            python: str = find_interpreter(environment)
+        except FileNotFoundError as e:
+            logger.new(f"{e}; skipping environment.", "ERROR")
+            continue
+
+        journal: Journal = Journal(get_config_folder(), logger, python)
+        updaters.append(
+            Updater(
+                args,
+                logger,
+                config["prefixes"],
+                index_cache,
+                journal,
+                python,
+                limiter,
+                wheelhouse,
+                preflight,
+                profiler,
+                get_retrier(args, config),
+                policy,
+                snapshots,
+                report
+            )
+        )
+
+    Fleet(updaters, logger).update_all()
+
+
+def watch(
+        args: Namespace,
+        config: dict[str, Any],
+        logger: Logger,
+        index_cache: IndexCache,
+        wheelhouse: Wheelhouse,
+        preflight: Preflight,
+        snapshots: Snapshots) -> None:
+    """
+    Keeps pipupdater running, updating the environment found on PATH (or the one passed with
+    --env) on a schedule and whenever it changes; see the Watcher class. The config options are
+    kept in memory, and only reloaded when the config file changes.
+
+    :param args: the command-line arguments
+    :param config: the config options
+    :param logger: the logger
+    :param index_cache: the index cache
+    :param wheelhouse: the wheelhouse, if installing packages from one
+    :param preflight: the preflight checker, if checking updates for conflicts
+    :param snapshots: the snapshot store, if snapshotting the environment before updating it
+    """
+    if len(args.env) > 1:
+        logger.new("Only one environment can be watched at a time.", "FATAL")
+        return
+    python: Optional[str] = None
+    if args.env:
+        try:
+            python = find_interpreter(args.env[0])
+        except FileNotFoundError as e:
+            logger.new(f"{e}.", "FATAL")
+            return
+
+    # the options in use; replaced as a whole when the config file is reloaded
+    current: dict[str, Any] = {"config": config, "policy": get_policy(config)}
+
+    def reload() -> None:
+        """
+        Reloads the config options and the update policy.
+        """
+        new_config: dict[str, Any] = get_config(logger)
+        # an invalid policy leaves the old options in use
+        current.update(config=new_config, policy=get_policy(new_config))
+
+    def run(names: Optional[set[str]]) -> dict[str, int]:
+        """
+        Updates the environment with a new Updater, using the current options.
+
+        :param names: the normalised names of the only distributions to check, or None for all
+        :returns: the number of packages with each outcome
+        """
+        profiler: Profiler = Profiler(enabled=args.profile)
+        report: Optional[Report] = get_report(args, current["config"], logger)
+        updater: Updater = Updater(
+            args,
+            logger,
+            current["config"]["prefixes"],
+            index_cache,
+            Journal(get_config_folder(), logger, python),
+            python,
+            wheelhouse=wheelhouse,
+            preflight=preflight,
+            profiler=profiler,
+            retrier=get_retrier(args, current["config"]),
+            policy=current["policy"],
+            snapshots=snapshots,
+            report=report
+        )
+        updater.update_all(names=names)
+        if report is not None:
+            save_report(report, logger)
+        if args.profile:
+            save_profile(profiler, logger, args.trace)
+        if updater.discovery_failed:
+            raise RuntimeError("could not get list of outdated packages")
+        return {
+            store: len(getattr(updater, store))
+            for store in ("success", "failed", "unchanged", "skipped")
+        }
+
+    Watcher(
+        run,
+        reload,
+        Updater(args, logger, config["prefixes"], python=python).get_search_path(),
+        f"{get_config_folder()}/config.toml",
+        config["watch"]["interval"],
+        config["watch"]["poll"],
+        config["watch"]["socket"] or f"{get_config_folder()}/pipupdater.sock",
+        logger
+    ).serve()
@@ -16,6 +16,51 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 
+import re
+
+from os.path import isdir, isfile
+from platformdirs import user_config_dir
+
+
+def find_interpreter(path: str) -> str:
+    """
+    Finds the Python interpreter of an environment. The path can either be to the interpreter
+    itself, or to the root folder of a virtual environment.
+
+    :param path: the path to the interpreter or virtual environment
+    :returns: the path to the interpreter
+    :raises FileNotFoundError: if no interpreter could be found at the path
+    """
+    if isfile(path):
+        return path
+    if isdir(path):
+        for candidate in (f"{path}/bin/python", f"{path}/Scripts/python.exe"):
+            if isfile(candidate):
+                return candidate
+    raise FileNotFoundError(f"No Python interpreter found at: {path}")
+
+
+def get_config_folder() -> str:
+    """
+    Gets the path to pipupdater's config folder, which holds the config file as well as any data
+    pipupdater persists between runs. The folder is not guaranteed to exist.
+
+    :returns: the path to the config folder
+    """
+    return f"{user_config_dir()}/pipupdater"
+
+
+def normalise_name(name: str) -> str:
+    """
+    Normalises a package name as described in PEP 503, so that differently-written names of the
+    same package (e.g. "Typing_Extensions" and "typing-extensions") compare as equal.
+
+    :param name: the package name to normalise
+    :returns: the normalised name
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
 def str_starts_with(string: str, prefixes: list[str]) -> bool:
     """
     Determines if a given string starts with any one of the given list of prefixes.
@@ -24,7 +69,4 @@ def str_starts_with(string: str, prefixes: list[str]) -> bool:
     :param prefixes: the list of prefixes
     :return: whether the string begins with any one of the prefixes
     """
-    for prefix in prefixes:
-        if string.startswith(prefix):
-            return True
-    return False
+    return string.startswith(tuple(prefixes))
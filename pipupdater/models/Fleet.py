@@ -0,0 +1,77 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+from .Logger import Logger
+from .ResultStore import ResultStore
+from .Updater import Updater
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class Fleet():
+    """
+    Updates several Python environments at once, each with its own Updater. The environments are
+    processed in parallel; the number of pip commands running at once across all of them is capped
+    by the limiter the Updaters share.
+
+    :param updaters: the updater for each environment
+    :param logger: the logger instance
+    """
+    def __init__(self, updaters: list[Updater], logger: Logger) -> None:
+        self.logger: Logger = logger
+        self.updaters: list[Updater] = updaters
+
+    def combine_results(self, store: str) -> ResultStore:
+        """
+        Combines a given result store from each environment's Updater into a single store. Each
+        package name is marked with the interpreter of the environment it belongs to.
+
+        :param store: the name of the result store, e.g. "success"
+        :returns: the combined result store
+        """
+        combined: ResultStore = ResultStore()
+        for updater in self.updaters:
+            combined.extend(
+                package._replace(name=f"[{updater.python}] {package.name}")
+                for package in getattr(updater, store)
+            )
+        return combined
+
+    def update_all(self) -> None:
+        """
+        Updates all outdated packages in every environment, then outputs the combined results.
+        """
+        if len(self.updaters) == 0:
+            self.logger.new("No environments to update.", "WARNING")
+            return
+
+        self.logger.new(f"Updating {len(self.updaters)} environments...", "INFO")
+        with ThreadPoolExecutor(max_workers=len(self.updaters)) as executor:
+            futures: list[Future] = [
+                executor.submit(updater.update_all, False) for updater in self.updaters
+            ]
+            for future in futures:
+                future.result()
+
+        self.logger.print_results(
+            self.combine_results("failed"),
+            self.combine_results("success"),
+            self.combine_results("unchanged"),
+            self.combine_results("skipped"),
+            self.combine_results("dependencies")
+        )
@@ -0,0 +1,201 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import os
+import threading
+import time
+
+from ..helpers import normalise_name
+from .Logger import Logger
+from .PackageUpdate import parse_version
+
+from packaging.version import Version
+from typing import Any, Optional
+
+
+class IndexCache():
+    """
+    A persistent cache of the latest versions of packages available on a package index, stored in
+    pipupdater's config folder. Entries are reused until they are older than the cache's time-to-
+    live; after that they are revalidated with the index, sending the ETag or Last-Modified value
+    from the previous response so an unchanged package costs an empty "304 Not Modified" response
+    rather than a full download of its metadata.
+
+    The index is queried through its JSON API ({index_url}/{package}/json), so index_url can also
+    be a file:// URL pointing at a local folder laid out in the same way.
+
+    Like pip, the latest version is the newest final release that isn't yanked and supports the
+    Python version of the environment being updated, so each entry keeps every such release along
+    with its Requires-Python specifier.
+
+    :param config_folder: the path to pipupdater's config folder
+    :param index_url: the base URL of the package index's JSON API
+    :param ttl: the number of seconds an entry is used without being revalidated
+    :param logger: the logger instance
+    """
+    def __init__(self, config_folder: str, index_url: str, ttl: int, logger: Logger) -> None:
+        self.index_url: str = index_url.rstrip("/")
+        self.logger: Logger = logger
+        self.path: str = f"{config_folder}/index_cache.json"
+        self.ttl: int = ttl
+
+        self._entries: dict[str, dict[str, Any]] = self.__load()
+        self._lock: threading.Lock = threading.Lock()
+        self._modified: bool = False
+
+    @staticmethod
+    def __candidates(data: dict[str, Any]) -> list[list[Optional[str]]]:
+        """
+        Finds the releases of a package that pip could install, from its JSON API response:
+        releases that have at least one file that isn't yanked, and that aren't pre-releases. If
+        the response has no list of releases, only the version in its "info" table is considered.
+
+        :param data: the JSON API response for the package
+        :returns: the version and Requires-Python specifier of each release, newest first
+        """
+        releases: dict[str, list[dict[str, Any]]] = data.get("releases") or {
+            data["info"]["version"]: [{
+                "requires_python": data["info"].get("requires_python"),
+                "yanked": data["info"].get("yanked", False)
+            }]
+        }
+        candidates: list[tuple[Version, str, Optional[str]]] = []
+        for version, files in releases.items():
+            parsed: Optional[Version] = parse_version(version)
+            if parsed is None or parsed.is_prerelease:
+                continue
+            files = [file for file in files if not file.get("yanked", False)]
+            if files:
+                candidates.append((parsed, version, files[0].get("requires_python") or None))
+        candidates.sort(reverse=True)
+        return [[version, requires_python] for _, version, requires_python in candidates]
+
+    def __fetch(self, name: str, entry: Optional[dict[str, Any]]) -> dict[str, Any]:
+        """
+        Queries the index for the installable releases of a package, revalidating a given existing
+        entry if there is one.
+
+        :param name: the normalised name of the package
+        :param entry: the existing cache entry for the package, if any
+        :returns: the new cache entry for the package
+        """
+        # urllib.request is slow to import and only needed with the metadata discovery engine
+        from urllib.error import HTTPError, URLError
+        from urllib.request import Request, urlopen
+
+        request: Request = Request(f"{self.index_url}/{name}/json")
+        if entry is not None and "releases" not in entry:
+            # entries written by older versions of pipupdater only record the latest version
+            entry = None
+        if entry is not None and entry.get("etag"):
+            request.add_header("If-None-Match", entry["etag"])
+        if entry is not None and entry.get("last_modified"):
+            request.add_header("If-Modified-Since", entry["last_modified"])
+
+        try:
+            with urlopen(request, timeout=30) as response:
+                data: dict[str, Any] = json.load(response)
+                return {
+                    "checked": time.time(),
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "releases": self.__candidates(data),
+                }
+        except HTTPError as e:
+            if e.code == 304 and entry is not None:
+                return {**entry, "checked": time.time()}
+            if e.code == 404:
+                # packages that aren't on the index (e.g. local packages) are cached as having no
+                # releases, so they aren't looked up again until the entry expires
+                return {"checked": time.time(), "releases": []}
+            raise
+        except URLError as e:
+            # the file:// equivalent of a 404
+            if isinstance(e.reason, FileNotFoundError):
+                return {"checked": time.time(), "releases": []}
+            raise
+
+    def __load(self) -> dict[str, dict[str, Any]]:
+        """
+        Loads the cache entries from the cache file. Entries for a different index are discarded.
+
+        :returns: the cache entries, keyed by normalised package name
+        """
+        try:
+            with open(self.path, "r") as cache_file:
+                data: dict[str, Any] = json.load(cache_file)
+            if data.get("index_url") == self.index_url:
+                return data["packages"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.new(f"Could not read index cache; it will be rebuilt. Error was: {e}",
+                            "WARNING")
+        return {}
+
+    def get_latest(self, name: str, python_version: Optional[str] = None) -> Optional[str]:
+        """
+        Gets the latest version of a package available on the index that can be installed with a
+        given version of Python, using the cached releases if they are still fresh. A release with
+        an invalid Requires-Python specifier is treated as supporting every version, as pip does.
+
+        :param name: the name of the package
+        :param python_version: optional; the Python version to install with, e.g. "3.9.18"; if not
+                               given, Requires-Python is ignored
+        :returns: the latest version, or None if no release on the index can be installed
+        """
+        # packaging.specifiers is only needed with the metadata discovery engine
+        from packaging.specifiers import InvalidSpecifier, SpecifierSet
+
+        name = normalise_name(name)
+        with self._lock:
+            entry: Optional[dict[str, Any]] = self._entries.get(name)
+
+        if entry is None or "releases" not in entry or time.time() - entry["checked"] >= self.ttl:
+            entry = self.__fetch(name, entry)
+            with self._lock:
+                self._entries[name] = entry
+                self._modified = True
+
+        for version, requires_python in entry["releases"]:
+            if python_version is None or requires_python is None:
+                return version
+            try:
+                if SpecifierSet(requires_python).contains(python_version, prereleases=True):
+                    return version
+            except InvalidSpecifier:
+                return version
+        return None
+
+    def save(self) -> None:
+        """
+        Writes the cache entries to the cache file, if any have changed. The file is replaced
+        atomically, so an interrupted write never leaves a corrupt cache behind.
+        """
+        with self._lock:
+            if not self._modified:
+                return
+            data: dict[str, Any] = {"index_url": self.index_url, "packages": self._entries}
+            try:
+                with open(f"{self.path}.tmp", "w") as cache_file:
+                    json.dump(data, cache_file)
+                os.replace(f"{self.path}.tmp", self.path)
+                self._modified = False
+            except Exception as e:
+                self.logger.new(f"Could not save index cache. Error was: {e}", "WARNING")
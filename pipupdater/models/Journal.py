@@ -0,0 +1,210 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from ..helpers import normalise_name
+from .Logger import Logger
+from .PackageUpdate import PackageUpdate, Status
+
+from typing import Any, Optional, TextIO
+
+
+# the number of most recent runs kept in the journal file; older runs are dropped when it is loaded
+MAX_RUNS: int = 20
+
+
+class Journal():
+    """
+    A durable, append-only record of pipupdater runs, stored as JSON lines in pipupdater's config
+    folder. Each run writes a start record, a record for every package update as soon as it
+    finishes, and an end record once the run completes. Every record is flushed to disk as it is
+    written, so a run that is killed part way through still leaves behind a record of the updates
+    it did finish.
+
+    The journal is used to skip work on later runs:
+    - with --resume, packages already brought to their target version by any earlier run (complete
+      or not) are skipped;
+    - with --incremental, packages whose latest version is the same as it was during the last
+      completed run are skipped, since that run already dealt with them.
+
+    Each environment updated has its own journal file.
+
+    :param config_folder: the path to pipupdater's config folder
+    :param logger: the logger instance
+    :param environment: optional; the interpreter of the environment being updated, if it isn't the
+                        one found on PATH
+    """
+    def __init__(self, config_folder: str, logger: Logger, environment: str = None) -> None:
+        self.logger: Logger = logger
+        self.path: str = (
+            f"{config_folder}/journal.jsonl"
+            if environment is None else
+            f"{config_folder}/journal-{hashlib.sha1(environment.encode()).hexdigest()[:12]}.jsonl"
+        )
+        self.run_id: Optional[str] = None
+
+        # the version each package was last successfully brought to, by any run
+        self._reached: dict[str, str] = {}
+        # the latest version each package had during the last completed run that updated it, or
+        # found it already up to date
+        self._seen: dict[str, str] = {}
+
+        self._file: Optional[TextIO] = None
+        self._lock: threading.Lock = threading.Lock()
+        self.__load()
+
+    def __load(self) -> None:
+        """
+        Reads the journal file to rebuild the state of each package. If the file holds more than
+        MAX_RUNS runs, it is rewritten without the oldest ones.
+        """
+        records: list[dict[str, Any]] = []
+        try:
+            with open(self.path, "r") as journal_file:
+                for line in journal_file:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # a run killed mid-write can leave a truncated final line behind
+                        continue
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self.logger.new(f"Could not read run journal. Error was: {e}", "WARNING")
+            return
+
+        runs: list[str] = list(dict.fromkeys(record["run"] for record in records))
+        if len(runs) > MAX_RUNS:
+            kept: set[str] = set(runs[-MAX_RUNS:])
+            records = [record for record in records if record["run"] in kept]
+            self.__rewrite(records)
+
+        # the latest version of each package a run dealt with, or None if it failed to
+        pending: dict[str, dict[str, Optional[str]]] = {}
+        for record in records:
+            if record["type"] == "package":
+                dealt_with: bool = record["status"] in (Status.SUCCESS.name, Status.UNCHANGED.name)
+                if dealt_with:
+                    self._reached[record["name"]] = record["latest"]
+                pending.setdefault(record["run"], {})[record["name"]] = (
+                    record["latest"] if dealt_with else None
+                )
+            elif record["type"] == "end":
+                for name, latest in pending.pop(record["run"], {}).items():
+                    if latest is None:
+                        # a failed update has to be tried again, even if an earlier run saw the
+                        # same latest version
+                        self._seen.pop(name, None)
+                    else:
+                        self._seen[name] = latest
+
+    def __rewrite(self, records: list[dict[str, Any]]) -> None:
+        """
+        Atomically replaces the contents of the journal file with a given list of records.
+
+        :param records: the records to write
+        """
+        try:
+            with open(f"{self.path}.tmp", "w") as journal_file:
+                for record in records:
+                    journal_file.write(json.dumps(record) + "\n")
+            os.replace(f"{self.path}.tmp", self.path)
+        except Exception as e:
+            self.logger.new(f"Could not compact run journal. Error was: {e}", "WARNING")
+
+    def __write(self, record: dict[str, Any]) -> None:
+        """
+        Appends a record to the journal file and flushes it to disk.
+
+        :param record: the record to write
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.write(json.dumps({**record, "run": self.run_id, "time": time.time()})
+                                 + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except Exception as e:
+                self.logger.new(f"Could not write to run journal. Error was: {e}", "WARNING")
+
+    def finish_run(self) -> None:
+        """
+        Marks the current run as complete and closes the journal file.
+        """
+        self.__write({"type": "end"})
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def is_reached(self, package: PackageUpdate) -> bool:
+        """
+        Determines whether an earlier run already brought a package to its target version.
+
+        :param package: the update record of the package
+        :returns: whether the package has already been updated to its latest version
+        """
+        return self._reached.get(normalise_name(package.name)) == package.latest
+
+    def is_seen(self, package: PackageUpdate) -> bool:
+        """
+        Determines whether the last completed run already dealt with a package at its current
+        latest version.
+
+        :param package: the update record of the package
+        :returns: whether the package's latest version is unchanged since the last completed run
+        """
+        return self._seen.get(normalise_name(package.name)) == package.latest
+
+    def record(self, package: PackageUpdate) -> None:
+        """
+        Records the outcome of a package's update in the journal.
+
+        :param package: the update record of the package, with its outcome filled in
+        """
+        self.__write({
+            "type": "package",
+            "name": normalise_name(package.name),
+            "current": package.current,
+            "latest": package.latest,
+            "status": package.status.name,
+        })
+
+    def start_run(self) -> str:
+        """
+        Opens the journal file for appending and writes the start record of a new run.
+
+        :returns: the identifier of the new run
+        """
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        try:
+            self._file = open(self.path, "a")
+        except Exception as e:
+            self.logger.new(
+                f"Could not open run journal; this run will not be recorded. Error was: {e}",
+                "WARNING"
+            )
+        self.__write({"type": "start"})
+        return self.run_id
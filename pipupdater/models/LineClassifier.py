@@ -0,0 +1,70 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import re
+
+from typing import Iterable, Optional
+
+
+class LineClassifier():
+    """
+    Classifies and parses the lines of a list of outdated packages in one of pip's human-readable
+    formats, as read from a source file. Everything is prepared once, when the classifier is
+    created: the configured prefixes are held as a tuple, so checking a line against all of them is
+    a single str.startswith() call, and each supported format is parsed with one precompiled
+    pattern.
+
+    The supported formats are:
+    - the legacy 'pip list --outdated' format:
+        [package name] (Current: [current version] Latest: [latest version] [type])
+    - the 'pip list --outdated --format columns' format, with any further columns ignored:
+        [package name] [current version] [latest version]
+
+    :param prefixes: the prefixes of lines that should be skipped
+    """
+    LEGACY: re.Pattern = re.compile(r" *(\S+) +\(Current: +(\S+) +Latest: +([^\s)]+)")
+    COLUMNS: re.Pattern = re.compile(r" *(\S+) +(\S+) +(\S+)(?: |$)")
+
+    def __init__(self, prefixes: Iterable[str]) -> None:
+        self.prefixes: tuple[str, ...] = tuple(prefixes)
+
+    def is_skipped(self, line: str) -> bool:
+        """
+        Determines whether a line should be skipped: that is, whether it is empty or starts with one
+        of the configured prefixes.
+
+        :param line: the line, without its line ending
+        :returns: whether the line should be skipped
+        """
+        return not line or line.startswith(self.prefixes)
+
+    def parse(self, line: str) -> Optional[tuple[str, str, str]]:
+        """
+        Parses the details of an outdated package from a line.
+
+        :param line: the line, without its line ending
+        :returns: the package's name, current version and latest version, or None if the line is
+                  not in a supported format
+        """
+        # a substring check picks the pattern, so each line is only matched once
+        match: Optional[re.Match] = (
+            self.LEGACY.match(line) if "(Current:" in line else self.COLUMNS.match(line)
+        )
+        if match is None:
+            return None
+        return match.groups()
@@ -0,0 +1,139 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import re
+
+from ..helpers import normalise_name
+
+from typing import Any, Optional
+
+
+# options that can follow a requirement on the same line, e.g. --hash=sha256:...
+INLINE_OPTION: re.Pattern = re.compile(r"\s+--?[A-Za-z]")
+
+
+class Lockfile():
+    """
+    The exact versions an environment is locked to, read from a lockfile. Two formats are
+    supported:
+    - requirements files, as written by 'pip freeze' or pip-compile: one "name==version" per line,
+      optionally with environment markers and hashes, and with other requirements files included
+      with "-r";
+    - pylock.toml files (PEP 751), whose [[packages]] tables each give a name and version.
+
+    Entries whose environment markers don't match the environment pipupdater is running in are
+    ignored. Entries that aren't pinned to a single version (e.g. "name>=1.0", or a URL) can't be
+    compared with what is installed, so they're listed in self.unpinned and otherwise ignored.
+
+    :param path: the path to the lockfile; files ending in ".toml" are read as pylock.toml files
+    :raises OSError: if the lockfile can't be read
+    :raises ValueError: if a pylock.toml file is invalid
+    """
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        # the name and locked version of each package, keyed by normalised name
+        self.pins: dict[str, tuple[str, str]] = {}
+        self.unpinned: list[str] = []
+
+        if path.endswith(".toml"):
+            self.__read_pylock(path)
+        else:
+            self.__read_requirements(path, set())
+
+    def __add(self, name: str, version: Optional[str], marker: Optional[str]) -> None:
+        """
+        Adds a package to the pins, if its environment marker matches the current environment.
+
+        :param name: the name of the package
+        :param version: the version the package is locked to, or None if it isn't locked to one
+        :param marker: the package's environment marker, if it has one
+        """
+        # packaging.markers is slow to import and only needed with --lockfile
+        from packaging.markers import Marker
+
+        if marker and not Marker(marker).evaluate({"extra": ""}):
+            return
+        if version is None:
+            self.unpinned.append(name)
+            return
+        self.pins[normalise_name(name)] = (name, version)
+
+    def __read_pylock(self, path: str) -> None:
+        """
+        Reads the packages from a pylock.toml file.
+
+        :param path: the path to the file
+        """
+        import tomlkit
+
+        with open(path, "r") as lock_file:
+            packages: list[dict[str, Any]] = tomlkit.load(lock_file).unwrap().get("packages", [])
+        for package in packages:
+            if "name" not in package:
+                raise ValueError(f"package entry without a name in {path}")
+            self.__add(package["name"], package.get("version"), package.get("marker"))
+
+    def __read_requirements(self, path: str, seen: set[str]) -> None:
+        """
+        Reads the pinned requirements from a requirements file, and from any files it includes.
+
+        :param path: the path to the file
+        :param seen: the real paths of the files already read, so files that include each other
+                     are only read once
+        """
+        # packaging.requirements is slow to import and only needed with --lockfile
+        from packaging.requirements import InvalidRequirement, Requirement
+
+        real_path: str = os.path.realpath(path)
+        if real_path in seen:
+            return
+        seen.add(real_path)
+
+        with open(path, "r") as requirements_file:
+            # lines ending in a backslash continue on the next line
+            content: str = re.sub(r"\\\r?\n", " ", requirements_file.read())
+        for line in content.splitlines():
+            line = re.sub(r"(^|\s)#.*", "", line).strip()
+            if not line:
+                continue
+            if line.startswith(("-r ", "--requirement ", "-r=", "--requirement=")):
+                included: str = re.split(r"[ =]", line, 1)[1].strip()
+                self.__read_requirements(os.path.join(os.path.dirname(path), included), seen)
+                continue
+            if line.startswith("-"):
+                # other options, e.g. --index-url, don't affect which versions are locked
+                continue
+
+            try:
+                requirement: Requirement = Requirement(INLINE_OPTION.split(line, 1)[0])
+            except InvalidRequirement:
+                self.unpinned.append(line)
+                continue
+            specifiers: list[Any] = list(requirement.specifier)
+            version: Optional[str] = None
+            if (
+                requirement.url is None and len(specifiers) == 1
+                and specifiers[0].operator in ("==", "===") and "*" not in specifiers[0].version
+            ):
+                version = specifiers[0].version
+            self.__add(
+                requirement.name,
+                version,
+                str(requirement.marker) if requirement.marker is not None else None
+            )
@@ -17,16 +17,25 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
 import smooth_logger
+import threading
+
+from .PackageUpdate import PackageUpdate, Status
+from .PipLog import PipLog
+from .ResultStore import ResultStore
 
 from os import makedirs
 from os.path import isdir
 from smooth_logger.enums import Categories
+from typing import Any, Iterable, Optional
 
 
 class Logger(smooth_logger.Logger):
     """
     Extends the base smooth_logger.Logger class with some useful methods for formatting and
     printing the final output.
+
+    Log entries are kept in a list that isn't safe to share between threads, so creating, writing
+    out and clearing entries is serialised, as saving pip output is.
     """
     def __init__(self,
                  program_name: str,
@@ -36,6 +45,8 @@ class Logger(smooth_logger.Logger):
                  fatal: int = Categories.MAXIMUM,
                  info: int = Categories.PRINT,
                  warning: int = Categories.MAXIMUM):
+        # reentrant, since the base class logs a warning through new() when given an unknown scope
+        self._lock: threading.RLock = threading.RLock()
         super().__init__(
             program_name,
             config_path,
@@ -45,22 +56,31 @@ class Logger(smooth_logger.Logger):
             warning,
         )
         self.save_path = self.__define_pip_save_path()
+        self.pip_log: Optional[PipLog] = None
+
+    def clean(self) -> None:
+        """
+        Empties the list of log entries. Any entries not yet written to the log file are lost.
+        """
+        with self._lock:
+            super().clean()
 
-    def format_results(self, package_list: list[str]) -> str:
+    def format_results(self, package_list: Iterable[PackageUpdate]) -> str:
         """
         Formats a given list of packages to display in the following manner:
 
             package_name (old_version -> new_version)
 
+        Packages whose update partially failed are marked with "[partial]".
+
         :param package_list: the list of packages to format
         :return: the formatted list
         """
-        results: str = ""
-
-        for package in package_list:
-            results += f"   {package[0]} ({package[1]} -> {package[2]})\n"
-
-        return results.removesuffix("\n")
+        return "\n".join(
+            f"   {package.name} ({package.current} -> {package.latest})"
+            + (" [partial]" if package.status == Status.PARTIAL else "")
+            for package in package_list
+        )
 
     def __define_pip_save_path(self) -> str:
         """
@@ -85,18 +105,61 @@ class Logger(smooth_logger.Logger):
                 return None
         return save_path
 
-    def print_results(self, failed: list[str], success: list[str]) -> None:
+    def new(self,
+            message: str,
+            scope: str,
+            print_to_console: bool = True,
+            notify: bool = False) -> bool:
+        """
+        Creates a new log entry and prints it to the console; see smooth_logger.Logger.new().
+
+        :param message: the log message
+        :param scope: the scope of the message
+        :param print_to_console: optional; whether the message should be printed to the console
+        :param notify: optional; whether the message should be displayed as a desktop notification
+        :returns: whether the entry was created
+        """
+        with self._lock:
+            return super().new(message, scope, print_to_console, notify)
+
+    def open_pip_log(self, max_size: int, max_age: float, compress: bool, keep: int) -> None:
+        """
+        Sets up the pip log in the pip log folder, which pip output is saved to. See the PipLog
+        class for how it is written and rotated.
+
+        :param max_size: the size, in bytes, at which the pip log is rotated
+        :param max_age: the age, in seconds, at which the pip log is rotated
+        :param compress: whether to compress rotated pip logs with gzip
+        :param keep: the number of rotated pip logs to keep
+        """
+        if self.save_path:
+            self.pip_log = PipLog(self.save_path, max_size, max_age, compress, keep)
+
+    def output(self) -> None:
+        """
+        Writes the log entries to the log file, then empties the list of entries.
+        """
+        with self._lock:
+            super().output()
+
+    def print_results(self,
+                      failed: ResultStore,
+                      success: ResultStore,
+                      unchanged: ResultStore = (),
+                      skipped: ResultStore = (),
+                      dependencies: ResultStore = ()) -> None:
         """
         Outputs the results of the program.
 
         :param failed: the list of packages that couldn't be updated
         :param success: the list of packages that were successfully updated
-        :param logger: the logger instance
+        :param unchanged: optional; the list of packages that turned out to be already up to date
+        :param skipped: optional; the list of packages that were not updated
+        :param dependencies: optional; the list of packages pip installed or updated as dependencies
         """
         if len(success) > 0:
             self.new(
-                "The following packages were updated (list does not include auto-installed "
-                + f"dependencies):\n{self.format_results(success)}",
+                f"The following packages were updated:\n{self.format_results(success)}",
                 "INFO"
             )
         if len(failed) > 0:
@@ -104,17 +167,45 @@ class Logger(smooth_logger.Logger):
                 f"Updates failed for the following packages:\n{self.format_results(failed)}",
                 "INFO"
             )
-        if len(success) == 0 and len(failed) == 0:
+        if len(dependencies) > 0:
+            self.new(
+                "The following dependencies were installed or updated by pip:\n"
+                + self.format_results(dependencies),
+                "INFO"
+            )
+        if len(unchanged) > 0:
+            self.new(
+                "The following packages were already up to date:\n"
+                + self.format_results(unchanged),
+                "INFO"
+            )
+        if len(skipped) > 0:
+            self.new(
+                f"The following packages were skipped:\n{self.format_results(skipped)}",
+                "INFO"
+            )
+        if len(success) == 0 and len(failed) == 0 and len(unchanged) == 0 and len(skipped) == 0:
             self.new("Nothing to do; did not find any out-of-date packages.", "INFO")
 
-    def save_pip_output(self, output: str) -> None:
+    def save_pip_output(self,
+                        output: str,
+                        packages: Iterable[str] = ()) -> Optional[dict[str, Any]]:
         """
-        Saves a given output string to the pip log file. Should be used only for saving the output
-        of pip command subprocesses.
+        Saves a given output string to the pip log. Should be used only for saving the output of pip
+        command subprocesses.
+
+        Writes are serialised, so output from updates running in different threads is never
+        interleaved in the log.
 
         :param output: the output to save
+        :param packages: optional; the names of the packages the output is for, so it can be found
+                         again with PipLog.find()
+        :returns: where the output was saved in the pip log (see PipLog.write()), or None if it
+                  wasn't saved
         """
-        if self.save_path and self._scopes["PIPOUTPUT"] == Categories.SAVE:
-            with open(f"{self.save_path}/pip_log-{self._get_time(date_only=True)}.txt",
-                      "at+") as save_file:
-                save_file.write(output)
+        if self.pip_log is not None and self._scopes["PIPOUTPUT"] == Categories.SAVE:
+            try:
+                return self.pip_log.write(output, packages)
+            except Exception as e:
+                self.new(f"Could not save pip output. Error was: {e}", "WARNING")
+        return None
@@ -0,0 +1,273 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+from ..helpers import normalise_name
+
+from enum import Enum
+from packaging.version import InvalidVersion, Version
+from typing import NamedTuple, Optional
+
+
+class Status(Enum):
+    PENDING   = 0  # the update has not been run yet
+    SUCCESS   = 1  # the package was updated
+    FAILED    = 2  # the package could not be updated
+    UNCHANGED = 3  # pip succeeded without changing the package; it was already up to date
+    PARTIAL   = 4  # pip installed or updated some packages, but failed or left conflicts behind
+    SKIPPED   = 5  # the update was not run
+
+
+class Failure(Enum):
+    OTHER      = 0  # the cause of the failure is unknown, or pip could not be run at all
+    NETWORK    = 1  # the index could not be reached or a download broke off; worth retrying
+    BUILD      = 2  # a package could not be built from source
+    RESOLUTION = 3  # no version of a package satisfies the requirements of the environment
+
+
+# the start of the error pip prints, while still exiting with status 0, when an install leaves the
+# environment with packages whose requirements are no longer satisfied
+RESOLVER_CONFLICT: str = "ERROR: pip's dependency resolver does not currently take into account"
+
+# markers of each kind of failure in pip's output; network failures are checked for first, since
+# an unreachable index also makes pip report that no version satisfies the requirement
+FAILURE_MARKERS: tuple[tuple[Failure, tuple[str, ...]], ...] = (
+    (Failure.NETWORK, (
+        "Retrying (Retry(",
+        "ReadTimeoutError",
+        "ConnectTimeoutError",
+        "NewConnectionError",
+        "ProtocolError",
+        "IncompleteRead",
+        "Connection reset by peer",
+        "Connection broken",
+        "Temporary failure in name resolution",
+        "Max retries exceeded",
+        "HTTP error 500",
+        "HTTP error 502",
+        "HTTP error 503",
+        "HTTP error 504",
+    )),
+    (Failure.BUILD, (
+        "Failed building wheel",
+        "Failed to build ",
+        "subprocess-exited-with-error",
+        "metadata-generation-failed",
+        "legacy-install-failure",
+    )),
+    (Failure.RESOLUTION, (
+        "ResolutionImpossible",
+        "conflicting dependencies",
+        "Could not find a version that satisfies the requirement",
+        "No matching distribution found",
+        RESOLVER_CONFLICT,
+    )),
+)
+
+
+def classify_failure(exit_code: Optional[int], output: str) -> Failure:
+    """
+    Classifies the cause of a failed pip command from its exit code and output.
+
+    :param exit_code: the exit code of the pip command, or None if it could not be run
+    :param output: the output of the pip command
+    :returns: the kind of failure
+    """
+    if exit_code is None:
+        return Failure.OTHER
+    for failure, markers in FAILURE_MARKERS:
+        if any(marker in output for marker in markers):
+            return failure
+    return Failure.OTHER
+
+
+def classify_result(name: str, exit_code: Optional[int], output: str) -> Status:
+    """
+    Classifies the outcome of a pip install command for a given package, using the command's exit
+    code and the packages it reports having installed. A package that was installed by a command
+    that exited successfully, but reported leaving dependency conflicts behind, is only partially
+    updated.
+
+    :param name: the name of the package
+    :param exit_code: the exit code of the pip command, or None if it could not be run
+    :param output: the output of the pip command
+    :returns: the outcome of the update for the package
+    """
+    if exit_code is None:
+        return Status.FAILED
+
+    installed: dict[str, str] = parse_installed(output)
+    if exit_code == 0:
+        if normalise_name(name) not in installed:
+            return Status.UNCHANGED
+        return Status.PARTIAL if RESOLVER_CONFLICT in output else Status.SUCCESS
+    return Status.PARTIAL if installed else Status.FAILED
+
+
+def parse_installed(output: str) -> dict[str, str]:
+    """
+    Finds the packages a pip install command installed, from the "Successfully installed" line of
+    its output.
+
+    :param output: the output of the pip command
+    :returns: the version installed of each package, keyed by normalised package name
+    """
+    installed: dict[str, str] = {}
+    for line in output.splitlines():
+        if line.startswith("Successfully installed "):
+            # each item has the form [package name]-[version]; versions never contain hyphens
+            for item in line.removeprefix("Successfully installed ").split():
+                name, _, version = item.rpartition("-")
+                installed[normalise_name(name)] = version
+    return installed
+
+
+def parse_replaced(output: str) -> dict[str, str]:
+    """
+    Finds the packages a pip install command replaced with a different version, from the "Found
+    existing installation" lines of its output.
+
+    :param output: the output of the pip command
+    :returns: the version replaced of each package, keyed by normalised package name
+    """
+    replaced: dict[str, str] = {}
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("Found existing installation: "):
+            name, _, version = line.removeprefix("Found existing installation: ").partition(" ")
+            replaced[normalise_name(name)] = version
+    return replaced
+
+
+def parse_unmatched(output: str) -> set[str]:
+    """
+    Finds the requirements a pip command found no version of, from the "No matching distribution
+    found" lines of its output.
+
+    :param output: the output of the pip command
+    :returns: the normalised names of the packages with no matching version
+    """
+    unmatched: set[str] = set()
+    for line in output.splitlines():
+        _, found, requirement = line.partition("No matching distribution found for ")
+        if found:
+            name: str = requirement.strip()
+            for i, char in enumerate(name):
+                if not (char.isalnum() or char in "._-"):
+                    name = name[:i]
+                    break
+            unmatched.add(normalise_name(name))
+    return unmatched
+
+
+def parse_version(version: str) -> Optional[Version]:
+    """
+    Parses a version string into a Version object.
+
+    :param version: the version string to parse
+    :returns: the parsed version, or None if the string is not a valid version
+    """
+    try:
+        return Version(version)
+    except (InvalidVersion, TypeError):
+        return None
+
+
+class PackageUpdate(NamedTuple):
+    """
+    An immutable record of a single package update: which package, which versions it is being
+    updated between, and (once the update has been run) its outcome. Being a named tuple, it has
+    no per-instance __dict__, so large numbers of records stay cheap to hold.
+
+    Records should be made with PackageUpdate.create(), which parses the version strings, and the
+    outcome added with with_result(), which returns a new record.
+    """
+    name: str
+    current: str
+    latest: str
+    current_version: Optional[Version] = None
+    latest_version: Optional[Version] = None
+    status: Status = Status.PENDING
+    duration: Optional[float] = None
+    exit_code: Optional[int] = None
+    # a version specifier the update is limited to, e.g. "<2", if it can't go to the latest version
+    constraint: Optional[str] = None
+
+    @classmethod
+    def create(cls, name: str, current: str, latest: str) -> "PackageUpdate":
+        """
+        Creates a pending update record for a package, parsing its version strings.
+
+        :param name: the name of the package
+        :param current: the installed version of the package
+        :param latest: the version the package is being updated to
+        :returns: the update record
+        """
+        return cls(name, current, latest, parse_version(current), parse_version(latest))
+
+    @property
+    def is_outdated(self) -> bool:
+        """
+        Whether the installed version is older than the latest version. As with
+        'pip list --outdated', a pre-release only counts as newer if the installed version is
+        itself a pre-release. Records with unparseable versions are never counted as outdated.
+        """
+        if self.current_version is None or self.latest_version is None:
+            return False
+        if self.latest_version.is_prerelease and not self.current_version.is_prerelease:
+            return False
+        return self.current_version < self.latest_version
+
+    @property
+    def requirement(self) -> str:
+        """
+        The requirement specifier that pins the package to its latest version, e.g. "name==1.2.3",
+        or that limits it to its constraint, e.g. "name>=1.2,<2", if it has one.
+        """
+        if self.constraint is not None:
+            return f"{self.name}{self.constraint}"
+        return f"{self.name}=={self.latest}"
+
+    def with_installed(self, installed: dict[str, str]) -> "PackageUpdate":
+        """
+        Creates a copy of this record whose latest version is the version pip actually installed,
+        for an update limited by a constraint, where that version isn't known until the update has
+        run. Records without a constraint, or whose package pip didn't install, are returned as
+        they are.
+
+        :param installed: the version pip installed of each package, keyed by normalised name; see
+                          parse_installed()
+        :returns: the new record
+        """
+        version: Optional[str] = installed.get(normalise_name(self.name))
+        if self.constraint is None or version is None:
+            return self
+        return self._replace(latest=version, latest_version=parse_version(version))
+
+    def with_result(self,
+                    status: Status,
+                    exit_code: Optional[int] = None,
+                    duration: Optional[float] = None) -> "PackageUpdate":
+        """
+        Creates a copy of this record with the outcome of its update filled in.
+
+        :param status: the outcome of the update
+        :param exit_code: optional; the exit code of the pip command that ran the update
+        :param duration: optional; how long the update took, in seconds
+        :returns: the new record
+        """
+        return self._replace(status=status, exit_code=exit_code, duration=duration)
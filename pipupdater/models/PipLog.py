@@ -0,0 +1,278 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import atexit
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+
+from ..helpers import normalise_name
+
+from datetime import datetime
+from typing import Any, BinaryIO, Iterable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where writes are only serialised between threads
+    fcntl = None
+
+
+class PipLog():
+    """
+    The file pip's output is saved to. The file is rotated once it grows past a maximum size or
+    age. Rotated files are renamed with the time they were rotated, optionally compressed with
+    gzip, and only the newest few are kept.
+
+    Each write is a "segment" of output, and is recorded in an index file alongside the log with
+    its offset, length, and the packages it was for. This lets the output for one package be read
+    straight from the log (or a rotated log) without scanning it.
+
+    Several pipupdater processes can share the log, e.g. a --watch process and a manual run. Every
+    write holds an advisory lock on a lock file next to the log, and is appended unbuffered, so the
+    offset of each segment is the size of the log when the lock was taken, whichever process last
+    wrote to it. If another process has rotated the log since the last write, the new log is opened
+    before writing. Writes are also serialised between threads.
+
+    :param folder: the path to the pip log folder
+    :param max_size: the size, in bytes, at which the log is rotated
+    :param max_age: the age, in seconds, at which the log is rotated
+    :param compress: whether to compress rotated logs with gzip
+    :param keep: the number of rotated logs to keep
+    """
+    def __init__(self,
+                 folder: str,
+                 max_size: int,
+                 max_age: float,
+                 compress: bool,
+                 keep: int) -> None:
+        self.folder: str = folder
+        self.max_size: int = max_size
+        self.max_age: float = max_age
+        self.compress: bool = compress
+        self.keep: int = keep
+        self.path: str = f"{folder}/pip_log.txt"
+        self.index_path: str = f"{folder}/pip_log.index.jsonl"
+        self.lock_path: str = f"{folder}/pip_log.lock"
+
+        self._created: float = 0.0
+        self._file: Optional[BinaryIO] = None
+        self._index: Optional[BinaryIO] = None
+        self._lock: threading.Lock = threading.Lock()
+        self._lock_file: Optional[BinaryIO] = None
+
+        atexit.register(self.close)
+
+    @staticmethod
+    def __append(file: BinaryIO, data: bytes) -> None:
+        """
+        Appends data to an unbuffered file, retrying until all of it has been written.
+
+        :param file: the file to append to
+        :param data: the data to append
+        """
+        view: memoryview = memoryview(data)
+        while view:
+            view = view[file.write(view):]
+
+    def __close(self) -> None:
+        """
+        Closes the log and index files. Must be called with the lock held.
+        """
+        for file in (self._file, self._index):
+            if file is not None:
+                file.close()
+        self._file = None
+        self._index = None
+
+    def __is_stale(self) -> bool:
+        """
+        Determines whether the open log is no longer the current log, because another process has
+        rotated it. Must be called with the lock file locked.
+
+        :returns: whether the log has to be reopened before writing
+        """
+        if self._file is None:
+            return True
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def __open(self) -> None:
+        """
+        Opens the log and index files for appending, creating them if they don't exist. Must be
+        called with the lock file locked.
+        """
+        self.__close()
+        self._file = open(self.path, "ab", buffering=0)
+        self._index = open(self.index_path, "ab", buffering=0)
+
+        # the first line of the index file records when the log was started, for rotating by age
+        self._created = 0.0
+        try:
+            with open(self.index_path, "r") as index_file:
+                self._created = json.loads(index_file.readline())["created"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        if self._created == 0.0:
+            self._created = time.time()
+            self.__append(self._index, (json.dumps({"created": self._created}) + "\n").encode())
+
+    def __prune(self) -> None:
+        """
+        Deletes the oldest rotated logs, and their index files, until only self.keep remain. Logs
+        saved by older versions of pipupdater, which weren't rotated, are treated the same way.
+        """
+        logs: list[os.DirEntry] = sorted(
+            (
+                entry for entry in os.scandir(self.folder)
+                if entry.name.startswith("pip_log-") and entry.name.endswith((".txt", ".txt.gz"))
+            ),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in logs[self.keep:]:
+            stem: str = entry.name.removesuffix(".gz").removesuffix(".txt")
+            for path in (entry.path, f"{self.folder}/{stem}.index.jsonl"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+
+    def __rotate(self) -> None:
+        """
+        Closes the log, renames it and its index file with the current time, compresses it if
+        enabled, and deletes the oldest rotated logs. Must be called with the lock file locked.
+        """
+        self.__close()
+        stem: str = f"pip_log-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(self.path, f"{self.folder}/{stem}.txt")
+        os.replace(self.index_path, f"{self.folder}/{stem}.index.jsonl")
+
+        if self.compress:
+            with open(f"{self.folder}/{stem}.txt", "rb") as source:
+                with gzip.open(f"{self.folder}/{stem}.txt.gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+            os.remove(f"{self.folder}/{stem}.txt")
+        self.__prune()
+
+    def __segments(self) -> Iterator[tuple[str, str]]:
+        """
+        Lists the logs and their index files, oldest first, ending with the current log.
+
+        :returns: the path to each log and the path to its index file
+        """
+        indexes: list[os.DirEntry] = sorted(
+            (
+                entry for entry in os.scandir(self.folder)
+                if entry.name.startswith("pip_log-") and entry.name.endswith(".index.jsonl")
+            ),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in indexes:
+            stem: str = entry.name.removesuffix(".index.jsonl")
+            for log in (f"{self.folder}/{stem}.txt.gz", f"{self.folder}/{stem}.txt"):
+                if os.path.exists(log):
+                    yield log, entry.path
+                    break
+        if os.path.exists(self.path):
+            yield self.path, self.index_path
+
+    def close(self) -> None:
+        """
+        Closes the log. It is reopened if written to again.
+        """
+        with self._lock:
+            self.__close()
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def find(self, package: str) -> Iterator[tuple[float, str]]:
+        """
+        Reads the saved output for a package from the current and rotated logs, using their index
+        files to read only the package's segments.
+
+        :param package: the name of the package
+        :returns: the time each segment of output was written, and the output, oldest first
+        """
+        name: str = normalise_name(package)
+        for log, index in self.__segments():
+            entries: list[dict[str, Any]] = []
+            with open(index, "r") as index_file:
+                for line in index_file:
+                    try:
+                        entry: dict[str, Any] = json.loads(line)
+                    except ValueError:
+                        continue
+                    if name in entry.get("packages", ()):
+                        entries.append(entry)
+            if not entries:
+                continue
+
+            opener: Any = gzip.open if log.endswith(".gz") else open
+            with opener(log, "rb") as log_file:
+                for entry in entries:
+                    log_file.seek(entry["offset"])
+                    yield entry["time"], log_file.read(entry["length"]).decode("utf-8", "replace")
+
+    def write(self, output: str, packages: Iterable[str] = ()) -> dict[str, Any]:
+        """
+        Appends a segment of output to the log, rotating the log first if it has grown too large or
+        too old.
+
+        :param output: the output to save
+        :param packages: optional; the names of the packages the output is for
+        :returns: where the segment was written: the log's path, when the log was started (which
+                  identifies it once it has been rotated), and the segment's offset and length
+        """
+        data: bytes = output.encode("utf-8", "replace")
+        now: float = time.time()
+        with self._lock:
+            if self._lock_file is None:
+                self._lock_file = open(self.lock_path, "ab")
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                if self.__is_stale():
+                    self.__open()
+                size: int = os.fstat(self._file.fileno()).st_size
+                if size > 0 and (
+                    size + len(data) > self.max_size or now - self._created >= self.max_age
+                ):
+                    self.__rotate()
+                    self.__open()
+                    size = 0
+
+                self.__append(self._index, (json.dumps({
+                    "packages": [normalise_name(package) for package in packages],
+                    "offset": size,
+                    "length": len(data),
+                    "time": now,
+                }) + "\n").encode())
+                self.__append(self._file, data)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            return {
+                "log": self.path, "created": self._created, "offset": size, "length": len(data)
+            }
@@ -0,0 +1,155 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import subprocess
+
+from .Logger import Logger
+
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional
+
+
+# the number of most recent lines of output kept in memory for each command
+TAIL_LINES: int = 200
+# how much output, in characters, is collected before it is saved to the pip log as a segment
+CHUNK_SIZE: int = 64 * 1024
+
+# lines that are kept even once they fall out of the tail, since outcomes are parsed from them
+KEPT_PREFIXES: tuple[str, ...] = (
+    "Successfully installed ",
+    "Found existing installation: ",
+    "ERROR: ",
+    "Saved ",
+    "File was already downloaded ",
+)
+
+# the stages of a pip install or wheel command, keyed by the prefix of the line that starts them
+STAGES: dict[str, str] = {
+    "Collecting ": "collecting",
+    "Downloading ": "downloading",
+    "Building wheel": "building",
+    "Installing collected packages": "installing",
+    "Successfully installed ": "done",
+    "Successfully built ": "built",
+}
+STAGE_PREFIXES: tuple[str, ...] = tuple(STAGES)
+
+
+class Progress(NamedTuple):
+    """
+    A progress event from a running pip command, emitted each time it moves to a new stage.
+
+    :param packages: the names of the packages the command is for
+    :param stage: the stage the command has moved to, e.g. "building"
+    :param line: the line of output that started the stage
+    """
+    packages: list[str]
+    stage: str
+    line: str
+
+
+class RunResult(NamedTuple):
+    """
+    The outcome of a pip command.
+
+    :param exit_code: the exit code of the command
+    :param output: the last TAIL_LINES lines of output, preceded by any earlier lines that outcomes
+                   are parsed from (see KEPT_PREFIXES)
+    :param segments: where the full output was saved in the pip log, one entry per chunk; empty if
+                     it wasn't saved
+    """
+    exit_code: int
+    output: str
+    segments: tuple[dict[str, Any], ...] = ()
+
+
+class PipRunner():
+    """
+    Runs pip commands, streaming their output rather than holding all of it in memory until the
+    command exits. Output is read line by line as it is produced and:
+    - saved to the pip log in chunks of CHUNK_SIZE characters, each a segment for the command's
+      packages;
+    - kept in a ring buffer of the last TAIL_LINES lines, for error context and for parsing the
+      outcome from, along with the few earlier lines outcomes are parsed from;
+    - scanned for the start of each stage (collecting, downloading, building, installing), with a
+      Progress event emitted for each.
+
+    However much output a command produces, e.g. from compiling a large package from source, the
+    memory used stays the same.
+
+    :param logger: the logger instance, which output is saved to the pip log through
+    :param on_progress: optional; a function to call with each Progress event
+    """
+    def __init__(self,
+                 logger: Logger,
+                 on_progress: Optional[Callable[[Progress], None]] = None) -> None:
+        self.logger: Logger = logger
+        self.on_progress: Optional[Callable[[Progress], None]] = on_progress
+
+    def run(self, command: list[str], packages: list[str]) -> RunResult:
+        """
+        Runs a pip command to completion, streaming its output.
+
+        :param command: the command to run
+        :param packages: the names of the packages the command is for
+        :returns: the outcome of the command
+        """
+        tail: deque[str] = deque(maxlen=TAIL_LINES)
+        kept: list[str] = []
+        chunk: list[str] = []
+        chunk_size: int = 0
+        segments: list[dict[str, Any]] = []
+        stage: Optional[str] = None
+
+        with subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            bufsize=1
+        ) as process:
+            for line in process.stdout:
+                if len(tail) == TAIL_LINES and tail[0].lstrip().startswith(KEPT_PREFIXES):
+                    kept.append(tail[0])
+                tail.append(line)
+
+                chunk.append(line)
+                chunk_size += len(line)
+                if chunk_size >= CHUNK_SIZE:
+                    segments.append(self.logger.save_pip_output("".join(chunk), packages))
+                    chunk = []
+                    chunk_size = 0
+
+                stripped: str = line.lstrip()
+                if self.on_progress is not None and stripped.startswith(STAGE_PREFIXES):
+                    new_stage: str = next(
+                        STAGES[prefix] for prefix in STAGE_PREFIXES if stripped.startswith(prefix)
+                    )
+                    if new_stage != stage:
+                        stage = new_stage
+                        self.on_progress(Progress(packages, stage, stripped.rstrip()))
+            exit_code: int = process.wait()
+
+        if chunk:
+            segments.append(self.logger.save_pip_output("".join(chunk), packages))
+        return RunResult(
+            exit_code,
+            "".join(kept) + "".join(tail),
+            tuple(segment for segment in segments if segment is not None)
+        )
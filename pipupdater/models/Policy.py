@@ -0,0 +1,186 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import fnmatch
+import re
+
+from ..helpers import normalise_name
+from .PackageUpdate import PackageUpdate
+
+from packaging.version import Version
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:
+    from packaging.specifiers import SpecifierSet
+
+
+# the levels of version bump, from smallest to largest
+BUMP_LEVELS: tuple[str, ...] = ("patch", "minor", "major")
+
+
+class Policy():
+    """
+    Decides which outdated packages may be updated, and how far, from the [policy] section of the
+    config file. A package is held back if:
+    - its name matches one of the exclude patterns;
+    - there are include patterns, and its name matches none of them.
+
+    Otherwise, the version it is updated to is limited, rather than the package being held back,
+    if its latest version is a bigger bump than max_bump or doesn't satisfy its pin. For example,
+    with max_bump "minor", a package at 1.4.2 whose latest version is 2.0 is updated to the newest
+    version below 2, and a package at 1.25 pinned to ">=1.26,<2" whose latest version is 2.1 is
+    updated to the newest 1.x from 1.26 on. Which versions the limit allows is left to pip; if it
+    allows none newer than the installed version, the Updater holds the package back then.
+
+    Patterns are globs (e.g. "django-*"), or regular expressions if prefixed with "re:", and are
+    matched against the whole of a package's normalised name, ignoring case. Everything is compiled
+    once, when the policy is created: each list of patterns becomes a single regular expression,
+    and each pin a specifier set, so evaluating a package costs the same however many patterns and
+    pins there are.
+
+    :param include: the patterns of packages that may be updated; if empty, all packages may be
+    :param exclude: the patterns of packages that may not be updated
+    :param max_bump: the biggest version bump allowed, one of "patch", "minor" or "major"
+    :param pins: the version specifiers that the versions packages are updated to must satisfy,
+                 keyed by package name
+    :raises ValueError: if a pattern, specifier or max_bump is invalid
+    """
+    def __init__(self,
+                 include: Iterable[str] = (),
+                 exclude: Iterable[str] = (),
+                 max_bump: str = "major",
+                 pins: dict[str, str] = None) -> None:
+        if max_bump not in BUMP_LEVELS:
+            raise ValueError(
+                f"invalid max_bump: {max_bump} (must be one of {', '.join(BUMP_LEVELS)})"
+            )
+        self.include: Optional[re.Pattern] = self.__compile(include)
+        self.exclude: Optional[re.Pattern] = self.__compile(exclude)
+        self.max_bump: int = BUMP_LEVELS.index(max_bump)
+
+        # packaging.specifiers is slow to import and only needed when there are pins
+        from packaging.specifiers import SpecifierSet
+
+        self.pins: dict[str, SpecifierSet] = {}
+        for name, specifier in (pins or {}).items():
+            try:
+                self.pins[normalise_name(name)] = SpecifierSet(specifier)
+            except Exception as e:
+                raise ValueError(f"invalid pin for package {name}: {specifier} ({e})")
+
+    @staticmethod
+    def __compile(patterns: Iterable[str]) -> Optional[re.Pattern]:
+        """
+        Compiles a list of patterns into a single regular expression that matches a name if any
+        of the patterns do.
+
+        :param patterns: the glob patterns, and regular expressions prefixed with "re:"
+        :returns: the compiled expression, or None if there are no patterns
+        :raises ValueError: if a regular expression is invalid
+        """
+        expressions: list[str] = []
+        for pattern in patterns:
+            if pattern.startswith("re:"):
+                expression: str = pattern.removeprefix("re:")
+                try:
+                    re.compile(expression)
+                except re.error as e:
+                    raise ValueError(f"invalid pattern: {pattern} ({e})")
+            else:
+                expression = fnmatch.translate(normalise_name(pattern))
+            expressions.append(f"(?:{expression})")
+        if not expressions:
+            return None
+        return re.compile("|".join(expressions), re.IGNORECASE)
+
+    @staticmethod
+    def bump_level(current: Version, latest: Version) -> int:
+        """
+        Finds how big a version bump is: "major" if the first part of the release number changes,
+        "minor" if the second does, and "patch" otherwise.
+
+        :param current: the version being updated from
+        :param latest: the version being updated to
+        :returns: the bump level, as an index into BUMP_LEVELS
+        """
+        # release numbers are padded so that e.g. 2 and 2.0.0 compare as equal
+        old: tuple[int, ...] = current.release + (0, 0)
+        new: tuple[int, ...] = latest.release + (0, 0)
+        if new[0] != old[0]:
+            return BUMP_LEVELS.index("major")
+        if new[1] != old[1]:
+            return BUMP_LEVELS.index("minor")
+        return BUMP_LEVELS.index("patch")
+
+    def check(self, package: PackageUpdate) -> Optional[str]:
+        """
+        Checks whether a package may be updated at all.
+
+        :param package: the update record of the package
+        :returns: the reason the package is held back, or None if it may be updated
+        """
+        name: str = normalise_name(package.name)
+        if self.exclude is not None and self.exclude.fullmatch(name):
+            return "excluded by policy"
+        if self.include is not None and not self.include.fullmatch(name):
+            return "not included by policy"
+
+        if self.max_bump < BUMP_LEVELS.index("major"):
+            if package.current_version is None or package.latest_version is None:
+                return "version could not be parsed to check its bump level"
+        return None
+
+    def limit(self, package: PackageUpdate) -> Optional[str]:
+        """
+        Finds the version specifier that limits the version a package may be updated to, if its
+        latest version is a bigger bump than max_bump or doesn't satisfy its pin. The specifier
+        never allows a version older than the installed one, so a limited update can't downgrade
+        the package. Should only be used for packages that check() allows.
+
+        :param package: the update record of the package
+        :returns: the version specifier, e.g. ">=1.4.2,<2", or None if the update isn't limited
+        """
+        limits: list[str] = []
+        if self.max_bump < BUMP_LEVELS.index("major"):
+            level: int = self.bump_level(package.current_version, package.latest_version)
+            if level > self.max_bump:
+                # release numbers are padded so that e.g. 2 counts as 2.0.0
+                release: tuple[int, ...] = package.current_version.release + (0, 0)
+                limits.append(
+                    f"<{release[0] + 1}" if self.max_bump == BUMP_LEVELS.index("minor")
+                    else f"<{release[0]}.{release[1] + 1}"
+                )
+
+        pin: Optional[SpecifierSet] = self.pins.get(normalise_name(package.name))
+        if pin is not None and not pin.contains(package.latest, prereleases=True):
+            limits.append(str(pin))
+        if not limits:
+            return None
+        # a pin can repeat the limit from max_bump, e.g. "<2" on a package limited to minor updates
+        return ",".join(dict.fromkeys(
+            part for limit in [f">={package.current}", *limits] for part in limit.split(",")
+        ))
+
+    def is_empty(self) -> bool:
+        """
+        :returns: whether the policy allows every update, so needn't be checked
+        """
+        return (
+            self.include is None and self.exclude is None
+            and self.max_bump == BUMP_LEVELS.index("major") and not self.pins
+        )
@@ -0,0 +1,203 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import hashlib
+import json
+import os
+import subprocess
+import time
+
+from ..helpers import normalise_name
+from .Logger import Logger
+from .PackageUpdate import Failure, PackageUpdate, classify_failure
+
+from os import makedirs
+from subprocess import CompletedProcess
+from typing import Any, ContextManager, Optional
+
+
+# how long, in seconds, a cached resolution is kept before it is deleted
+MAX_AGE: int = 7 * 24 * 60 * 60
+
+
+class Preflight():
+    """
+    Checks a set of package updates for dependency conflicts before anything is installed, using
+    pip's resolver in dry-run mode ('pip install --dry-run --report'). Packages whose update would
+    conflict with the rest are dropped, and packages that can only be updated to an older version
+    than their latest are pinned to the version the resolver picked. Packages whose update is
+    limited by a constraint, e.g. a lockfile pin or the update policy, are resolved with it, so a
+    pin to an older version than the installed one is checked as the downgrade it is.
+
+    The outcome of each check is cached in pipupdater's config folder, keyed by a hash of the
+    environment's installed packages and the set of updates checked, so checking the same updates
+    on an identical environment again skips the resolver entirely.
+
+    :param config_folder: the path to pipupdater's config folder
+    :param logger: the logger instance
+    """
+    def __init__(self, config_folder: str, logger: Logger) -> None:
+        self.logger: Logger = logger
+        self.path: str = f"{config_folder}/resolver_cache"
+
+        makedirs(self.path, exist_ok=True)
+        self.__prune()
+
+    def __prune(self) -> None:
+        """
+        Deletes cached resolutions older than MAX_AGE.
+        """
+        cutoff: float = time.time() - MAX_AGE
+        for entry in os.scandir(self.path):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+    def __resolve(self,
+                  pip: list[str],
+                  packages: list[PackageUpdate],
+                  limiter: ContextManager) -> Optional[dict[str, str]]:
+        """
+        Runs pip's resolver over a set of package updates without installing anything.
+
+        :param pip: the command used to run pip, e.g. ["pip"]
+        :param packages: the update records of the packages to resolve
+        :param limiter: a context manager that must be held while running pip
+        :returns: the version the resolver picked for each package it would install, keyed by
+                  normalised name, or None if the updates can't be resolved together
+        :raises RuntimeError: if pip doesn't support dry runs, or fails for any reason other than
+                              the updates conflicting, e.g. because the index can't be reached
+        """
+        with limiter:
+            process: CompletedProcess = subprocess.run(
+                [*pip, "install", "-U", "--dry-run", "--quiet", "--report", "-",
+                 *[package.name if package.constraint is None else package.requirement
+                   for package in packages]],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+        self.logger.save_pip_output(
+            process.stderr, [package.name for package in packages]
+        )
+
+        if process.returncode != 0:
+            if "no such option" in process.stderr:
+                raise RuntimeError("this version of pip does not support --dry-run --report")
+            failure: Failure = classify_failure(process.returncode, process.stderr)
+            if failure != Failure.RESOLUTION:
+                # only a conflict says anything about the updates; anything else would make every
+                # update look like it conflicts, so the check is given up on instead
+                raise RuntimeError(
+                    f"pip's resolver failed with exit code {process.returncode}"
+                    + ("" if failure == Failure.OTHER else f" ({failure.name.lower()} error)")
+                )
+            return None
+
+        report: dict[str, Any] = json.loads(process.stdout)
+        return {
+            normalise_name(item["metadata"]["name"]): item["metadata"]["version"]
+            for item in report.get("install", [])
+        }
+
+    def __resolve_greedily(self,
+                           pip: list[str],
+                           accepted: list[PackageUpdate],
+                           candidates: list[PackageUpdate],
+                           limiter: ContextManager) -> list[PackageUpdate]:
+        """
+        Finds the largest set of updates that resolves together, by adding candidates to the set
+        of already accepted updates in halves, and dropping any single candidate that can't be
+        added without a conflict.
+
+        :param pip: the command used to run pip
+        :param accepted: the update records already known to resolve together
+        :param candidates: the update records still to try adding
+        :param limiter: a context manager that must be held while running pip
+        :returns: the accepted update records
+        """
+        if len(candidates) == 0:
+            return accepted
+        if self.__resolve(pip, accepted + candidates, limiter) is not None:
+            return accepted + candidates
+        if len(candidates) == 1:
+            return accepted
+
+        middle: int = len(candidates) // 2
+        accepted = self.__resolve_greedily(pip, accepted, candidates[:middle], limiter)
+        return self.__resolve_greedily(pip, accepted, candidates[middle:], limiter)
+
+    def check(self,
+              pip: list[str],
+              packages: list[PackageUpdate],
+              installed: dict[str, str],
+              limiter: ContextManager) -> tuple[list[str], dict[str, str]]:
+        """
+        Checks a set of package updates for conflicts. Only a completed check is cached; if pip
+        fails for any reason other than a conflict, an exception is raised and nothing is cached.
+
+        :param pip: the command used to run pip, e.g. ["pip"]
+        :param packages: the update records of the packages to check
+        :param installed: the version of each package installed in the environment
+        :param limiter: a context manager that must be held while running pip
+        :returns: the normalised names of the packages to drop, and the version to pin each package
+                  that can't be updated to its latest version to
+        :raises RuntimeError: if the updates couldn't be checked
+        """
+        key: str = hashlib.sha256(json.dumps([
+            sorted(installed.items()),
+            sorted(package.requirement for package in packages)
+        ]).encode()).hexdigest()
+
+        try:
+            with open(f"{self.path}/{key}.json", "r") as cache_file:
+                cached: dict[str, Any] = json.load(cache_file)
+            self.logger.new("Using cached resolution for this set of updates.", "DEBUG")
+            return cached["dropped"], cached["pins"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+        resolved: Optional[dict[str, str]] = self.__resolve(pip, packages, limiter)
+        accepted: list[PackageUpdate] = packages
+        if resolved is None:
+            accepted = self.__resolve_greedily(pip, [], packages, limiter)
+            resolved = self.__resolve(pip, accepted, limiter) if accepted else {}
+            if resolved is None:
+                raise RuntimeError("pip's resolver gave different results for the same updates")
+
+        accepted_names: set[str] = {normalise_name(package.name) for package in accepted}
+        dropped: list[str] = [
+            normalise_name(package.name) for package in packages
+            if normalise_name(package.name) not in accepted_names
+        ]
+        # a constrained update can already only go to a version the constraint allows
+        pins: dict[str, str] = {
+            normalise_name(package.name): resolved[normalise_name(package.name)]
+            for package in accepted
+            if package.constraint is None
+            and resolved.get(normalise_name(package.name), package.latest) != package.latest
+        }
+
+        try:
+            with open(f"{self.path}/{key}.json", "w") as cache_file:
+                json.dump({"dropped": dropped, "pins": pins}, cache_file)
+        except Exception as e:
+            self.logger.new(f"Could not cache resolution. Error was: {e}", "WARNING")
+        return dropped, pins
@@ -0,0 +1,284 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Iterable, Iterator, NamedTuple, Optional
+
+
+class Span(NamedTuple):
+    """
+    A timed section of a run.
+
+    :param name: what was timed, e.g. "update"
+    :param phase: the phase of the run the section belongs to, e.g. "install"
+    :param start: when the section started, in seconds since the profiler was created
+    :param duration: how long the section took, in seconds
+    :param thread: the identifier of the thread the section ran in
+    :param details: any other details of the section, e.g. the package it was for
+    """
+    name: str
+    phase: str
+    start: float
+    duration: float
+    thread: int
+    details: dict[str, Any]
+
+
+class Profiler():
+    """
+    Records how long each phase of a run takes: config loading, discovery, resolution, downloading
+    and building, and installing. Sections of code are timed with span(), which records a Span once
+    the section ends; sections that belong to a single package note it in their details, so the
+    time can also be broken down by package.
+
+    When disabled, span() returns a shared no-op context manager, so instrumented code costs
+    next to nothing unless --profile is passed.
+
+    :param enabled: optional, default True; whether to record anything
+    """
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled: bool = enabled
+        self.origin: float = time.perf_counter()
+        self.spans: list[Span] = []
+
+        self._disabled: ContextManager = nullcontext()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __record(self,
+                 name: str,
+                 phase: str,
+                 start: float,
+                 duration: float,
+                 details: dict[str, Any]) -> None:
+        """
+        Records a span.
+
+        :param name: what was timed
+        :param phase: the phase of the run the section belongs to
+        :param start: the time the section started, from time.perf_counter()
+        :param duration: how long the section took, in seconds
+        :param details: any other details of the section
+        """
+        with self._lock:
+            self.spans.append(Span(
+                name, phase, start - self.origin, duration, threading.get_ident(), details
+            ))
+
+    @contextmanager
+    def __span(self, name: str, phase: str, details: dict[str, Any]) -> Iterator[None]:
+        """
+        The context manager returned by span() when profiling is enabled.
+
+        :param name: what is being timed
+        :param phase: the phase of the run the section belongs to
+        :param details: any other details of the section
+        """
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.__record(name, phase, start, time.perf_counter() - start, details)
+
+    def iterate(self, iterable: Iterable[Any], name: str, phase: str) -> Iterator[Any]:
+        """
+        Times a stream that is consumed bit by bit, such as the discovery pipeline. The span
+        recorded covers the wall-clock time from the first item being requested to the stream
+        ending, and notes how much of that time was spent producing items rather than waiting for
+        the consumer.
+
+        :param iterable: the stream to time
+        :param name: what is being timed
+        :param phase: the phase of the run the stream belongs to
+        :returns: the items of the stream
+        """
+        if not self.enabled:
+            yield from iterable
+            return
+
+        iterator: Iterator[Any] = iter(iterable)
+        start: float = time.perf_counter()
+        busy: float = 0.0
+        count: int = 0
+        try:
+            while True:
+                before: float = time.perf_counter()
+                try:
+                    item: Any = next(iterator)
+                except StopIteration:
+                    busy += time.perf_counter() - before
+                    return
+                busy += time.perf_counter() - before
+                count += 1
+                yield item
+        finally:
+            self.__record(name, phase, start, time.perf_counter() - start,
+                          {"busy": busy, "items": count})
+
+    def report(self) -> dict[str, Any]:
+        """
+        Builds the timing report of the run: the total time of each phase, sorted slowest first,
+        and the time each package spent in each phase, also sorted slowest first. Time spent on a
+        batch of packages is shared equally between them.
+
+        :returns: the timing report
+        """
+        phases: dict[tuple[str, str], dict[str, Any]] = {}
+        packages: dict[str, dict[str, float]] = {}
+
+        with self._lock:
+            spans: list[Span] = list(self.spans)
+
+        for span in spans:
+            phase: dict[str, Any] = phases.setdefault(
+                (span.phase, span.name),
+                {"phase": span.phase, "name": span.name, "count": 0, "total": 0.0, "max": 0.0}
+            )
+            phase["count"] += 1
+            phase["total"] += span.duration
+            phase["max"] = max(phase["max"], span.duration)
+
+            names: list[str] = span.details.get("packages") or (
+                [span.details["package"]] if "package" in span.details else []
+            )
+            if "environment" in span.details:
+                names = [f"[{span.details['environment']}] {name}" for name in names]
+            for name in names:
+                times: dict[str, float] = packages.setdefault(name, {"total": 0.0})
+                times[span.phase] = times.get(span.phase, 0.0) + span.duration / len(names)
+                times["total"] += span.duration / len(names)
+
+        for phase in phases.values():
+            phase["mean"] = phase["total"] / phase["count"]
+
+        return {
+            "pid": os.getpid(),
+            "wall_time": time.perf_counter() - self.origin,
+            "phases": sorted(phases.values(), key=lambda phase: phase["total"], reverse=True),
+            "packages": sorted(
+                ({"package": name, **times} for name, times in packages.items()),
+                key=lambda package: package["total"],
+                reverse=True
+            ),
+            "spans": [span._asdict() for span in spans],
+        }
+
+    def span(self, name: str, phase: str, **details: Any) -> ContextManager:
+        """
+        Times a section of code, used as a context manager.
+
+        :param name: what is being timed, e.g. "update"
+        :param phase: the phase of the run the section belongs to, e.g. "install"
+        :param details: any other details of the section, e.g. package="requests"; sections for
+                        a single package should pass package, and those for several packages
+                        should pass packages, and sections for an environment other than the one
+                        found on PATH should pass environment
+        :returns: the context manager
+        """
+        if not self.enabled:
+            return self._disabled
+        return self.__span(name, phase, details)
+
+    def summarise(self, report: dict[str, Any], limit: int = 10) -> str:
+        """
+        Formats a timing report as a table of phases, slowest first, followed by the slowest
+        packages.
+
+        :param report: the timing report, from report()
+        :param limit: optional, default 10; the number of packages to list
+        :returns: the formatted table
+        """
+        lines: list[str] = [
+            f"   {'phase':<12} {'section':<28} {'count':>6} {'total (s)':>10} {'mean (s)':>9}"
+            + f" {'max (s)':>9}"
+        ]
+        lines.extend(
+            f"   {phase['phase']:<12} {phase['name']:<28} {phase['count']:>6}"
+            + f" {phase['total']:>10.3f} {phase['mean']:>9.3f} {phase['max']:>9.3f}"
+            for phase in report["phases"]
+        )
+        if report["packages"]:
+            lines.append("   Slowest packages:")
+            lines.extend(
+                f"   {package['package']:<41} {package['total']:>17.3f}  ("
+                + ", ".join(
+                    f"{phase} {seconds:.3f}" for phase, seconds in package.items()
+                    if phase not in ("package", "total")
+                )
+                + ")"
+                for package in report["packages"][:limit]
+            )
+        lines.append(f"   Wall time: {report['wall_time']:.3f} s")
+        return "\n".join(lines)
+
+    def trace_events(self, report: dict[str, Any]) -> dict[str, Any]:
+        """
+        Converts the spans of a timing report to the Chrome trace-event format, which can be opened
+        in a trace viewer such as chrome://tracing or Perfetto.
+
+        :param report: the timing report, from report()
+        :returns: the trace, as a JSON-serialisable dict
+        """
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": span["name"]
+                    + (f" {span['details']['package']}" if "package" in span["details"] else ""),
+                    "cat": span["phase"],
+                    "ph": "X",
+                    "ts": span["start"] * 1_000_000,
+                    "dur": span["duration"] * 1_000_000,
+                    "pid": report["pid"],
+                    "tid": span["thread"],
+                    "args": span["details"],
+                }
+                for span in report["spans"]
+            ],
+        }
+
+    def write(self,
+              folder: str,
+              report: dict[str, Any],
+              trace: bool = False) -> tuple[str, Optional[str]]:
+        """
+        Writes a timing report to a JSON file, and optionally a Chrome trace-event file alongside
+        it.
+
+        :param folder: the folder to write the files in
+        :param report: the timing report, from report()
+        :param trace: optional, default False; whether to also write a trace-event file
+        :returns: the path to the report file, and the path to the trace file if one was written
+        """
+        os.makedirs(folder, exist_ok=True)
+        stamp: str = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+        report_path: str = f"{folder}/profile-{stamp}.json"
+        with open(report_path, "w") as report_file:
+            json.dump(report, report_file, indent=4, default=str)
+
+        trace_path: Optional[str] = None
+        if trace:
+            trace_path = f"{folder}/trace-{stamp}.json"
+            with open(trace_path, "w") as trace_file:
+                json.dump(self.trace_events(report), trace_file, default=str)
+        return report_path, trace_path
@@ -0,0 +1,171 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import os
+import threading
+import time
+
+from .PackageUpdate import Failure, PackageUpdate, Status
+
+from datetime import datetime
+from os import makedirs
+from typing import Any, Iterable, Optional, TextIO
+
+
+class Report():
+    """
+    A structured report of a run, for tools to read rather than the log. Each package's outcome is
+    written as soon as it is known, so a report can be followed while a long run is in progress.
+
+    The report is a JSON lines file: a "start" record, a "package" record for each package (its
+    name, versions, outcome, duration, kind of failure or reason for skipping, and where its pip
+    output was saved in the pip log, if it was), and an "end" record with the number of packages
+    with each outcome. Optionally, the outcomes are also written as a JUnit XML file, with one test
+    case per package, so CI systems can display them.
+
+    Writes are serialised, so a report is safe to share between threads, and between the Updaters
+    of several environments.
+
+    :param folder: the path to the folder reports are saved in
+    :param junit: whether to also write a JUnit XML file
+    """
+    def __init__(self, folder: str, junit: bool = False) -> None:
+        makedirs(folder, exist_ok=True)
+        stem: str = f"report-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.path: str = f"{folder}/{stem}.jsonl"
+        self.junit_path: Optional[str] = f"{folder}/{stem}.xml" if junit else None
+
+        self._counts: dict[str, int] = {}
+        self._file: Optional[TextIO] = open(self.path, "w")
+        self._junit: Optional[TextIO] = None
+        self._lock: threading.Lock = threading.Lock()
+
+        self.__write({"type": "start", "time": time.time(), "pid": os.getpid()})
+        if self.junit_path is not None:
+            self._junit = open(self.junit_path, "w")
+            # counts aren't known until the run ends, so they're left for readers to total up
+            self._junit.write(
+                '<?xml version="1.0" encoding="utf-8"?>\n<testsuites name="pipupdater">\n'
+                + f'  <testsuite name="pipupdater" timestamp="{datetime.now().isoformat()}">\n'
+            )
+            self._junit.flush()
+
+    def __test_case(self, record: dict[str, Any]) -> str:
+        """
+        Formats a package record as a JUnit test case.
+
+        :param record: the package record
+        :returns: the test case's XML
+        """
+        # xml.sax is slow to import and only needed with --junit
+        from xml.sax.saxutils import quoteattr
+
+        attributes: str = (
+            f'classname={quoteattr(record["environment"] or "default")}'
+            + f' name={quoteattr(record["package"])}'
+            + f' time="{record["duration"] or 0:.3f}"'
+        )
+        summary: str = f'{record["current"]} -> {record["latest"]}'
+        if record["status"] in (Status.FAILED.name, Status.PARTIAL.name):
+            message: str = (
+                f'{summary}: exit code {record["exit_code"]}'
+                + (f', {record["failure"]} error' if record["failure"] != "other" else "")
+                + (", other packages were changed" if record["status"] == Status.PARTIAL.name
+                   else "")
+            )
+            return (
+                f'    <testcase {attributes}>\n'
+                + f'      <failure message={quoteattr(message)} type="{record["status"]}"/>\n'
+                + '    </testcase>\n'
+            )
+        if record["status"] == Status.SKIPPED.name:
+            return (
+                f'    <testcase {attributes}>\n'
+                + f'      <skipped message={quoteattr(record["reason"] or summary)}/>\n'
+                + '    </testcase>\n'
+            )
+        return f'    <testcase {attributes}/>\n'
+
+    def __write(self, record: dict[str, Any]) -> None:
+        """
+        Appends a record to the report and flushes it, so it can be read straight away. Must be
+        called with the lock held, or before the report is shared.
+
+        :param record: the record to write
+        """
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        """
+        Writes the end record of the report and closes it.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self.__write({"type": "end", "time": time.time(), "counts": self._counts})
+            self._file.close()
+            self._file = None
+            if self._junit is not None:
+                self._junit.write("  </testsuite>\n</testsuites>\n")
+                self._junit.close()
+                self._junit = None
+
+    def record(self,
+               package: PackageUpdate,
+               environment: Optional[str] = None,
+               run_id: Optional[str] = None,
+               failure: Failure = Failure.OTHER,
+               reason: Optional[str] = None,
+               segments: Iterable[dict[str, Any]] = ()) -> None:
+        """
+        Writes the outcome of a package's update to the report.
+
+        :param package: the update record of the package, with its outcome filled in
+        :param environment: optional; the interpreter of the environment the package is in, if it
+                            isn't the one found on PATH
+        :param run_id: optional; the identifier of the run in the run journal
+        :param failure: optional; the kind of failure, if the update failed
+        :param reason: optional; why the package was skipped, if it was
+        :param segments: optional; where the update's pip output was saved in the pip log
+        """
+        failed: bool = package.status in (Status.FAILED, Status.PARTIAL)
+        record: dict[str, Any] = {
+            "type": "package",
+            "time": time.time(),
+            "run": run_id,
+            "environment": environment,
+            "package": package.name,
+            "current": package.current,
+            "latest": package.latest,
+            "status": package.status.name,
+            "exit_code": package.exit_code,
+            "duration": package.duration,
+            "failure": failure.name.lower() if failed else None,
+            "reason": reason,
+            "log": list(segments),
+        }
+        with self._lock:
+            self._counts[package.status.name] = self._counts.get(package.status.name, 0) + 1
+            self.__write(record)
+            if self._junit is not None:
+                self._junit.write(self.__test_case(record))
+                self._junit.flush()
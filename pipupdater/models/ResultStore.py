@@ -0,0 +1,106 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import math
+import threading
+
+from .PackageUpdate import PackageUpdate, Status
+
+from array import array
+from typing import Iterable, Iterator, Optional
+
+
+# stored in place of a missing exit code, since the exit code column can't hold None
+NO_EXIT_CODE: int = -2 ** 31
+
+
+class ResultStore():
+    """
+    A thread-safe, append-only collection of PackageUpdate records, stored by column rather than by
+    record. Statuses, durations and exit codes are packed into typed arrays, so a large run holds a
+    few bytes per package for them rather than a Python object each. Records are rebuilt from the
+    columns when iterated over or indexed.
+    """
+    def __init__(self, updates: Iterable[PackageUpdate] = ()) -> None:
+        self._names: list[str] = []
+        self._currents: list[str] = []
+        self._latests: list[str] = []
+        self._current_versions: list = []
+        self._latest_versions: list = []
+        self._statuses: array = array("b")
+        self._durations: array = array("d")
+        self._exit_codes: array = array("l")
+        self._lock: threading.Lock = threading.Lock()
+
+        self.extend(updates)
+
+    def __getitem__(self, index: int) -> PackageUpdate:
+        duration: float = self._durations[index]
+        exit_code: int = self._exit_codes[index]
+        return PackageUpdate(
+            self._names[index],
+            self._currents[index],
+            self._latests[index],
+            self._current_versions[index],
+            self._latest_versions[index],
+            Status(self._statuses[index]),
+            None if math.isnan(duration) else duration,
+            None if exit_code == NO_EXIT_CODE else exit_code
+        )
+
+    def __iter__(self) -> Iterator[PackageUpdate]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def append(self, update: PackageUpdate) -> None:
+        """
+        Adds a record to the end of the store.
+
+        :param update: the record to add
+        """
+        duration: Optional[float] = update.duration
+        exit_code: Optional[int] = update.exit_code
+        with self._lock:
+            self._names.append(update.name)
+            self._currents.append(update.current)
+            self._latests.append(update.latest)
+            self._current_versions.append(update.current_version)
+            self._latest_versions.append(update.latest_version)
+            self._statuses.append(update.status.value)
+            self._durations.append(math.nan if duration is None else duration)
+            self._exit_codes.append(NO_EXIT_CODE if exit_code is None else exit_code)
+
+    def extend(self, updates: Iterable[PackageUpdate]) -> None:
+        """
+        Adds a number of records to the end of the store.
+
+        :param updates: the records to add
+        """
+        for update in updates:
+            self.append(update)
+
+    def names(self) -> list[str]:
+        """
+        Gets the names of the packages in the store, without rebuilding their records.
+
+        :returns: the package names, in the order they were added
+        """
+        return list(self._names)
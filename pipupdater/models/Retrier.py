@@ -0,0 +1,119 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from typing import Any, Iterator, Optional
+
+
+class Retrier():
+    """
+    Schedules retries of updates that failed for a transient reason, such as a network timeout.
+    Rather than sleeping until a retry is due, which would hold up the rest of the queue, failed
+    updates are put in a queue ordered by when they are due; the Updater takes due retries from it
+    in between dispatching other updates, and only waits on it once nothing else is left to do.
+
+    The delay before each retry grows exponentially, starting at backoff seconds and doubling with
+    each attempt up to max_backoff seconds, and is randomly shortened by up to the jitter fraction
+    so that retries of packages that failed together don't all hit the index together again.
+
+    Each package is retried at most attempts times, and no more than budget retries are made in
+    total in a run, so a broken network can't stall a run indefinitely.
+
+    :param attempts: the most times to retry each package
+    :param budget: the most retries to make in total
+    :param backoff: the delay before the first retry of a package, in seconds
+    :param max_backoff: the longest delay before any retry, in seconds
+    :param jitter: the fraction of each delay, between 0 and 1, that may be randomly taken off
+    """
+    def __init__(self,
+                 attempts: int,
+                 budget: int,
+                 backoff: float,
+                 max_backoff: float,
+                 jitter: float) -> None:
+        self.attempts: int = max(0, attempts)
+        self.budget: int = max(0, budget)
+        self.backoff: float = max(0.0, backoff)
+        self.max_backoff: float = max(self.backoff, max_backoff)
+        self.jitter: float = min(max(jitter, 0.0), 1.0)
+        self.used: int = 0
+
+        self._attempts: dict[str, int] = {}
+        self._counter: Iterator[int] = itertools.count()
+        self._lock: threading.Lock = threading.Lock()
+        # entries are (due time, tie-breaker, task); the tie-breaker keeps tasks from being compared
+        self._queue: list[tuple[float, int, Any]] = []
+
+    def __len__(self) -> int:
+        """
+        :returns: the number of retries waiting to be run
+        """
+        with self._lock:
+            return len(self._queue)
+
+    def due(self) -> list[Any]:
+        """
+        Takes every retry that is now due from the queue.
+
+        :returns: the tasks to retry
+        """
+        now: float = time.monotonic()
+        tasks: list[Any] = []
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                tasks.append(heapq.heappop(self._queue)[2])
+        return tasks
+
+    def schedule(self, name: str, task: Any) -> Optional[float]:
+        """
+        Schedules a retry of a package's update, if it has attempts left and the run has budget
+        left.
+
+        :param name: the normalised name of the package
+        :param task: what to pass to the update method to retry the update
+        :returns: the delay before the retry, in seconds, or None if it won't be retried
+        """
+        with self._lock:
+            attempt: int = self._attempts.get(name, 0) + 1
+            if attempt > self.attempts or self.used >= self.budget:
+                return None
+            self._attempts[name] = attempt
+            self.used += 1
+
+            delay: float = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+            delay *= 1 - random.uniform(0, self.jitter)
+            heapq.heappush(
+                self._queue, (time.monotonic() + delay, next(self._counter), task)
+            )
+            return delay
+
+    def wait_time(self) -> Optional[float]:
+        """
+        Gets how long it is until the next retry is due.
+
+        :returns: the time until the next retry is due, in seconds, or None if none are waiting
+        """
+        with self._lock:
+            if not self._queue:
+                return None
+            return max(0.0, self._queue[0][0] - time.monotonic())
@@ -0,0 +1,121 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+from ..helpers import normalise_name
+from .PackageUpdate import PackageUpdate
+
+from typing import Optional
+
+
+class Scheduler():
+    """
+    Orders package updates so that each package is updated after the packages it depends on. The
+    dependency graph is built from the Requires-Dist metadata of the installed distributions.
+
+    Updates are grouped into "waves": every package in a wave only depends on packages in earlier
+    waves, so no update reinstalls a dependency that a later update in the run would upgrade again.
+    Only the packages being updated are ordered; two packages in the same wave can still share a
+    dependency that isn't being updated itself, so installing them at the same time isn't safe,
+    and the Updater runs one install at a time whatever the wave.
+
+    :param search_path: the module search path of the environment whose distributions to read
+    """
+    def __init__(self, search_path: list[str]) -> None:
+        # importlib.metadata is slow to import and only needed with --ordered
+        from importlib.metadata import distributions
+
+        self.requires: dict[str, set[str]] = {}
+        for distribution in distributions(path=search_path):
+            name: Optional[str] = distribution.metadata["Name"]
+            if name is None or normalise_name(name) in self.requires:
+                continue
+            self.requires[normalise_name(name)] = self.__read_requirements(
+                distribution.requires or []
+            )
+
+    def __read_requirements(self, requirements: list[str]) -> set[str]:
+        """
+        Reads the names of the packages a distribution depends on from its Requires-Dist entries.
+        Requirements that only apply with an extra, or whose environment markers don't match the
+        current environment, are ignored.
+
+        :param requirements: the Requires-Dist entries
+        :returns: the normalised names of the required packages
+        """
+        # packaging.requirements is slow to import and only needed with --ordered
+        from packaging.requirements import InvalidRequirement, Requirement
+
+        names: set[str] = set()
+        for line in requirements:
+            try:
+                requirement: Requirement = Requirement(line)
+            except InvalidRequirement:
+                continue
+            if requirement.marker is None or requirement.marker.evaluate({"extra": ""}):
+                names.add(normalise_name(requirement.name))
+        return names
+
+    def dependencies(self, name: str, targets: set[str]) -> set[str]:
+        """
+        Finds which of a set of target packages a given package depends on, directly or through
+        other installed packages.
+
+        :param name: the normalised name of the package
+        :param targets: the normalised names of the target packages
+        :returns: the normalised names of the target packages the package depends on
+        """
+        found: set[str] = set()
+        visited: set[str] = {name}
+        stack: list[str] = [name]
+        while stack:
+            for requirement in self.requires.get(stack.pop(), ()):
+                if requirement not in visited:
+                    visited.add(requirement)
+                    stack.append(requirement)
+                    if requirement in targets:
+                        found.add(requirement)
+        return found
+
+    def waves(self, packages: list[PackageUpdate]) -> list[list[PackageUpdate]]:
+        """
+        Groups a list of packages into waves in topological order, so that each package comes
+        after everything it depends on. Packages in a dependency cycle are put in a final wave
+        together.
+
+        :param packages: the update records of the packages to order
+        :returns: the waves of update records
+        """
+        by_name: dict[str, PackageUpdate] = {
+            normalise_name(package.name): package for package in packages
+        }
+        remaining: dict[str, set[str]] = {
+            name: self.dependencies(name, set(by_name)) - {name} for name in by_name
+        }
+
+        waves: list[list[PackageUpdate]] = []
+        while remaining:
+            ready: list[str] = [name for name, needs in remaining.items() if not needs]
+            if not ready:
+                # every remaining package is part of (or depends on) a cycle
+                ready = list(remaining)
+            waves.append([by_name[name] for name in ready])
+            for name in ready:
+                del remaining[name]
+            for needs in remaining.values():
+                needs.difference_update(ready)
+        return waves
@@ -0,0 +1,305 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from ..helpers import normalise_name
+from .Logger import Logger
+from .PipRunner import PipRunner, RunResult
+
+from os import makedirs
+from typing import Any, ContextManager, Optional
+
+
+class Snapshots():
+    """
+    A store of environment snapshots, which a run's updates can be rolled back to. A snapshot
+    records the version of every distribution installed in an environment before a run started,
+    and the wheels of the versions the run changed, so that they can be reinstalled offline.
+
+    Snapshots are kept in pipupdater's config folder, one JSON file per run in a folder per
+    environment, named by the run's identifier in the run journal. Wheels are kept in a folder
+    shared by every snapshot and environment, named as pip names them; a wheel that is already
+    there is never fetched again, so snapshots of runs that change the same versions share wheels.
+
+    Snapshots older than a maximum age are deleted, then the oldest snapshots until the wheels
+    still in use fit within a maximum size, and then any wheels no snapshot uses.
+
+    :param folder: the path to the snapshots folder
+    :param max_age: the age, in seconds, at which snapshots are deleted
+    :param max_size: the maximum total size of the wheels in the store, in bytes
+    :param logger: the logger instance
+    """
+    def __init__(self, folder: str, max_age: float, max_size: int, logger: Logger) -> None:
+        self.folder: str = folder
+        self.max_age: float = max_age
+        self.max_size: int = max_size
+        self.logger: Logger = logger
+        self.wheels: str = f"{folder}/wheels"
+
+        self.runner: PipRunner = PipRunner(logger)
+
+        self._lock: threading.Lock = threading.Lock()
+        makedirs(self.wheels, exist_ok=True)
+
+    def __environment_folder(self, environment: Optional[str]) -> str:
+        """
+        Gets the folder the snapshots of an environment are kept in.
+
+        :param environment: the interpreter of the environment, or None for the one found on PATH
+        :returns: the path to the folder
+        """
+        if environment is None:
+            return f"{self.folder}/default"
+        return f"{self.folder}/{hashlib.sha1(environment.encode()).hexdigest()[:12]}"
+
+    def __manifests(self) -> list[tuple[str, dict[str, Any]]]:
+        """
+        Reads every snapshot in the store, of every environment.
+
+        :returns: the path to each snapshot and its contents, oldest first
+        """
+        manifests: list[tuple[str, dict[str, Any]]] = []
+        for environment in os.scandir(self.folder):
+            if not environment.is_dir() or environment.path == self.wheels:
+                continue
+            for entry in os.scandir(environment.path):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    with open(entry.path, "r") as manifest_file:
+                        manifests.append((entry.path, json.load(manifest_file)))
+                except (OSError, ValueError):
+                    continue
+        return sorted(manifests, key=lambda manifest: manifest[1].get("time", 0))
+
+    def __prune(self) -> None:
+        """
+        Deletes snapshots older than the maximum age, then the oldest snapshots until the wheels
+        the rest use fit within the maximum size, and finally any wheels no snapshot uses. The
+        newest snapshot of each environment is always kept. Must be called with self._lock held.
+        """
+        manifests: list[tuple[str, dict[str, Any]]] = self.__manifests()
+        sizes: dict[str, int] = {
+            entry.name: entry.stat().st_size
+            for entry in os.scandir(self.wheels) if entry.name.endswith(".whl")
+        }
+        newest: dict[str, str] = {
+            os.path.dirname(path): path for path, _ in manifests
+        }
+        kept: list[tuple[str, dict[str, Any]]] = []
+        now: float = time.time()
+        for path, manifest in manifests:
+            if path not in newest.values() and now - manifest.get("time", 0) > self.max_age:
+                self.__remove(path)
+            else:
+                kept.append((path, manifest))
+
+        used: set[str] = {wheel for _, manifest in kept for wheel in manifest.get("wheels", ())}
+        total: int = sum(sizes.get(wheel, 0) for wheel in used)
+        for path, manifest in list(kept):
+            if total <= self.max_size:
+                break
+            if path in newest.values():
+                continue
+            self.__remove(path)
+            kept.remove((path, manifest))
+            used = {wheel for _, manifest in kept for wheel in manifest.get("wheels", ())}
+            total = sum(sizes.get(wheel, 0) for wheel in used)
+
+        for wheel in sizes:
+            if wheel not in used:
+                self.__remove(f"{self.wheels}/{wheel}")
+
+    def __remove(self, path: str) -> None:
+        """
+        Deletes a snapshot or wheel from the store.
+
+        :param path: the path to the file
+        """
+        try:
+            os.remove(path)
+            self.logger.new(f"Deleted from snapshot store: {os.path.basename(path)}", "DEBUG")
+        except OSError as e:
+            self.logger.new(f"Could not delete from snapshot store: {path} ({e})", "WARNING")
+
+    @staticmethod
+    def __wheel_prefix(name: str, version: str) -> str:
+        """
+        Gets the start of the filenames of a distribution's wheels.
+
+        :param name: the name of the distribution
+        :param version: the version of the distribution
+        :returns: the filename prefix
+        """
+        # wheel filenames use the package name with runs of "-", "_" and "." replaced by "_"
+        return f"{re.sub(r'[-_.]+', '_', name)}-{version}-".lower()
+
+    def commit(self,
+               pip: list[str],
+               environment: Optional[str],
+               run_id: str,
+               installed: dict[str, tuple[str, str]],
+               changed: dict[str, str],
+               limiter: ContextManager) -> None:
+        """
+        Completes the snapshot of an environment once its run has finished: fetches the wheels of
+        the versions the run changed, writes the snapshot, and then prunes the store. This is done
+        with the store locked, since another environment's prune would otherwise delete wheels this
+        one had fetched, but not yet recorded in its snapshot.
+
+        :param pip: the command used to run pip, e.g. ["pip"]
+        :param environment: the interpreter of the environment, or None for the one found on PATH
+        :param run_id: the identifier of the run the snapshot is taken for
+        :param installed: the name and version of each distribution installed before the run,
+                          keyed by normalised name
+        :param changed: the version each distribution the run changed had before it, keyed by name
+        :param limiter: a context manager that must be held while running pip
+        """
+        with self._lock:
+            wheels: list[str] = self.fetch(pip, changed, limiter) if changed else []
+            self.save(
+                environment, run_id, installed, [normalise_name(name) for name in changed], wheels
+            )
+            self.__prune()
+
+    def fetch(self,
+              pip: list[str],
+              distributions: dict[str, str],
+              limiter: ContextManager) -> list[str]:
+        """
+        Fetches the wheels of the given versions of a set of distributions into the store, skipping
+        any that are already there. The wheels are fetched with a single 'pip wheel' command; if it
+        fails, each wheel is fetched on its own, so one that can't be fetched doesn't stop the rest.
+
+        :param pip: the command used to run pip, e.g. ["pip"]
+        :param distributions: the version of each distribution, keyed by name
+        :param limiter: a context manager that must be held while running pip
+        :returns: the filenames of the wheels of the distributions that are in the store
+        """
+        missing: list[str] = [
+            f"{name}=={version}" for name, version in distributions.items()
+            if self.find_wheel(name, version) is None
+        ]
+        if missing:
+            self.logger.new(f"Saving wheels for snapshot: {', '.join(missing)}", "DEBUG")
+            batches: list[list[str]] = [missing]
+            while batches:
+                batch: list[str] = batches.pop()
+                with limiter:
+                    result: RunResult = self.runner.run(
+                        [*pip, "wheel", "--no-deps", "--wheel-dir", self.wheels, *batch],
+                        [requirement.partition("==")[0] for requirement in batch]
+                    )
+                if result.exit_code != 0 and len(batch) > 1:
+                    batches.extend([requirement] for requirement in batch)
+
+        wheels: list[str] = []
+        for name, version in distributions.items():
+            wheel: Optional[str] = self.find_wheel(name, version)
+            if wheel is None:
+                self.logger.new(
+                    f"Could not save wheel for snapshot: {name}=={version}; it will be reinstalled"
+                    + " from the index if rolled back.",
+                    "WARNING"
+                )
+            else:
+                wheels.append(wheel)
+        return wheels
+
+    def find_wheel(self, name: str, version: str) -> Optional[str]:
+        """
+        Finds a wheel of a given version of a distribution in the store.
+
+        :param name: the name of the distribution
+        :param version: the version of the distribution
+        :returns: the filename of the wheel, or None if there isn't one
+        """
+        prefix: str = self.__wheel_prefix(name, version)
+        for entry in os.scandir(self.wheels):
+            if entry.name.lower().startswith(prefix) and entry.name.endswith(".whl"):
+                return entry.name
+        return None
+
+    def load(self, environment: Optional[str], run_id: Optional[str] = None) -> dict[str, Any]:
+        """
+        Reads a snapshot of an environment.
+
+        :param environment: the interpreter of the environment, or None for the one found on PATH
+        :param run_id: optional; the identifier of the run the snapshot was taken for; if not
+                       given, the newest snapshot is read
+        :returns: the snapshot
+        :raises FileNotFoundError: if there is no such snapshot
+        """
+        folder: str = self.__environment_folder(environment)
+        if run_id is None:
+            runs: list[str] = sorted(
+                entry.name.removesuffix(".json") for entry in os.scandir(folder)
+                if entry.name.endswith(".json")
+            ) if os.path.isdir(folder) else []
+            if not runs:
+                raise FileNotFoundError("no snapshots have been taken of this environment")
+            run_id = runs[-1]
+
+        try:
+            with open(f"{folder}/{run_id}.json", "r") as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"no snapshot was taken for run: {run_id}")
+
+    def save(self,
+             environment: Optional[str],
+             run_id: str,
+             installed: dict[str, tuple[str, str]],
+             changed: list[str] = (),
+             wheels: list[str] = ()) -> None:
+        """
+        Writes a snapshot of an environment, replacing any already taken for the same run.
+
+        :param environment: the interpreter of the environment, or None for the one found on PATH
+        :param run_id: the identifier of the run the snapshot is taken for
+        :param installed: the name and version of each distribution installed before the run,
+                          keyed by normalised name
+        :param changed: optional; the normalised names of the distributions the run changed
+        :param wheels: optional; the filenames of the wheels of the changed distributions
+        """
+        folder: str = self.__environment_folder(environment)
+        makedirs(folder, exist_ok=True)
+        with open(f"{folder}/{run_id}.json.tmp", "w") as manifest_file:
+            json.dump({
+                "run": run_id,
+                "environment": environment,
+                "time": time.time(),
+                "installed": installed,
+                "changed": list(changed),
+                "wheels": list(wheels),
+            }, manifest_file)
+        os.replace(f"{folder}/{run_id}.json.tmp", f"{folder}/{run_id}.json")
+
+    def wheel_options(self) -> list[str]:
+        """
+        Gets the options that make pip look for packages in the store.
+
+        :returns: the pip install options
+        """
+        return ["--find-links", self.wheels]
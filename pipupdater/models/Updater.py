@@ -16,14 +16,42 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 
+import json
+import platform
 import subprocess
 import sys
+import threading
+import time
 
-from ..helpers import str_starts_with
+from ..helpers import normalise_name
+from .IndexCache import IndexCache
+from .Journal import Journal
+from .LineClassifier import LineClassifier
+from .Lockfile import Lockfile
 from .Logger import Logger
+from .PackageUpdate import Failure, PackageUpdate, Status, classify_failure, classify_result
+from .PackageUpdate import parse_installed, parse_replaced, parse_unmatched, parse_version
+from .PipRunner import PipRunner, Progress, RunResult
+from .Policy import Policy
+from .Preflight import Preflight
+from .Profiler import Profiler
+from .Report import Report
+from .ResultStore import ResultStore
+from .Retrier import Retrier
+from .Scheduler import Scheduler
+from .Snapshots import Snapshots
+from .Wheelhouse import Wheelhouse
 
 from argparse import Namespace
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from packaging.version import Version
 from subprocess import CompletedProcess
+from typing import Any, Callable, ContextManager, Iterable, Iterator, Optional
+
+
+# the number of package index lookups to run at once when using the metadata discovery engine
+INDEX_WORKERS: int = 16
 
 
 class Updater():
@@ -31,121 +59,1052 @@ class Updater():
     The main updater class. Wraps package update-related methods, and keeps track of data on which
     updates have succeeded and which have failed.
 
-    :param prefixes: a list of prefixes for discarding unneeded lines
+    Updates can be run concurrently by passing a --jobs value greater than 1; in that case each
+    update runs in a worker thread; the result stores are safe to add to from any thread. pip
+    doesn't lock the environment it installs into, so two installs that touch the same dependency
+    would race on its files; installs into the environment are therefore always run one at a time.
+    Only downloading and building wheels into a wheelhouse runs in parallel, so --jobs only speeds
+    up a run that uses one; without one, each pip command downloads and installs in one go, so the
+    updates wait on each other.
+
+    With --batch, packages are updated in chunks with a single pip command per chunk rather than
+    one command per package.
+
+    By default, the pip on PATH is used. If a Python interpreter is given, '[python] -m pip' is used
+    instead, so that one Updater can be created per environment; in that case the limiter can be
+    shared between Updaters to cap the number of pip commands running at once across all of them.
+
+    If a wheelhouse is given, the wheels for each package are built into it before the package is
+    installed from it; see the Wheelhouse class.
+
+    With --ordered, every outdated package is found before any are updated, so that they can be
+    updated in dependency order; see the Scheduler class. The same is true if a preflight checker is
+    given, so the whole set of updates can be checked for conflicts; see the Preflight class.
+
+    :param args: the command-line arguments
     :param logger: the logger instance
+    :param prefixes: a list of prefixes for discarding unneeded lines
+    :param index_cache: optional; the index cache, required when using the metadata discovery engine
+    :param journal: optional; the run journal to record outcomes in and skip packages using
+    :param python: optional; the interpreter of the environment to update
+    :param limiter: optional; a semaphore that must be held while running pip commands
+    :param wheelhouse: optional; the wheelhouse to install packages from
+    :param preflight: optional; the checker to find conflicting updates with before installing
+    :param profiler: optional; the profiler to time each phase of the run with
+    :param retrier: optional; the scheduler to retry updates that fail for transient reasons with
+    :param policy: optional; the policy that decides which packages may be updated
+    :param snapshots: optional; the store to snapshot the environment into before updating it
+    :param report: optional; the structured report to write each package's outcome to
     """
-    def __init__(self, args: Namespace, logger: Logger, prefixes: list[str]) -> None:
+    def __init__(self,
+                 args: Namespace,
+                 logger: Logger,
+                 prefixes: list[str],
+                 index_cache: IndexCache = None,
+                 journal: Journal = None,
+                 python: str = None,
+                 limiter: threading.Semaphore = None,
+                 wheelhouse: Wheelhouse = None,
+                 preflight: Preflight = None,
+                 profiler: Profiler = None,
+                 retrier: Retrier = None,
+                 policy: Policy = None,
+                 snapshots: Snapshots = None,
+                 report: Report = None) -> None:
         self.args: Namespace = args
         self.logger: Logger = logger
         self.prefixes: list[str] = prefixes
+        self.classifier: LineClassifier = LineClassifier(prefixes)
+        self.index_cache: IndexCache = index_cache
+        self.journal: Journal = journal
+        self.python: Optional[str] = python
+        self.pip: list[str] = ["pip"] if python is None else [python, "-m", "pip"]
+        self.limiter: ContextManager = nullcontext() if limiter is None else limiter
+        self.wheelhouse: Wheelhouse = wheelhouse
+        self.preflight: Preflight = preflight
+        self.profiler: Profiler = profiler if profiler is not None else Profiler(enabled=False)
+        self.retrier: Retrier = retrier if retrier is not None else Retrier(0, 0, 0, 0, 0)
+        self.policy: Policy = policy
+        self.snapshots: Snapshots = snapshots
+        self.report: Report = report
+        # packages the preflight check found can't be updated to their latest version
+        self.pinned: set[str] = set()
+        self.runner: PipRunner = PipRunner(logger, self.log_progress)
+        self.discovery: str = getattr(args, "discovery", None) or "pip"
+        self.jobs: int = max(1, getattr(args, "jobs", None) or 1)
+        # held while pip installs into (or uninstalls from) the environment
+        self.install_lock: threading.Lock = threading.Lock()
+        self.lockfile: Optional[str] = getattr(args, "lockfile", None)
+        # packages drifting from a lockfile are all brought back in line with one pip command
+        self.batch: bool = getattr(args, "batch", False) or self.lockfile is not None
+        self.batch_size: int = max(0, getattr(args, "batch_size", None) or 0)
+        self.incremental: bool = getattr(args, "incremental", False)
+        self.ordered: bool = getattr(args, "ordered", False)
+        self.resume: bool = getattr(args, "resume", False)
+        # set if the outdated packages couldn't be found, so the run couldn't finish
+        self.discovery_failed: bool = False
+        # packages whose wheels must be fetched again before installing them, as fetching them
+        # failed with a network error and was retried
+        self.refetch: set[str] = set()
+
+        self.dependencies: ResultStore = ResultStore()
+        self.failed: ResultStore = ResultStore()
+        self.success: ResultStore = ResultStore()
+        self.skipped: ResultStore = ResultStore()
+        self.unchanged: ResultStore = ResultStore()
+
+    def apply_policy(self, packages: Iterable[PackageUpdate]) -> Iterator[PackageUpdate]:
+        """
+        Filters out packages that the update policy holds back, before any of their updates are
+        started, and limits the version the rest may be updated to where the policy says so. Held
+        back packages are recorded in self.skipped. Packages pinned to an exact version, e.g. by a
+        lockfile, can't be limited, so are held back if the policy would limit them.
 
-        self.failed: list[list[str]] = []
-        self.success: list[list[str]] = []
+        :param packages: the update records of the packages to filter
+        :returns: the update records of the packages that may be updated
+        """
+        for package in packages:
+            reason: Optional[str] = self.policy.check(package)
+            if reason is None:
+                constraint: Optional[str] = self.policy.limit(package)
+                if constraint is None:
+                    yield package
+                    continue
+                if normalise_name(package.name) not in self.pinned:
+                    self.log(f"Limiting package: {package.name}{constraint} (policy)", "DEBUG")
+                    yield package._replace(constraint=constraint)
+                    continue
+                reason = f"pinned version is outside the policy ({constraint})"
+            self.log(f"Skipping package: {package.name} ({reason})", "DEBUG")
+            self.record_skipped(package, reason)
 
-    def extract_package_details(self, line: str) -> list[str]:
+    def extract_package_details(self, line: str) -> Optional[PackageUpdate]:
         """
         Extracts the details of an outdated package from a given line. The details include the
         package name, its current version, and the latest version available to update to.
 
-        If a line cannot be parsed, a warning is issued and an empty list is returned.
+        If a line cannot be parsed, a warning is issued and None is returned.
 
         :param line: the line to extract details from
-        :return: the package name, the current version and the latest version
+        :return: the package's update record
+        """
+        # handles the default 'pip list --outdated' format and the 'pip list --outdated --format
+        # columns' format; see the LineClassifier class
+        details: Optional[tuple[str, str, str]] = self.classifier.parse(line)
+        if details is None:
+            self.log(
+                f"The following line was not formatted in a way that could be parsed: {line}",
+                "WARNING"
+            )
+            return None
+        return PackageUpdate.create(*details)
+
+    def dispatch(self, packages: Iterable[PackageUpdate]) -> None:
+        """
+        Updates a stream of packages, one at a time or in batches, and concurrently if more than
+        one job is allowed. Retries that come due are run in between the other updates. Returns once
+        every update, and every retry, has finished.
+
+        :param packages: the update records of the packages to update
+        """
+        update: Callable[[Any], None] = self.update_package
+        tasks: Iterable[Any] = packages
+        if self.batch:
+            update = self.update_batch
+            tasks = self.split_batches(packages)
+
+        if self.jobs > 1:
+            self.update_concurrently(update, tasks)
+        else:
+            for task in tasks:
+                update(task)
+                for retry in self.retrier.due():
+                    update(retry)
+            while len(self.retrier) > 0:
+                time.sleep(self.retrier.wait_time() or 0)
+                for retry in self.retrier.due():
+                    update(retry)
+
+    def finish_snapshot(self, installed: dict[str, tuple[str, str]]) -> None:
+        """
+        Completes the snapshot of the environment once the run's updates have finished: saves the
+        wheels of the versions the run changed, for rolling back to offline, and records which
+        distributions changed. Old snapshots are then pruned.
+
+        :param installed: the name and version of each distribution installed before the run, keyed
+                          by normalised name
+        """
+        try:
+            after: dict[str, tuple[str, str]] = self.get_installed()
+            changed: dict[str, str] = {
+                name: version for key, (name, version) in installed.items()
+                if after.get(key, (None, None))[1] != version
+            }
+            with self.span("snapshot", "download", count=len(changed)):
+                self.snapshots.commit(
+                    self.pip, self.python, self.journal.run_id, installed, changed, self.limiter
+                )
+        except Exception as e:
+            self.log(f"Could not complete snapshot of environment. Error was: {e}", "WARNING")
+
+    def get_installed(self) -> dict[str, tuple[str, str]]:
         """
-        # filter out empty characters for strings that use multiple spaces for formatting purposes
-        line_parts: list[str] = list(filter(lambda x: x != '', line.split(" ")))
+        Enumerates the distributions installed in the environment being updated, in-process using
+        importlib.metadata.
 
+        :returns: the name and version of each installed distribution, keyed by normalised name
+        """
+        # importlib.metadata is slow to import and only needed by the modes that read the installed
+        # distributions, such as --lockfile, --preflight and --snapshot
+        from importlib.metadata import distributions
+
+        installed: dict[str, tuple[str, str]] = {}
+        for distribution in distributions(path=self.get_search_path()):
+            name: Optional[str] = distribution.metadata["Name"]
+            # when a distribution is installed more than once, the first on the path is the one
+            # that gets imported, and the one pip reports
+            if name is not None:
+                installed.setdefault(normalise_name(name), (name, distribution.version))
+        return installed
+
+    def get_latest_version(self, name: str, python_version: str) -> Optional[str]:
+        """
+        Gets the latest version of a package from the index cache. If the lookup fails, a warning
+        is issued and the package is treated as being up to date.
+
+        :param name: the name of the package
+        :param python_version: the Python version of the environment being updated
+        :returns: the latest version of the package, or None if it is unknown
+        """
         try:
-            package: str = line_parts[0]
-            current_version: str = None
-            latest_version: str = None
-
-            # handles default 'pip list --outdated' format:
-            # [package name] (Current: [current version] Latest: [latest version])
-            if line_parts[1] == "(Current:":
-                current_version = line_parts[2]
-                latest_version = line_parts[4].removesuffix(")")
-            # handles 'pip list --outdated --format columns' format:
-            # [package name] [current version] [latest version]
-            else:
-                current_version = line_parts[1]
-                latest_version = line_parts[2]
+            with self.span("index lookup", "discovery", package=name):
+                return self.index_cache.get_latest(name, python_version)
+        except Exception as e:
+            self.log(f"Could not get latest version of package: {name} ({e})", "WARNING")
+            return None
 
-            return [package, current_version, latest_version]
-        except IndexError:
-            self.logger.new(
-                f"The following line was not formatted in a way that could be parsed: {line}",
+    def get_lockfile_drift(self) -> Iterator[PackageUpdate]:
+        """
+        Gets the details of each package whose installed version differs from the version it is
+        locked to in the lockfile passed with --lockfile, including locked packages that aren't
+        installed at all. Installed distributions are enumerated in-process, so neither pip nor
+        the package index is queried. Each package is pinned to its locked version, which may be
+        older than the installed one.
+
+        :returns: the update record of each package that has drifted from the lockfile
+        """
+        with self.span("read lockfile", "discovery"):
+            lockfile: Lockfile = Lockfile(self.lockfile)
+            installed: dict[str, tuple[str, str]] = self.get_installed()
+        if lockfile.unpinned:
+            self.log(
+                "Ignoring lockfile entries that aren't pinned to a single version: "
+                + ", ".join(lockfile.unpinned),
                 "WARNING"
             )
-            return []
 
-    def get_outdated_modules(self) -> list[str]:
+        for key, (name, version) in lockfile.pins.items():
+            current: Optional[str] = installed.get(key, (name, None))[1]
+            locked: Optional[Version] = parse_version(version)
+            if current is not None and (
+                current == version or (locked is not None and parse_version(current) == locked)
+            ):
+                continue
+            self.pinned.add(key)
+            yield PackageUpdate.create(name, current or "none", version)._replace(
+                constraint=f"=={version}"
+            )
+
+    def get_outdated_from_metadata(
+            self, names: Optional[set[str]] = None) -> Iterator[PackageUpdate]:
         """
-        Gets a list of outdated modules using the 'pip list --outdated' command. If this method
-        fails, pipupdater cannot continue and exits with status code 1.
+        Gets the details of each outdated package without running pip. Installed distributions are
+        enumerated in-process using importlib.metadata, and their versions are compared with the
+        latest versions from the index cache. Packages are yielded as soon as their lookup
+        completes, so updates can begin while other lookups are still running.
 
-        :returns: a list of outdated pip packages
+        :param names: optional; the normalised names of the only distributions to check
+        :returns: the update record of each outdated package
         """
+        installed: dict[str, tuple[str, str]] = self.get_installed()
+        if names is not None:
+            installed = {key: value for key, value in installed.items() if key in names}
+        python_version: str = self.get_python_version()
         try:
-            if self.args.source is None:
-                process: CompletedProcess = subprocess.run(
-                    ["pip", "list", "--outdated"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True
-                )
-                self.logger.save_pip_output(process.stdout)
-                return process.stdout.split("\n")
+            with ThreadPoolExecutor(max_workers=INDEX_WORKERS) as executor:
+                lookups: dict[Future, tuple[str, str]] = {
+                    executor.submit(self.get_latest_version, name, python_version): (name, current)
+                    for name, current in installed.values()
+                }
+                for lookup in as_completed(lookups):
+                    latest: Optional[str] = lookup.result()
+                    if latest is not None:
+                        package: PackageUpdate = PackageUpdate.create(*lookups[lookup], latest)
+                        if package.is_outdated:
+                            yield package
+        finally:
+            self.index_cache.save()
+
+    def get_outdated_modules(self, names: Optional[set[str]] = None) -> Iterator[PackageUpdate]:
+        """
+        Gets the details of each outdated package. By default, these are queried from pip using the
+        'pip list --outdated --format json' command, whose output is decoded directly; with the
+        metadata discovery engine, they are found in-process by get_outdated_from_metadata(). If a
+        source file was passed with --source, its lines are read and parsed one at a time instead.
+        If this method fails, an error is logged, self.discovery_failed is set, and no more
+        packages are yielded; it is up to the caller to decide whether to exit, since the Updater
+        may be for one of several environments, or be run again by a watcher.
+
+        Packages are yielded as they are found, rather than collected into a list first.
+
+        If only some distributions are to be checked, they are always checked with the metadata
+        discovery engine, since 'pip list --outdated' can only check every package at once. If a
+        lockfile was passed with --lockfile, the packages that have drifted from it are found by
+        get_lockfile_drift() instead.
+
+        :param names: optional; the normalised names of the only distributions to check
+        :returns: the update record of each outdated package
+        """
+        try:
+            if names is not None:
+                yield from self.get_outdated_from_metadata(names)
+            elif self.lockfile is not None:
+                yield from self.get_lockfile_drift()
+            elif self.args.source is None and self.discovery == "metadata":
+                yield from self.get_outdated_from_metadata()
+            elif self.args.source is None:
+                with self.limiter, self.span("pip list", "discovery"):
+                    process: CompletedProcess = subprocess.run(
+                        [*self.pip, "list", "--outdated", "--format", "json"],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        text=True
+                    )
+                self.logger.save_pip_output(process.stderr + process.stdout)
+                if process.returncode != 0:
+                    raise RuntimeError(f"pip exited with status code {process.returncode}")
+                for package in json.loads(process.stdout):
+                    yield PackageUpdate.create(
+                        package["name"], package["version"], package["latest_version"]
+                    )
             else:
-                return open(self.args.source, "r").readlines()
+                with open(self.args.source, "r") as source_file:
+                    yield from self.parse_source_lines(source_file)
         except Exception as e:
-            self.logger.new(f"Could not get list of outdated packages. Error was: {e}", "FATAL")
-            sys.exit(1)
+            self.log(f"Could not get list of outdated packages. Error was: {e}", "ERROR")
+            self.discovery_failed = True
+
+    def get_python_version(self) -> str:
+        """
+        Gets the Python version of the environment being updated, which decides which releases of
+        each package can be installed into it.
+
+        :returns: the environment's Python version, e.g. "3.9.18"
+        """
+        if self.python is None:
+            return platform.python_version()
+        process: CompletedProcess = subprocess.run(
+            [self.python, "-c", "import platform; print(platform.python_version())"],
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True
+        )
+        return process.stdout.strip()
+
+    def get_search_path(self) -> list[str]:
+        """
+        Gets the module search path (sys.path) of the environment being updated, which is where its
+        installed distributions are found.
+
+        :returns: the environment's module search path
+        """
+        if self.python is None:
+            return sys.path
+        process: CompletedProcess = subprocess.run(
+            [self.python, "-c", "import json, sys; print(json.dumps(sys.path))"],
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True
+        )
+        return json.loads(process.stdout)
+
+    def install_command(self, packages: list[PackageUpdate]) -> list[str]:
+        """
+        Gets the pip command that updates a given list of packages. Packages are installed from the
+        wheelhouse, pinned to their latest versions, if there is one; otherwise they are updated
+        from the package index. Either way, a package limited by the policy is given its
+        constraint rather than its latest version.
+
+        :param packages: the update records of the packages to update
+        :returns: the pip command
+        """
+        if self.wheelhouse is None:
+            return [*self.pip, "install", "-U", *[
+                package.requirement
+                if normalise_name(package.name) in self.pinned or package.constraint is not None
+                else package.name
+                for package in packages
+            ]]
+        return [
+            *self.pip, "install", "-U", *self.wheelhouse.install_options(),
+            *[package.requirement for package in packages]
+        ]
+
+    def log(self, message: str, scope: str) -> None:
+        """
+        Creates a new log entry, marked with the environment being updated if there is one.
+
+        :param message: the log message
+        :param scope: the scope of the message
+        """
+        self.logger.new(message if self.python is None else f"[{self.python}] {message}", scope)
 
-    def update_all(self) -> None:
+    def log_progress(self, progress: Progress) -> None:
         """
-        Updates all packages using a source in the form of a list of strings. Each item in the list
-        represents a line of data; packages should be separated by line breaks.
+        Logs a progress event from a running pip command.
+
+        :param progress: the progress event
+        """
+        self.log(f"{', '.join(progress.packages)}: {progress.line}", "DEBUG")
+
+    def parse_source_lines(self, source: Iterable[str]) -> Iterator[PackageUpdate]:
         """
-        self.logger.new("Getting package list...", "INFO")
-        source: list[str] = self.get_outdated_modules()
+        Parses the details of outdated packages from the lines of a source file, in the human-
+        readable format output by 'pip list --outdated'. Lines starting with one of the configured
+        prefixes, and lines that cannot be parsed, are skipped.
 
-        self.logger.new("Updating packages...", "INFO")
+        :param source: the lines to parse; can be an open file, which is then read lazily
+        :returns: the update record of each outdated package
+        """
         for line in source:
+            line = line.rstrip("\n")
 
             # don't try to install debug/error output
-            if str_starts_with(line, self.prefixes) or len(line) == 0:
-                # slice here removes new-line character
-                self.logger.new(f"Skipping line: \"{line[:len(line)]}\"", "DEBUG")
+            if self.classifier.is_skipped(line):
+                self.log(f"Skipping line: \"{line}\"", "DEBUG")
+                continue
+
+            package: Optional[PackageUpdate] = self.extract_package_details(line)
+
+            # if there is no record, something has gone wrong with the parsing, and pipupdater
+            # should not attempt to update the package
+            if package is not None:
+                yield package
+
+    def prefetch_wheel(self, package: PackageUpdate) -> Optional[PackageUpdate]:
+        """
+        Builds the wheels for a package into the wheelhouse. If this fails with a network error, the
+        package's update is retried with the retrier, and its wheels fetched again first (see
+        refetch_wheels()); if it fails otherwise, the update is recorded as failed.
+
+        :param package: the update record of the package
+        :returns: the update record of the package if its wheels were built, otherwise None
+        """
+        self.log(f"Fetching wheels for package: {package.name}...", "DEBUG")
+        start: float = time.perf_counter()
+        try:
+            with self.span("wheel", "download", package=package.name):
+                result: RunResult = self.wheelhouse.build(self.pip, package, self.limiter)
+        except Exception as e:
+            self.log(f"Could not fetch wheels for package: {package.name} ({e})", "DEBUG")
+            self.record_result(package, Status.FAILED, None, time.perf_counter() - start)
+            return None
+
+        if result.exit_code == 0:
+            return package
+        if self.skip_unsatisfiable(package, result.exit_code, result.output):
+            return None
+        # the retry is run by the same update method as the other tasks, so takes the same form
+        self.refetch.add(normalise_name(package.name))
+        failure: Optional[Failure] = self.retry(
+            package, result.exit_code, result.output, [package] if self.batch else package
+        )
+        if failure is None:
+            return None
+        self.refetch.discard(normalise_name(package.name))
+        self.record_result(
+            package,
+            Status.FAILED,
+            result.exit_code,
+            time.perf_counter() - start,
+            failure,
+            result.segments
+        )
+        return None
+
+    def prefetch_wheels(self, packages: Iterable[PackageUpdate]) -> Iterator[PackageUpdate]:
+        """
+        The first stage of updating with a wheelhouse: builds the wheels for each package into the
+        wheelhouse, self.jobs at a time, and yields each package once its wheels are ready.
+        This keeps network-bound downloads and builds separate from installs, which can then run
+        from the wheelhouse alone.
+
+        :param packages: the update records of the packages to fetch wheels for
+        :returns: the update records of the packages whose wheels are ready
+        """
+        pending: set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for package in packages:
+                pending.add(executor.submit(self.prefetch_wheel, package))
+                done: set[Future] = {future for future in pending if future.done()}
+                if len(pending) >= self.jobs * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    if future.result() is not None:
+                        yield future.result()
+            for future in as_completed(pending):
+                if future.result() is not None:
+                    yield future.result()
+
+    def run_preflight(self, packages: list[PackageUpdate]) -> list[PackageUpdate]:
+        """
+        Checks a list of package updates for conflicts before any are installed. Updates that would
+        conflict are recorded in self.skipped and dropped, and packages that can only be updated to
+        an older version than their latest are pinned to that version.
+
+        :param packages: the update records of the packages to check
+        :returns: the update records of the packages to update
+        """
+        if len(packages) == 0:
+            return packages
+
+        self.log(f"Checking {len(packages)} updates for conflicts...", "INFO")
+        try:
+            installed: dict[str, str] = {
+                name: version for name, (_, version) in self.get_installed().items()
+            }
+            with self.span("check conflicts", "resolve", count=len(packages)):
+                dropped, pins = self.preflight.check(self.pip, packages, installed, self.limiter)
+        except Exception as e:
+            self.log(f"Could not check updates for conflicts; skipping check. Error was: {e}",
+                     "WARNING")
+            return packages
+
+        checked: list[PackageUpdate] = []
+        for package in packages:
+            name: str = normalise_name(package.name)
+            if name in dropped:
+                self.log(f"Skipping package: {package.name} (update would conflict)", "WARNING")
+                self.record_skipped(package, "update would conflict")
+            elif name in pins:
+                self.log(f"Pinning package: {package.name}=={pins[name]} (latest version would"
+                         + " conflict)", "INFO")
+                self.pinned.add(name)
+                checked.append(package._replace(
+                    latest=pins[name], latest_version=parse_version(pins[name]), constraint=None
+                ))
+            else:
+                checked.append(package)
+        return checked
+
+    def record_dependencies(self, packages: list[PackageUpdate], output: str) -> None:
+        """
+        Records the packages that a pip install command installed or updated as dependencies of the
+        packages it was updating, in self.dependencies.
+
+        :param packages: the update records of the packages the command was updating
+        :param output: the output of the command
+        """
+        targets: set[str] = {normalise_name(package.name) for package in packages}
+        replaced: dict[str, str] = parse_replaced(output)
+        for name, version in parse_installed(output).items():
+            if name not in targets:
+                self.dependencies.append(
+                    PackageUpdate.create(name, replaced.get(name, "none"), version)
+                    .with_result(Status.SUCCESS)
+                )
+
+    def record_result(self,
+                      package: PackageUpdate,
+                      status: Status,
+                      exit_code: Optional[int],
+                      duration: float,
+                      failure: Failure = Failure.OTHER,
+                      segments: Iterable[dict[str, Any]] = ()) -> None:
+        """
+        Records the outcome of a package's update in the appropriate result store: successful
+        updates in self.success, packages that were already up to date in self.unchanged, and
+        failed or partially failed updates in self.failed.
+
+        :param package: the update record of the package
+        :param status: the outcome of the update
+        :param exit_code: the exit code of the pip command that ran the update, if it ran
+        :param duration: how long the update took, in seconds
+        :param failure: optional; the kind of failure, if the update failed
+        :param segments: optional; where the update's pip output was saved in the pip log
+        """
+        result: PackageUpdate = package.with_result(status, exit_code, duration)
+        if self.journal is not None:
+            self.journal.record(result)
+        if self.report is not None:
+            self.report.record(
+                result, self.python, self.run_id, failure=failure, segments=segments
+            )
+
+        if status == Status.SUCCESS:
+            self.success.append(result)
+        elif status == Status.UNCHANGED:
+            self.log(f"Package was already up to date: {package.name}", "DEBUG")
+            self.unchanged.append(result)
+        else:
+            self.log(
+                f"Failed to update package: {package.name} (exit code {exit_code}"
+                + ("" if failure == Failure.OTHER else f", {failure.name.lower()} error")
+                + (", other packages were changed)" if status == Status.PARTIAL else ")"),
+                "ERROR"
+            )
+            self.failed.append(result)
+
+    def record_skipped(self, package: PackageUpdate, reason: str) -> None:
+        """
+        Records that a package's update was skipped in self.skipped.
+
+        :param package: the update record of the package
+        :param reason: why the update was skipped
+        """
+        result: PackageUpdate = package.with_result(Status.SKIPPED)
+        if self.report is not None:
+            self.report.record(result, self.python, self.run_id, reason=reason)
+        self.skipped.append(result)
+
+    def refetch_wheels(self, packages: list[PackageUpdate]) -> list[PackageUpdate]:
+        """
+        Fetches the wheels of any of a list of packages whose wheels failed to be fetched with a
+        network error, before they are installed. Their retries are run by the update methods along
+        with every other retry, rather than by prefetch_wheels(), which may have finished by then.
+
+        :param packages: the update records of the packages about to be installed
+        :returns: the update records of the packages whose wheels are ready
+        """
+        ready: list[PackageUpdate] = []
+        for package in packages:
+            name: str = normalise_name(package.name)
+            if name in self.refetch:
+                self.refetch.discard(name)
+                package = self.prefetch_wheel(package)
+            if package is not None:
+                ready.append(package)
+        return ready
+
+    def retry(self,
+              package: PackageUpdate,
+              exit_code: Optional[int],
+              output: str,
+              task: Any) -> Optional[Failure]:
+        """
+        Classifies why a package's update failed and, if the failure looks transient, schedules a
+        retry of the update with the retrier.
+
+        :param package: the update record of the package
+        :param exit_code: the exit code of the pip command that ran the update, if it ran
+        :param output: the output of the pip command
+        :param task: what to pass to the update method to retry the update
+        :returns: the kind of failure, or None if a retry was scheduled
+        """
+        failure: Failure = classify_failure(exit_code, output)
+        if failure != Failure.NETWORK:
+            return failure
+
+        delay: Optional[float] = self.retrier.schedule(normalise_name(package.name), task)
+        if delay is None:
+            self.log(f"Not retrying package: {package.name} (no retries left)", "DEBUG")
+            return failure
+        self.log(
+            f"Update of package {package.name} failed with a network error; retrying in"
+            + f" {delay:.1f} seconds.",
+            "WARNING"
+        )
+        return None
+
+    def rollback(self, run_id: Optional[str] = None) -> None:
+        """
+        Rolls the environment back to a snapshot, reinstalling the version each distribution had
+        when the snapshot was taken with a single pip command. Wheels are installed from the
+        snapshot store, so if it holds all of them the rollback works offline. Distributions that
+        weren't installed when the snapshot was taken are left in place.
+
+        :param run_id: optional; the identifier of the run to roll back; if not given, the most
+                       recent run with a snapshot is rolled back
+        """
+        try:
+            snapshot: dict[str, Any] = self.snapshots.load(self.python, run_id)
+        except FileNotFoundError as e:
+            self.log(f"Could not roll back: {e}.", "ERROR")
+            return
+
+        self.log(f"Rolling back run: {snapshot['run']}...", "INFO")
+        after: dict[str, tuple[str, str]] = self.get_installed()
+        packages: list[PackageUpdate] = [
+            PackageUpdate.create(name, after.get(key, (None, "none"))[1], version)
+            for key, (name, version) in snapshot["installed"].items()
+            if after.get(key, (None, None))[1] != version
+        ]
+        if not packages:
+            self.log("Nothing to roll back; the environment matches the snapshot.", "INFO")
+            return
+
+        options: list[str] = self.snapshots.wheel_options()
+        if all(self.snapshots.find_wheel(package.name, package.latest) for package in packages):
+            options.append("--no-index")
+        else:
+            self.log(
+                "Some wheels are missing from the snapshot store; they will be downloaded from the"
+                + " index.",
+                "WARNING"
+            )
+
+        names: list[str] = [package.name for package in packages]
+        start: float = time.perf_counter()
+        exit_code: Optional[int] = None
+        output: str = ""
+        try:
+            with self.install_lock, self.limiter, self.span("rollback", "install", packages=names):
+                result: RunResult = self.runner.run(
+                    [*self.pip, "install", "--no-deps", *options,
+                     *[package.requirement for package in packages]],
+                    names
+                )
+            exit_code = result.exit_code
+            output = result.output
+        except Exception as e:
+            self.log(f"Failed to run rollback ({e})", "DEBUG")
+        duration: float = (time.perf_counter() - start) / len(packages)
+
+        for package in packages:
+            self.record_result(
+                package, classify_result(package.name, exit_code, output), exit_code, duration
+            )
+        self.logger.print_results(self.failed, self.success, self.unchanged)
+
+    @property
+    def run_id(self) -> Optional[str]:
+        """
+        The identifier of the current run in the run journal, if there is one.
+        """
+        return self.journal.run_id if self.journal is not None else None
+
+    def skip_journaled(self, packages: Iterable[PackageUpdate]) -> Iterator[PackageUpdate]:
+        """
+        Filters out packages that the run journal shows don't need updating: with --resume, those
+        an earlier run already brought to their latest version, and with --incremental, those
+        whose latest version hasn't changed since the last completed run. Skipped packages are
+        recorded in self.skipped. Packages drifting from a lockfile are never skipped, as their
+        "latest" version is the locked one, so the journal can't tell a package that drifted again
+        since the last run from one that run already brought back in line.
+
+        :param packages: the update records of the packages to filter
+        :returns: the update records of the packages that should be updated
+        """
+        for package in packages:
+            if self.journal is None or self.lockfile is not None:
+                yield package
                 continue
 
-            package_details: list[str] = self.extract_package_details(line)
+            if self.resume and self.journal.is_reached(package):
+                reason: str = "already updated by an earlier run"
+            elif self.incremental and self.journal.is_seen(package):
+                reason = "latest version unchanged since the last run"
+            else:
+                yield package
+                continue
+
+            self.log(f"Skipping package: {package.name} ({reason})", "DEBUG")
+            self.record_skipped(package, reason)
+
+    def skip_unsatisfiable(self,
+                           package: PackageUpdate,
+                           exit_code: Optional[int],
+                           output: str) -> bool:
+        """
+        Holds back a package whose update the policy limited, if pip found no version of it that
+        the limit allows, e.g. because its pin only allows versions older than the installed one.
+        The package is recorded in self.skipped rather than as failed, as if the policy had held it
+        back up front.
+
+        :param package: the update record of the package
+        :param exit_code: the exit code of the pip command that ran the update, if it ran
+        :param output: the output of the pip command
+        :returns: whether the package was held back
+        """
+        if package.constraint is None or normalise_name(package.name) in self.pinned:
+            return False
+        if classify_failure(exit_code, output) != Failure.RESOLUTION:
+            return False
+        if normalise_name(package.name) not in parse_unmatched(output):
+            return False
+        reason: str = f"no version satisfies {package.constraint}"
+        self.log(f"Skipping package: {package.name} ({reason})", "DEBUG")
+        self.record_skipped(package, reason)
+        return True
+
+    def span(self, name: str, phase: str, **details: Any) -> ContextManager:
+        """
+        Times a section of the run with the profiler, noting the environment being updated if it
+        isn't the one found on PATH.
+
+        :param name: what is being timed
+        :param phase: the phase of the run the section belongs to
+        :param details: any other details of the section, e.g. the package it was for
+        :returns: the context manager
+        """
+        if self.python is not None:
+            details["environment"] = self.python
+        return self.profiler.span(name, phase, **details)
+
+    def split_batches(self, packages: Iterable[PackageUpdate]) -> Iterator[list[PackageUpdate]]:
+        """
+        Groups packages into batches of self.batch_size, yielding each batch as soon as it is full.
+        With a batch size of 0, every package is put into a single batch.
+
+        :param packages: the update records of the packages to group
+        :returns: the batches of update records
+        """
+        batch: list[PackageUpdate] = []
+        for package in packages:
+            batch.append(package)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    def take_snapshot(self) -> Optional[dict[str, tuple[str, str]]]:
+        """
+        Snapshots the environment before any of the run's updates start, recording the version of
+        every installed distribution. This is done in-process, so costs no more than a directory
+        scan; the wheels are saved by finish_snapshot() once the updates have finished.
+
+        :returns: the name and version of each installed distribution, keyed by normalised name, or
+                  None if the snapshot could not be taken
+        """
+        try:
+            with self.span("snapshot", "discovery"):
+                installed: dict[str, tuple[str, str]] = self.get_installed()
+                self.snapshots.save(self.python, self.journal.run_id, installed)
+        except Exception as e:
+            self.log(
+                f"Could not snapshot environment; this run can't be rolled back. Error was: {e}",
+                "WARNING"
+            )
+            return None
+        self.log(f"Snapshotted {len(installed)} installed distributions.", "DEBUG")
+        return installed
 
-            # if there are not three items in the package details, something has gone wrong with
-            # the parsing, and pipupdater should not attempt to update the package
-            if len(package_details) == 3:
-                self.update_package(package_details)
+    def update_all(self, print_results: bool = True, names: Optional[set[str]] = None) -> None:
+        """
+        Updates all outdated packages, as found by get_outdated_modules(). Discovery and updating
+        form a pipeline: each package (or batch of packages) is dispatched for updating as soon as
+        it is found.
 
-        self.logger.print_results(self.failed, self.success)
+        :param print_results: optional, default True; whether to output the results once finished
+        :param names: optional; the normalised names of the only distributions to check
+        """
+        self.log("Getting package list and updating packages...", "INFO")
+        self.discovery_failed = False
+        if self.journal is not None:
+            self.log(f"Starting run: {self.journal.start_run()}", "DEBUG")
+        installed: Optional[dict[str, tuple[str, str]]] = None
+        if self.snapshots is not None and self.journal is not None:
+            installed = self.take_snapshot()
+        packages: Iterator[PackageUpdate] = self.profiler.iterate(
+            self.get_outdated_modules(names), "find outdated", "discovery"
+        )
+        if self.policy is not None and not self.policy.is_empty():
+            packages = self.apply_policy(packages)
+        packages = self.skip_journaled(packages)
+        if self.preflight is not None:
+            packages = iter(self.run_preflight(list(packages)))
+
+        if self.wheelhouse is not None:
+            packages = self.prefetch_wheels(packages)
+
+        # the wheelhouse isn't evicted from until every environment sharing it has installed
+        session: ContextManager = (
+            nullcontext() if self.wheelhouse is None else self.wheelhouse.session()
+        )
+        with session:
+            if self.ordered:
+                packages = list(packages)
+                with self.span("order", "resolve", count=len(packages)):
+                    waves: list[list[PackageUpdate]] = Scheduler(
+                        self.get_search_path()
+                    ).waves(packages)
+                for number, wave in enumerate(waves, 1):
+                    self.log(
+                        f"Updating wave {number} of {len(waves)} ({len(wave)} packages)", "DEBUG"
+                    )
+                    self.dispatch(wave)
+            else:
+                self.dispatch(packages)
+
+        if installed is not None:
+            self.finish_snapshot(installed)
+        # a run whose discovery failed is left unfinished in the journal, and has no results worth
+        # printing beyond the error
+        if self.discovery_failed:
+            return
+        if self.journal is not None:
+            self.journal.finish_run()
+        if print_results:
+            self.logger.print_results(
+                self.failed, self.success, self.unchanged, self.skipped, self.dependencies
+            )
+
+    def update_batch(self, packages: list[PackageUpdate]) -> None:
+        """
+        Attempts to update a list of packages with a single pip update command. If the command
+        fails, the list is split in half and each half is retried, until the package(s) responsible
+        for the failure have been isolated; this keeps the result stores accurate for each
+        individual package. A batch that fails with a network error isn't split, since the fault
+        isn't with any of its packages; the whole batch is retried with the retrier instead.
+
+        :param packages: the update records of the packages to update
+        """
+        packages = self.refetch_wheels(packages)
+        if len(packages) == 0:
+            return
+        names: list[str] = [package.name for package in packages]
+        self.log(f"Updating package{'s' * (len(names) > 1)}: {', '.join(names)}...", "INFO")
+        exit_code: Optional[int] = None
+        output: str = ""
+        segments: tuple[dict[str, Any], ...] = ()
+        start: float = time.perf_counter()
+        try:
+            with self.install_lock, self.limiter, self.span("batch", "install", packages=names):
+                result: RunResult = self.runner.run(self.install_command(packages), names)
+            exit_code = result.exit_code
+            output = result.output
+            segments = result.segments
+        except Exception as e:
+            self.log(f"Failed to run batch update ({e})", "DEBUG")
+        # a batch's duration is shared between each package in it
+        duration: float = (time.perf_counter() - start) / len(packages)
+
+        if exit_code == 0 or len(packages) == 1:
+            self.record_dependencies(packages, output)
+            installed: dict[str, str] = parse_installed(output)
+            for package in packages:
+                package = package.with_installed(installed)
+                status: Status = classify_result(package.name, exit_code, output)
+                failure: Optional[Failure] = Failure.OTHER
+                if status == Status.FAILED:
+                    if self.skip_unsatisfiable(package, exit_code, output):
+                        continue
+                    failure = self.retry(package, exit_code, output, [package])
+                    if failure is None:
+                        continue
+                elif status == Status.PARTIAL:
+                    failure = classify_failure(exit_code, output)
+                self.record_result(package, status, exit_code, duration, failure, segments)
+        elif classify_failure(exit_code, output) == Failure.NETWORK:
+            # every half of the batch would fail in the same way, so rather than splitting it, the
+            # whole batch is retried once the network has had time to recover
+            delay: Optional[float] = self.retrier.schedule(
+                ",".join(sorted(normalise_name(name) for name in names)), packages
+            )
+            if delay is not None:
+                self.log(
+                    f"Batch update of {len(names)} packages failed with a network error; retrying"
+                    + f" in {delay:.1f} seconds.",
+                    "WARNING"
+                )
+                return
+            self.log(f"Not retrying batch update of {len(names)} packages (no retries left)",
+                     "DEBUG")
+            self.record_dependencies(packages, output)
+            for package in packages:
+                self.record_result(
+                    package,
+                    classify_result(package.name, exit_code, output),
+                    exit_code,
+                    duration,
+                    Failure.NETWORK,
+                    segments
+                )
+        else:
+            middle: int = len(packages) // 2
+            self.log(
+                f"Batch update of {len(names)} packages failed; splitting into smaller batches.",
+                "DEBUG"
+            )
+            self.update_batch(packages[:middle])
+            self.update_batch(packages[middle:])
+
+    def update_concurrently(self, update: Callable[[Any], None], tasks: Iterable[Any]) -> None:
+        """
+        Runs a given update method over a stream of tasks using a pool of worker threads, with at
+        most self.jobs updates running at any one time, though only one of them installs at a time
+        (see self.install_lock). Tasks are only taken from the stream while fewer than twice that
+        many are queued, so a fast producer can't fill memory with pending updates. Retries are
+        submitted alongside the other tasks as they come due. Returns once every update, and every
+        retry, has finished.
+
+        :param update: the update method to run, either update_package() or update_batch()
+        :param tasks: the arguments to pass to the update method, one per call
+        """
+        self.log(f"Running up to {self.jobs} updates at once.", "DEBUG")
+        pending: set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for task in tasks:
+                if len(pending) >= self.jobs * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        # re-raises any exception not handled within the update method
+                        future.result()
+                for retry in self.retrier.due():
+                    pending.add(executor.submit(update, retry))
+                pending.add(executor.submit(update, task))
+
+            # retries can still be scheduled by the updates that are running
+            while pending or len(self.retrier) > 0:
+                for retry in self.retrier.due():
+                    pending.add(executor.submit(update, retry))
+                if not pending:
+                    time.sleep(self.retrier.wait_time() or 0)
+                    continue
+                done, pending = wait(
+                    pending, timeout=self.retrier.wait_time(), return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    future.result()
 
-    def update_package(self, package_details: list[str]) -> None:
+    def update_package(self, package: PackageUpdate) -> None:
         """
-        Attempts to update a package with a given name, using subprocess.run() to execute a pip update
-        command.
+        Attempts to update a given package, using the PipRunner to execute a pip update command.
+        The outcome is classified from the command's exit code and output by classify_result().
 
-        :param package: the name of the package to update
-        :param logger: the logger instance
+        :param package: the update record of the package to update
         """
+        if not self.refetch_wheels([package]):
+            return
+        start: float = time.perf_counter()
         try:
-            self.logger.new(f"Updating package: {package_details[0]}...", "INFO")
-            process: CompletedProcess = subprocess.run(
-                ["pip", "install", "-U", package_details[0]],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True
+            self.log(f"Updating package: {package.name}...", "INFO")
+            with self.install_lock, self.limiter, self.span(
+                "update", "install", package=package.name
+            ):
+                result: RunResult = self.runner.run(self.install_command([package]), [package.name])
+            self.record_dependencies([package], result.output)
+            package = package.with_installed(parse_installed(result.output))
+            status: Status = classify_result(package.name, result.exit_code, result.output)
+            failure: Optional[Failure] = Failure.OTHER
+            if status == Status.FAILED:
+                if self.skip_unsatisfiable(package, result.exit_code, result.output):
+                    return
+                failure = self.retry(package, result.exit_code, result.output, package)
+                if failure is None:
+                    return
+            elif status == Status.PARTIAL:
+                failure = classify_failure(result.exit_code, result.output)
+            self.record_result(
+                package,
+                status,
+                result.exit_code,
+                time.perf_counter() - start,
+                failure,
+                result.segments
             )
-            self.logger.save_pip_output(process.stdout)
-            self.success.append(package_details)
         except Exception as e:
-            self.logger.new(f"Failed to update package: {package_details[0]} ({e})", "ERROR")
-            self.failed.append(package_details)
\ No newline at end of file
+            self.log(f"Could not run update for package: {package.name} ({e})", "DEBUG")
+            self.record_result(package, Status.FAILED, None, time.perf_counter() - start)
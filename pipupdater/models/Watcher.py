@@ -0,0 +1,357 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+from ..helpers import normalise_name
+from .Logger import Logger
+
+from typing import Any, Callable, Optional
+
+
+# the endings of the folders that hold installed distributions' metadata
+METADATA_SUFFIXES: tuple[str, ...] = (".dist-info", ".egg-info")
+
+
+class Watcher():
+    """
+    Keeps pipupdater running, updating an environment on a schedule and whenever it changes. The
+    config options and the state of the environment are kept in memory between updates, so each
+    check costs only the work it needs:
+    - every poll seconds, the folders on the environment's module search path are stat-ed; only if
+      one has changed are they scanned, and only the distributions added or changed since the last
+      scan are checked for updates;
+    - every poll seconds, the config file is fingerprinted, and the options reloaded if it changed;
+    - every interval seconds, every distribution is checked.
+
+    A local UNIX socket accepts one command per connection, as a line of text, and replies with a
+    line of JSON:
+    - "status": the state of the watcher and the results of the last update;
+    - "update": queue a check of every distribution;
+    - "check [name] ...": queue a check of the given distributions;
+    - "stop": stop the watcher once any update in progress has finished.
+
+    :param run: a function that runs an update, checking only the given distributions if any are
+                given, and returns the number of packages with each outcome
+    :param reload: a function that reloads the config options
+    :param search_path: the module search path of the environment
+    :param config_path: the path to the config file
+    :param interval: the time between scheduled checks of every distribution, in seconds
+    :param poll: the time between checks for changes to the environment and config file, in seconds
+    :param socket_path: the path to the socket, or None not to open one
+    :param logger: the logger instance
+    """
+    def __init__(self,
+                 run: Callable[[Optional[set[str]]], dict[str, int]],
+                 reload: Callable[[], None],
+                 search_path: list[str],
+                 config_path: str,
+                 interval: float,
+                 poll: float,
+                 socket_path: Optional[str],
+                 logger: Logger) -> None:
+        self.run: Callable[[Optional[set[str]]], dict[str, int]] = run
+        self.reload: Callable[[], None] = reload
+        self.search_path: list[str] = [path for path in search_path if os.path.isdir(path)]
+        self.config_path: str = config_path
+        self.interval: float = interval
+        self.poll: float = poll
+        self.socket_path: Optional[str] = socket_path
+        self.logger: Logger = logger
+
+        # the version of each installed distribution, keyed by normalised name
+        self.installed: dict[str, str] = {}
+        self.last_run: Optional[dict[str, Any]] = None
+        self.next_check: float = time.time()
+        self.runs: int = 0
+        self.running: bool = False
+        self.started: float = time.time()
+
+        self._config: Optional[tuple[int, int]] = None
+        self._full: bool = True
+        self._lock: threading.Lock = threading.Lock()
+        self._mtimes: dict[str, int] = {}
+        self._pending: set[str] = set()
+        self._server: Optional[socketserver.BaseServer] = None
+        self._stop: threading.Event = threading.Event()
+        self._wake: threading.Event = threading.Event()
+
+    def __check_config(self) -> None:
+        """
+        Reloads the config options if the config file's modification time or size has changed.
+        """
+        try:
+            stat: os.stat_result = os.stat(self.config_path)
+        except OSError:
+            return
+        current: tuple[int, int] = (stat.st_mtime_ns, stat.st_size)
+        if self._config is not None and current != self._config:
+            self.logger.new("Config file changed; reloading config options.", "INFO")
+            try:
+                self.reload()
+            except Exception as e:
+                self.logger.new(f"Could not reload config options. Error was: {e}", "WARNING")
+        self._config = current
+
+    def __check_environment(self) -> None:
+        """
+        Finds the distributions added or changed since the environment was last scanned, and queues
+        them to be checked for updates. The environment is only scanned if a folder on its module
+        search path has been modified.
+        """
+        mtimes: dict[str, int] = self.__stat()
+        if mtimes == self._mtimes:
+            return
+        self._mtimes = mtimes
+
+        installed: dict[str, str] = self.__scan()
+        changed: set[str] = {
+            name for name, version in installed.items() if self.installed.get(name) != version
+        }
+        self.installed = installed
+        if changed:
+            self.logger.new(
+                f"Installed distributions changed: {', '.join(sorted(changed))}", "DEBUG"
+            )
+            with self._lock:
+                self._pending.update(changed)
+
+    def __handle(self, command: str) -> dict[str, Any]:
+        """
+        Carries out a command received on the socket.
+
+        :param command: the command, e.g. "status"
+        :returns: the reply
+        """
+        words: list[str] = command.split()
+        if not words:
+            return {"error": "no command given"}
+
+        if words[0] == "status":
+            with self._lock:
+                return {
+                    "pid": os.getpid(),
+                    "started": self.started,
+                    "running": self.running,
+                    "runs": self.runs,
+                    "last_run": self.last_run,
+                    "next_check": self.next_check,
+                    "distributions": len(self.installed),
+                    "pending": sorted(self._pending),
+                }
+        if words[0] == "update":
+            with self._lock:
+                self._full = True
+            self._wake.set()
+            return {"queued": "all"}
+        if words[0] == "check" and len(words) > 1:
+            names: list[str] = [normalise_name(name) for name in words[1:]]
+            with self._lock:
+                self._pending.update(names)
+            self._wake.set()
+            return {"queued": names}
+        if words[0] == "stop":
+            self.stop()
+            return {"stopping": True}
+        return {"error": f"unknown command: {command.strip()}"}
+
+    def __open_socket(self) -> None:
+        """
+        Starts serving the status and trigger socket on a background thread. Any file left at the
+        socket's path by a watcher that didn't shut down cleanly is replaced, but a socket that
+        another watcher is still listening on is not.
+
+        :raises RuntimeError: if another watcher is listening on the socket
+        """
+        if self.socket_path is None:
+            return
+        if not hasattr(socket, "AF_UNIX"):
+            self.logger.new("UNIX sockets are not supported on this platform; not opening"
+                            + " the status socket.", "WARNING")
+            return
+
+        handle: Callable[[str], dict[str, Any]] = self.__handle
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                command: str = self.rfile.readline(4096).decode("utf-8", "replace")
+                reply: dict[str, Any] = handle(command)
+                try:
+                    self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+                except OSError:
+                    # the client hung up without waiting for a reply, as another watcher checking
+                    # whether this one is running does
+                    pass
+
+        if os.path.exists(self.socket_path):
+            probe: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                # nothing is listening, so the file is left over from a watcher that has exited
+                os.remove(self.socket_path)
+            else:
+                raise RuntimeError(f"another watcher is already listening on {self.socket_path}")
+            finally:
+                probe.close()
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.logger.new(f"Listening on socket: {self.socket_path}", "INFO")
+
+    def __run(self, names: Optional[set[str]]) -> None:
+        """
+        Runs an update, then rescans the environment so the update's own changes aren't mistaken
+        for outside ones.
+
+        :param names: the normalised names of the only distributions to check, or None for all
+        """
+        with self._lock:
+            self.running = True
+        self.logger.new(
+            "Checking all distributions for updates..." if names is None else
+            f"Checking changed distributions for updates: {', '.join(sorted(names))}...",
+            "INFO"
+        )
+        start: float = time.time()
+        results: dict[str, int] = {}
+        try:
+            results = self.run(names)
+        except Exception as e:
+            self.logger.new(f"Update failed. Error was: {e}", "ERROR")
+
+        # the logger holds every entry in memory until it is written out, which would grow without
+        # limit in a process that never exits
+        self.logger.output()
+
+        self._mtimes = self.__stat()
+        self.installed = self.__scan()
+        with self._lock:
+            self.running = False
+            self.runs += 1
+            self.last_run = {
+                "time": start,
+                "duration": time.time() - start,
+                "checked": "all" if names is None else sorted(names),
+                **results,
+            }
+
+    def __scan(self) -> dict[str, str]:
+        """
+        Lists the distributions installed in the environment from the names of their metadata
+        folders, without reading the metadata itself.
+
+        :returns: the version of each distribution, keyed by normalised name
+        """
+        installed: dict[str, str] = {}
+        for path in self.search_path:
+            try:
+                entries: list[os.DirEntry] = list(os.scandir(path))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.name.endswith(METADATA_SUFFIXES):
+                    continue
+                # the folders are named [name]-[version].dist-info, with "-" in names replaced
+                name, _, version = entry.name.rsplit(".", 1)[0].partition("-")
+                installed.setdefault(normalise_name(name), version)
+        return installed
+
+    def __stat(self) -> dict[str, int]:
+        """
+        Gets the modification time of each folder on the module search path, which changes whenever
+        a distribution is installed into or removed from it.
+
+        :returns: the modification time of each folder, in nanoseconds, keyed by path
+        """
+        mtimes: dict[str, int] = {}
+        for path in self.search_path:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+        return mtimes
+
+    def serve(self) -> None:
+        """
+        Runs the watcher until it is stopped, with the "stop" command, SIGTERM or Ctrl+C. If
+        another watcher is already listening on the socket, returns without starting.
+        """
+        try:
+            self.__open_socket()
+        except RuntimeError as e:
+            self.logger.new(f"Could not start watcher. Error was: {e}", "FATAL")
+            return
+        try:
+            signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        except ValueError:
+            # signal handlers can only be set from the main thread
+            pass
+
+        self._mtimes = self.__stat()
+        self.installed = self.__scan()
+        self.logger.new(
+            f"Watching {len(self.installed)} installed distributions; checking for updates every"
+            + f" {self.interval:g} seconds.",
+            "INFO"
+        )
+        try:
+            while not self._stop.is_set():
+                self.__check_config()
+                self.__check_environment()
+
+                names: Optional[set[str]] = None
+                with self._lock:
+                    full: bool = self._full or time.time() >= self.next_check
+                    if full:
+                        self._full = False
+                        self._pending.clear()
+                        self.next_check = time.time() + self.interval
+                    elif self._pending:
+                        names = set(self._pending)
+                        self._pending.clear()
+                if full or names:
+                    self.__run(names)
+
+                self._wake.wait(max(0.0, min(self.poll, self.next_check - time.time())))
+                self._wake.clear()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.logger.new("Stopping watcher.", "INFO")
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                try:
+                    os.remove(self.socket_path)
+                except OSError:
+                    pass
+            self.logger.output()
+
+    def stop(self) -> None:
+        """
+        Stops the watcher once any update in progress has finished.
+        """
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,158 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import re
+import threading
+import time
+
+from .Logger import Logger
+from .PackageUpdate import PackageUpdate
+from .PipRunner import PipRunner, RunResult
+
+from contextlib import contextmanager
+from os import makedirs
+from typing import ContextManager, Iterator
+
+
+# the lines of 'pip wheel' output naming each wheel it saved into, or reused from, the wheel folder
+WHEEL_LINE: re.Pattern = re.compile(
+    r"^\s*(?:Saved|File was already downloaded) (.+\.whl)\s*$", re.MULTILINE
+)
+
+
+class Wheelhouse():
+    """
+    A local folder of built wheels, shared between runs and between environments. Updates using the
+    wheelhouse happen in two stages: first the wheels for a package and its dependencies are built
+    (or downloaded) into the folder with 'pip wheel', then the package is installed from the
+    folder alone, with '--no-index --find-links'. A wheel already in the folder is reused rather
+    than downloaded or built again, so repeat installs of the same version cost almost nothing.
+
+    The folder is kept under a maximum size by evicting the least recently used wheels. Every
+    wheel a build saves or reuses, including those of the package's dependencies, counts as used.
+    Eviction never happens while an update is using the wheelhouse (see session()), so with several
+    environments sharing it, one can't evict wheels another has built but not yet installed.
+
+    :param path: the path to the wheelhouse folder
+    :param max_size: the maximum total size of the wheels in the folder, in bytes
+    :param logger: the logger instance
+    """
+    def __init__(self, path: str, max_size: int, logger: Logger) -> None:
+        self.logger: Logger = logger
+        self.max_size: int = max_size
+        self.path: str = path
+
+        self.runner: PipRunner = PipRunner(logger)
+
+        self._lock: threading.Lock = threading.Lock()
+        # the number of sessions open; eviction waits until there are none
+        self._sessions: int = 0
+        makedirs(self.path, exist_ok=True)
+
+    def __evict(self) -> None:
+        """
+        Deletes the least recently used wheels from the wheelhouse until its total size is no more
+        than the maximum size. Must be called with self._lock held.
+        """
+        wheels: list[os.DirEntry] = [
+            entry for entry in os.scandir(self.path)
+            if entry.is_file() and entry.name.endswith(".whl")
+        ]
+        total: int = sum(entry.stat().st_size for entry in wheels)
+        for entry in sorted(wheels, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_size:
+                break
+            try:
+                total -= entry.stat().st_size
+                os.remove(entry.path)
+                self.logger.new(f"Evicted wheel from wheelhouse: {entry.name}", "DEBUG")
+            except OSError as e:
+                self.logger.new(f"Could not evict wheel: {entry.name} ({e})", "WARNING")
+
+    def build(self, pip: list[str], package: PackageUpdate, limiter: ContextManager) -> RunResult:
+        """
+        Builds (or downloads) the wheels needed to install a package at its latest version into the
+        wheelhouse, reusing any that are already there.
+
+        :param pip: the command used to run pip, e.g. ["pip"]
+        :param package: the update record of the package
+        :param limiter: a context manager that must be held while running pip
+        :returns: the result of the 'pip wheel' command
+        """
+        with limiter:
+            result: RunResult = self.runner.run(
+                [*pip, "wheel", "--wheel-dir", self.path, "--find-links", self.path,
+                 package.requirement],
+                [package.name]
+            )
+        if result.exit_code == 0:
+            self.touch(package, result.output)
+        return result
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used wheels from the wheelhouse until its total size is no more
+        than the maximum size. While a session is open, eviction is left to the last session to
+        close.
+        """
+        with self._lock:
+            if self._sessions == 0:
+                self.__evict()
+
+    def install_options(self) -> list[str]:
+        """
+        Gets the options that make pip install packages from the wheelhouse alone.
+
+        :returns: the pip install options
+        """
+        return ["--no-index", "--find-links", self.path]
+
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        """
+        A context manager held by an update from before it builds its wheels until after it has
+        installed them. Wheels are not evicted while any session is open; the last session to close
+        evicts them instead.
+        """
+        with self._lock:
+            self._sessions += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sessions -= 1
+                if self._sessions == 0:
+                    self.__evict()
+
+    def touch(self, package: PackageUpdate, output: str = "") -> None:
+        """
+        Marks the wheels of a package's latest version as just used, so they are evicted last,
+        along with every other wheel the 'pip wheel' command that built them saved or reused.
+
+        :param package: the update record of the package
+        :param output: optional; the output of the 'pip wheel' command
+        """
+        # wheel filenames use the package name with runs of "-", "_" and "." replaced by "_"
+        prefix: str = f"{re.sub(r'[-_.]+', '_', package.name)}-{package.latest}-".lower()
+        used: set[str] = {os.path.basename(path) for path in WHEEL_LINE.findall(output)}
+        now: float = time.time()
+        with self._lock:
+            for entry in os.scandir(self.path):
+                if entry.name.lower().startswith(prefix) or entry.name in used:
+                    os.utime(entry.path, (now, now))
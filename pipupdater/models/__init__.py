@@ -16,5 +16,32 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 
+from .Fleet import Fleet
+from .IndexCache import IndexCache
+from .Journal import Journal
+from .LineClassifier import LineClassifier
 from .Logger import Logger
+from .PackageUpdate import Failure
+from .PackageUpdate import PackageUpdate
+from .PackageUpdate import Status
+from .PackageUpdate import classify_failure
+from .PackageUpdate import classify_result
+from .PackageUpdate import parse_installed
+from .PackageUpdate import parse_replaced
+from .PackageUpdate import parse_unmatched
+from .PipLog import PipLog
+from .PipRunner import PipRunner
+from .PipRunner import Progress
+from .PipRunner import RunResult
+from .Policy import Policy
+from .Preflight import Preflight
+from .Profiler import Profiler
+from .Profiler import Span
+from .Report import Report
+from .ResultStore import ResultStore
+from .Retrier import Retrier
+from .Scheduler import Scheduler
+from .Snapshots import Snapshots
 from .Updater import Updater
+from .Watcher import Watcher
+from .Wheelhouse import Wheelhouse
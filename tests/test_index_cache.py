@@ -0,0 +1,141 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from pipupdater.models import IndexCache
+from typing import Any, Optional
+from unittest.mock import Mock
+
+
+def release(requires_python: Optional[str] = None, yanked: bool = False) -> list[dict[str, Any]]:
+    """
+    Builds the list of files of a release, as found in the "releases" table of a JSON API response.
+
+    :param requires_python: optional; the release's Requires-Python specifier
+    :param yanked: optional; whether the release's file is yanked
+    :returns: the release's files
+    """
+    return [{"requires_python": requires_python, "yanked": yanked}]
+
+
+class TestIndexCache(unittest.TestCase):
+    """
+    Tests the index cache against a local file:// index laid out like the JSON API.
+    """
+    def setUp(self) -> None:
+        self.folder: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.index: str = os.path.join(self.folder.name, "index")
+        self.cache: IndexCache = self.new_cache()
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def add_package(self, name: str, releases: dict[str, list[dict[str, Any]]]) -> None:
+        """
+        Adds a package to the local index. The "info" table describes the newest release, as it
+        does on PyPI even when that release is yanked or needs a newer Python.
+
+        :param name: the normalised name of the package
+        :param releases: the files of each release, keyed by version
+        """
+        os.makedirs(os.path.join(self.index, name), exist_ok=True)
+        data: dict[str, Any] = {
+            "info": {"name": name, "version": list(releases)[-1]},
+            "releases": releases
+        }
+        with open(os.path.join(self.index, name, "json"), "w") as package_file:
+            json.dump(data, package_file)
+
+    def new_cache(self, ttl: int = 3600) -> IndexCache:
+        """
+        Creates an index cache for the local index, stored in the temporary folder.
+
+        :param ttl: optional; the number of seconds an entry is used without being revalidated
+        :returns: the index cache
+        """
+        return IndexCache(self.folder.name, Path(self.index).as_uri(), ttl, Mock())
+
+    def test_latest_release(self) -> None:
+        self.add_package("demo", {"1.0": release(), "1.10": release(), "1.9": release()})
+        self.assertEqual(self.cache.get_latest("Demo", "3.9.18"), "1.10")
+
+    def test_skips_prereleases(self) -> None:
+        self.add_package("demo", {"1.0": release(), "2.0rc1": release()})
+        self.assertEqual(self.cache.get_latest("demo", "3.9.18"), "1.0")
+
+    def test_skips_yanked_releases(self) -> None:
+        self.add_package("demo", {"1.0": release(), "1.1": release(yanked=True)})
+        self.assertEqual(self.cache.get_latest("demo", "3.9.18"), "1.0")
+
+    def test_honours_requires_python(self) -> None:
+        self.add_package("demo", {
+            "1.0": release(">=3.8"),
+            "2.0": release(">=3.10"),
+            "3.0": release(">=3.12")
+        })
+        self.assertEqual(self.cache.get_latest("demo", "3.9.18"), "1.0")
+        self.assertEqual(self.cache.get_latest("demo", "3.11.7"), "2.0")
+        self.assertEqual(self.cache.get_latest("demo", "3.12.0"), "3.0")
+        self.assertEqual(self.cache.get_latest("demo"), "3.0")
+
+    def test_invalid_requires_python(self) -> None:
+        self.add_package("demo", {"1.0": release(), "2.0": release("not a specifier")})
+        self.assertEqual(self.cache.get_latest("demo", "3.9.18"), "2.0")
+
+    def test_no_installable_release(self) -> None:
+        self.add_package("demo", {"1.0": release(">=3.12"), "2.0": release(yanked=True)})
+        self.assertIsNone(self.cache.get_latest("demo", "3.9.18"))
+
+    def test_missing_package(self) -> None:
+        os.makedirs(self.index)
+        self.assertIsNone(self.cache.get_latest("missing", "3.9.18"))
+
+    def test_info_only_response(self) -> None:
+        os.makedirs(os.path.join(self.index, "demo"))
+        with open(os.path.join(self.index, "demo", "json"), "w") as package_file:
+            json.dump({"info": {"version": "1.0", "requires_python": ">=3.12"}}, package_file)
+        self.assertIsNone(self.cache.get_latest("demo", "3.9.18"))
+        self.assertEqual(self.cache.get_latest("demo", "3.12.0"), "1.0")
+
+    def test_saved_entries_are_reused(self) -> None:
+        self.add_package("demo", {"1.0": release(), "2.0": release(">=3.12")})
+        self.assertEqual(self.cache.get_latest("demo", "3.9.18"), "1.0")
+        self.cache.save()
+
+        os.remove(os.path.join(self.index, "demo", "json"))
+        cache: IndexCache = self.new_cache()
+        self.assertEqual(cache.get_latest("demo", "3.9.18"), "1.0")
+        self.assertEqual(cache.get_latest("demo", "3.12.0"), "2.0")
+
+    def test_legacy_entries_are_refetched(self) -> None:
+        self.add_package("demo", {"1.0": release(), "2.0": release(yanked=True)})
+        with open(os.path.join(self.folder.name, "index_cache.json"), "w") as cache_file:
+            json.dump({
+                "index_url": Path(self.index).as_uri(),
+                "packages": {"demo": {"checked": 2 ** 40, "latest": "2.0"}}
+            }, cache_file)
+        self.assertEqual(self.new_cache().get_latest("demo", "3.9.18"), "1.0")
+
+
+if __name__ == "__main__":
+    unittest.main()
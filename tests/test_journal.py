@@ -0,0 +1,109 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import tempfile
+import unittest
+
+from argparse import Namespace
+from pipupdater.models import Journal, PackageUpdate, Status, Updater
+from typing import Optional
+from unittest.mock import Mock
+
+
+class TestJournal(unittest.TestCase):
+    """
+    Tests which packages the run journal lets --incremental and --resume skip.
+    """
+    def setUp(self) -> None:
+        self.folder: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def new_updater(self, lockfile: Optional[str] = None) -> Updater:
+        """
+        Creates an Updater that skips packages using a journal loaded from the test folder.
+
+        :param lockfile: optional; the lockfile the Updater brings the environment in line with
+        :returns: the Updater
+        """
+        return Updater(
+            Namespace(incremental=True, resume=True, lockfile=lockfile),
+            Mock(),
+            [],
+            journal=Journal(self.folder.name, Mock())
+        )
+
+    def run_once(self, *packages: PackageUpdate, finish: bool = True) -> None:
+        """
+        Records a run in the journal that updated a list of packages.
+
+        :param packages: the update records of the packages, with their outcomes filled in
+        :param finish: whether the run completed
+        """
+        journal: Journal = Journal(self.folder.name, Mock())
+        journal.start_run()
+        for package in packages:
+            journal.record(package)
+        if finish:
+            journal.finish_run()
+        else:
+            # as if the run had been killed, leaving no end record
+            journal._file.close()
+
+    def test_seen(self) -> None:
+        package: PackageUpdate = PackageUpdate.create("numpy", "1.0", "1.1")
+        self.run_once(package._replace(status=Status.SUCCESS))
+        journal: Journal = Journal(self.folder.name, Mock())
+        self.assertTrue(journal.is_seen(package))
+        self.assertTrue(journal.is_reached(package))
+        self.assertFalse(journal.is_seen(PackageUpdate.create("numpy", "1.1", "1.2")))
+
+    def test_failed_not_seen(self) -> None:
+        package: PackageUpdate = PackageUpdate.create("numpy", "1.0", "1.1")
+        self.run_once(package._replace(status=Status.SUCCESS))
+        self.run_once(package._replace(status=Status.FAILED))
+        journal: Journal = Journal(self.folder.name, Mock())
+        self.assertFalse(journal.is_seen(package))
+
+    def test_unfinished_not_seen(self) -> None:
+        package: PackageUpdate = PackageUpdate.create("numpy", "1.0", "1.1")
+        self.run_once(package._replace(status=Status.SUCCESS), finish=False)
+        journal: Journal = Journal(self.folder.name, Mock())
+        self.assertFalse(journal.is_seen(package))
+        self.assertTrue(journal.is_reached(package))
+
+    def test_skips_unchanged(self) -> None:
+        package: PackageUpdate = PackageUpdate.create("numpy", "1.0", "1.1")
+        self.run_once(package._replace(status=Status.SUCCESS))
+        updater: Updater = self.new_updater()
+        self.assertEqual(list(updater.skip_journaled([package])), [])
+        self.assertEqual(len(updater.skipped), 1)
+
+    def test_lockfile_drift_twice(self) -> None:
+        # the first run brought numpy back to its locked version; since then it has drifted again,
+        # with the same locked version as before
+        drift: PackageUpdate = PackageUpdate.create("numpy", "2.0", "1.26.4")
+        self.run_once(drift._replace(status=Status.SUCCESS))
+        updater: Updater = self.new_updater("requirements.txt")
+        self.assertEqual(list(updater.skip_journaled([drift])), [drift])
+        self.assertEqual(len(updater.skipped), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
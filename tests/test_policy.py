@@ -0,0 +1,93 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+from pipupdater.models import PackageUpdate, Policy, parse_unmatched
+from typing import Optional
+
+
+class TestPolicy(unittest.TestCase):
+    """
+    Tests which packages a Policy holds back, and how it limits the versions of the others.
+    """
+    def assertLimit(self, limit: Optional[str], expected: str) -> None:
+        """
+        Checks a version limit against the one expected, ignoring the order of its clauses.
+
+        :param limit: the limit the policy found
+        :param expected: the limit expected
+        """
+        self.assertIsNotNone(limit)
+        self.assertEqual(sorted(limit.split(",")), sorted(expected.split(",")))
+
+    def test_excluded(self) -> None:
+        policy: Policy = Policy(exclude=["django-*"])
+        self.assertEqual(
+            policy.check(PackageUpdate.create("Django_Extensions", "3.0", "3.1")),
+            "excluded by policy"
+        )
+        self.assertIsNone(policy.check(PackageUpdate.create("django", "4.0", "4.1")))
+
+    def test_not_included(self) -> None:
+        policy: Policy = Policy(include=["re:num.*"])
+        self.assertEqual(
+            policy.check(PackageUpdate.create("scipy", "1.0", "1.1")), "not included by policy"
+        )
+        self.assertIsNone(policy.check(PackageUpdate.create("numpy", "1.0", "1.1")))
+
+    def test_unlimited(self) -> None:
+        policy: Policy = Policy(pins={"numpy": "<3"})
+        self.assertIsNone(policy.limit(PackageUpdate.create("numpy", "1.25.0", "2.1.0")))
+        self.assertIsNone(policy.limit(PackageUpdate.create("scipy", "1.0", "2.0")))
+
+    def test_max_bump(self) -> None:
+        package: PackageUpdate = PackageUpdate.create("numpy", "1.4.2", "2.0")
+        self.assertLimit(Policy(max_bump="minor").limit(package), ">=1.4.2,<2")
+        self.assertLimit(Policy(max_bump="patch").limit(package), ">=1.4.2,<1.5")
+        self.assertIsNone(Policy(max_bump="major").limit(package))
+
+    def test_range_pin_between_versions(self) -> None:
+        # the pin allows neither the installed nor the latest version, but does allow versions
+        # between them, so the package is updated rather than held back
+        policy: Policy = Policy(pins={"numpy": ">=1.26,<2"})
+        package: PackageUpdate = PackageUpdate.create("numpy", "1.25.0", "2.1.0")
+        self.assertIsNone(policy.check(package))
+        self.assertLimit(policy.limit(package), ">=1.25.0,>=1.26,<2")
+
+    def test_exact_pin_between_versions(self) -> None:
+        policy: Policy = Policy(pins={"numpy": "==1.5"})
+        package: PackageUpdate = PackageUpdate.create("numpy", "1.4", "2.0")
+        self.assertIsNone(policy.check(package))
+        self.assertLimit(policy.limit(package), ">=1.4,==1.5")
+
+    def test_pin_and_max_bump(self) -> None:
+        policy: Policy = Policy(max_bump="minor", pins={"numpy": "<2"})
+        self.assertLimit(policy.limit(PackageUpdate.create("numpy", "1.4", "2.1")), ">=1.4,<2")
+
+    def test_unmatched(self) -> None:
+        output: str = (
+            "ERROR: Could not find a version that satisfies the requirement numpy<1.3,>=1.4\n"
+            "ERROR: No matching distribution found for numpy<1.3,>=1.4\n"
+        )
+        self.assertEqual(parse_unmatched(output), {"numpy"})
+        self.assertEqual(parse_unmatched("Successfully installed numpy-1.26.4\n"), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Copyright (C) 2024-2025  Molly M.B. Maclachlan
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from contextlib import nullcontext
+from pipupdater.models import PackageUpdate, Wheelhouse
+from typing import Optional
+from unittest import mock
+from unittest.mock import Mock
+
+
+# the command used to run the pip of the interpreter running the tests
+PIP: list[str] = [sys.executable, "-m", "pip"]
+
+
+def make_wheel(folder: str, name: str, version: str, requires: Optional[str] = None) -> str:
+    """
+    Writes a minimal pure-Python wheel into a folder.
+
+    :param folder: the folder to write the wheel into
+    :param name: the name of the package, which must be a valid module name
+    :param version: the version of the package
+    :param requires: optional; a requirement of the package
+    :returns: the wheel's filename
+    """
+    dist_info: str = f"{name}-{version}.dist-info"
+    metadata: str = f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+    if requires is not None:
+        metadata += f"Requires-Dist: {requires}\n"
+    filename: str = f"{name}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(os.path.join(folder, filename), "w") as wheel:
+        wheel.writestr(f"{name}/__init__.py", "")
+        wheel.writestr(f"{dist_info}/METADATA", metadata)
+        wheel.writestr(
+            f"{dist_info}/WHEEL",
+            "Wheel-Version: 1.0\nGenerator: tests\nRoot-Is-Purelib: true\nTag: py3-none-any\n"
+        )
+        wheel.writestr(
+            f"{dist_info}/RECORD",
+            f"{name}/__init__.py,,\n{dist_info}/METADATA,,\n{dist_info}/WHEEL,,\n"
+            + f"{dist_info}/RECORD,,\n"
+        )
+    return filename
+
+
+@unittest.skipIf(
+    subprocess.run([*PIP, "--version"], capture_output=True).returncode != 0, "pip is not available"
+)
+class TestWheelhouse(unittest.TestCase):
+    """
+    Tests building wheels into the wheelhouse and installing from it without a package index. The
+    only source of packages is a local folder of wheels, passed to pip through its environment.
+    """
+    def setUp(self) -> None:
+        self.folder: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.source: str = os.path.join(self.folder.name, "source")
+        os.makedirs(self.source)
+        self.app: str = make_wheel(self.source, "demo_app", "1.0", "demo_dep")
+        self.dep: str = make_wheel(self.source, "demo_dep", "2.0")
+
+        self.wheelhouse: Wheelhouse = Wheelhouse(
+            os.path.join(self.folder.name, "wheelhouse"), 1024 * 1024, Mock()
+        )
+        self.package: PackageUpdate = PackageUpdate.create("demo-app", "0.9", "1.0")
+
+        self.environment = mock.patch.dict(os.environ, {
+            "PIP_NO_INDEX": "1",
+            "PIP_FIND_LINKS": self.source,
+            "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+            "PIP_NO_CACHE_DIR": "1"
+        })
+        self.environment.start()
+
+    def tearDown(self) -> None:
+        self.environment.stop()
+        self.folder.cleanup()
+
+    def age(self, *filenames: str) -> None:
+        """
+        Marks wheels in the wheelhouse as last used a day ago.
+
+        :param filenames: the filenames of the wheels
+        """
+        for filename in filenames:
+            path: str = os.path.join(self.wheelhouse.path, filename)
+            os.utime(path, (os.path.getmtime(path) - 86400,) * 2)
+
+    def used(self, filename: str) -> float:
+        """
+        Gets how long ago a wheel in the wheelhouse was last used.
+
+        :param filename: the filename of the wheel
+        :returns: the number of seconds since the wheel was last used
+        """
+        return os.path.getmtime(os.path.join(self.wheelhouse.path, filename))
+
+    def test_builds_dependencies(self) -> None:
+        self.assertEqual(self.wheelhouse.build(PIP, self.package, nullcontext()).exit_code, 0)
+        self.assertEqual(
+            sorted(os.listdir(self.wheelhouse.path)), sorted([self.app, self.dep])
+        )
+
+    def test_installs_offline(self) -> None:
+        self.assertEqual(self.wheelhouse.build(PIP, self.package, nullcontext()).exit_code, 0)
+        target: str = os.path.join(self.folder.name, "target")
+        # the source folder is no longer reachable; only the wheelhouse is used
+        del os.environ["PIP_FIND_LINKS"]
+        process: subprocess.CompletedProcess = subprocess.run(
+            [*PIP, "install", "--target", target, *self.wheelhouse.install_options(),
+             self.package.requirement],
+            capture_output=True,
+            text=True
+        )
+        self.assertEqual(process.returncode, 0, process.stdout + process.stderr)
+        self.assertTrue(os.path.isdir(os.path.join(target, "demo_dep")))
+
+    def test_rebuild_touches_dependencies(self) -> None:
+        self.assertEqual(self.wheelhouse.build(PIP, self.package, nullcontext()).exit_code, 0)
+        self.age(self.app, self.dep)
+        before: float = self.used(self.dep)
+        self.assertEqual(self.wheelhouse.build(PIP, self.package, nullcontext()).exit_code, 0)
+        self.assertGreater(self.used(self.app), before + 3600)
+        self.assertGreater(self.used(self.dep), before + 3600)
+
+    def test_no_eviction_during_session(self) -> None:
+        self.wheelhouse.max_size = 0
+        with self.wheelhouse.session():
+            self.assertEqual(self.wheelhouse.build(PIP, self.package, nullcontext()).exit_code, 0)
+            with self.wheelhouse.session():
+                pass
+            self.wheelhouse.evict()
+            self.assertEqual(len(os.listdir(self.wheelhouse.path)), 2)
+        self.assertEqual(os.listdir(self.wheelhouse.path), [])
+
+    def test_evicts_least_recently_used(self) -> None:
+        self.assertEqual(self.wheelhouse.build(PIP, self.package, nullcontext()).exit_code, 0)
+        self.age(self.dep)
+        self.wheelhouse.max_size = os.path.getsize(os.path.join(self.wheelhouse.path, self.app))
+        self.wheelhouse.evict()
+        self.assertEqual(os.listdir(self.wheelhouse.path), [self.app])
+
+
+if __name__ == "__main__":
+    unittest.main()